@@ -1,20 +1,24 @@
 ## Load packages for all chapter
 import pandas as pd
 import numpy as np
-import nfl_data_py as nfl
-import seaborn as sns
-import matplotlib.pyplot as plt
-import os
-
-## import data
-chap_2_file = "./data/pbp_py_chap_2.csv"
-
-if os.path.isfile(chap_2_file):
-    pbp_py = pd.read_csv(chap_2_file, low_memory=False)
-else:
-    seasons = range(2016, 2022 + 1)
-    pbp_py = nfl.import_pbp_data(seasons)
-    pbp_py.to_csv(chap_2_file)
+from plots import sns, plt, render_plots
+from pbp_data import load_pbp
+from stability import lag_table
+from resampling import correlation_interval
+
+## import data, only keeping the columns used in this chapter
+pbp_py = load_pbp(
+    range(2016, 2022 + 1),
+    columns=[
+        "season",
+        "play_type",
+        "passer_id",
+        "passer",
+        "air_yards",
+        "passing_yards",
+        "epa",
+    ],
+)
 
 
 ## extract passing data
@@ -73,7 +77,7 @@ plt.show()
 
 ## player-level stability
 ## aggregate data
-pbp_py_p_s = pbp_py_p.groupby(["passer_id", "passer", "season"]).agg(
+pbp_py_p_s = pbp_py_p.groupby(["passer_id", "passer", "season"], observed=True).agg(
     {"passing_yards": ["mean", "count"]}
 )
 
@@ -97,7 +101,7 @@ pbp_py_p_s_100.head()
 
 ## calculate at play-by-play passer data by season and pass length
 pbp_py_p_s_pl = pbp_py_p.groupby(
-    ["passer_id", "passer", "season", "pass_length_air_yards"]
+    ["passer_id", "passer", "season", "pass_length_air_yards"], observed=True
 ).agg({"passing_yards": ["mean", "count"]})
 
 ## format and rename columns
@@ -122,16 +126,9 @@ pbp_py_p_s_pl = pbp_py_p_s_pl.query(q_value).reset_index()
 cols_save = ["passer_id", "passer", "season", "pass_length_air_yards", "ypa"]
 air_yards_py = pbp_py_p_s_pl[cols_save].copy()
 
-## create lag data
-air_yards_lag_py = air_yards_py.copy()
-air_yards_lag_py["season"] += 1
-air_yards_lag_py.rename(columns={"ypa": "ypa_last"}, inplace=True)
-
-## merge lag data back in
-pbp_py_p_s_pl = air_yards_py.merge(
-    air_yards_lag_py,
-    how="inner",
-    on=["passer_id", "passer", "season", "pass_length_air_yards"],
+## pair each season with the passer's previous season (ypa_last)
+pbp_py_p_s_pl = lag_table(
+    air_yards_py, ["passer_id", "passer", "pass_length_air_yards"], ["ypa"]
 )
 
 ## Look at merged data for two passers
@@ -157,6 +154,15 @@ pbp_py_p_s_pl.query("ypa.notnull() & ypa_last.notnull()").groupby(
     "pass_length_air_yards"
 )[["ypa", "ypa_last"]].corr()
 
+## bootstrap interval and permutation p-value for the correlations
+pbp_py_p_s_pl.groupby("pass_length_air_yards", observed=True)[
+    ["ypa", "ypa_last"]
+].apply(
+    lambda pass_length: correlation_interval(
+        pass_length["ypa"], pass_length["ypa_last"]
+    )
+)
+
 ## 2017 YPA leaderboard
 pbp_py_p_s_pl.query('pass_length_air_yards == "long" & season == 2017')[
     ["passer_id", "passer", "ypa"]
@@ -166,3 +172,6 @@ pbp_py_p_s_pl.query('pass_length_air_yards == "long" & season == 2017')[
 pbp_py_p_s_pl.query('pass_length_air_yards == "long" & season == 2018')[
     ["passer_id", "passer", "ypa"]
 ].sort_values(["ypa"], ascending=False).head(10)
+
+## draw any figures recorded in headless mode (FOOTBALL_PLOTS=defer)
+render_plots()
@@ -1,32 +1,34 @@
 ## load packages
 import pandas as pd
 import numpy as np
-import nfl_data_py as nfl
-import statsmodels.formula.api as smf
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-
-chap_3_file = "./data/pbp_py_chap_3.csv"
-## load data
-if os.path.isfile(chap_3_file):
-    pbp_py = pd.read_csv(chap_3_file, low_memory=False)
-else:
-    seasons = range(2016, 2022 + 1)
-    pbp_py = nfl.import_pbp_data(seasons)
-    pbp_py.to_csv(chap_3_file)
-
-## filter run data and replace missing values
-pbp_py_run = pbp_py.query('play_type == "run" & rusher_id.notnull()').reset_index()
+from plots import sns, plt, render_plots, play_scatterplot
+from pbp_data import load_pbp
+from stability import lag_table
+from resampling import correlation_interval
+from fit_cache import FitCache
+
+## load only the run data and columns needed, then replace missing values
+pbp_py_run = load_pbp(
+    range(2016, 2022 + 1),
+    columns=["season", "play_type", "rusher_id", "rusher", "rushing_yards", "ydstogo"],
+    filters=[("play_type", "==", "run"), ("rusher_id", "notnull")],
+)
 pbp_py_run.loc[pbp_py_run.rushing_yards.isnull(), "rushing_yards"] = 0
 
 ## plot raw data prior to building model
 sns.set_theme(style="whitegrid", palette="colorblind")
-sns.scatterplot(data=pbp_py_run, x="ydstogo", y="rushing_yards")
+play_scatterplot(data=pbp_py_run, x="ydstogo", y="rushing_yards")
 plt.show()
 
-## add linear trend line
-sns.regplot(data=pbp_py_run, x="ydstogo", y="rushing_yards")
+## fitted models are saved in ./data/fits/ and reused while the data
+## and formula are unchanged
+fit_cache = FitCache()
+
+## build and fit linear regression
+yard_to_go_py = fit_cache.fit("rushing_yards ~ 1 + ydstogo", pbp_py_run)
+
+## add linear trend line (the model's line)
+play_scatterplot(data=pbp_py_run, x="ydstogo", y="rushing_yards", fit=yard_to_go_py)
 plt.show()
 
 ## bin and plot data
@@ -36,15 +38,15 @@ pbp_py_run_ave.reset_index(inplace=True)
 sns.regplot(data=pbp_py_run_ave, x="ydstogo", y="rushing_yards_mean")
 plt.show()
 
-## build and fit linear regression
-yard_to_go_py = smf.ols(formula="rushing_yards ~ 1 + ydstogo", data=pbp_py_run)
-print(yard_to_go_py.fit().summary())
+## look at the linear regression
+print(yard_to_go_py.summary().round(3))
+print(yard_to_go_py.fit_stats().round(3))
 
 ## save residuals as RYOE
-pbp_py_run["ryoe"] = yard_to_go_py.fit().resid
+pbp_py_run["ryoe"] = yard_to_go_py.resid
 
 ## query, format, and print RYOE results
-ryoe_py = pbp_py_run.groupby(["season", "rusher_id", "rusher"]).agg(
+ryoe_py = pbp_py_run.groupby(["season", "rusher_id", "rusher"], observed=True).agg(
     {"ryoe": ["count", "sum", "mean"], "rushing_yards": "mean"}
 )
 
@@ -66,24 +68,9 @@ print(ryoe_py.sort_values("ryoe_total", ascending=False))
 #  keep only columns needed
 cols_keep = ["season", "rusher_id", "rusher", "ryoe_per", "yards_per_carry"]
 
-# create current dataframe
-ryoe_now_py = ryoe_py[cols_keep].copy()
-
-# create last-year's dataframe
-ryoe_last_py = ryoe_py[cols_keep].copy()
-
-# rename columns
-ryoe_last_py.rename(
-    columns={"ryoe_per": "ryoe_per_last", "yards_per_carry": "yards_per_carry_last"},
-    inplace=True,
-)
-
-# add 1 to season
-ryoe_last_py["season"] += 1
-
-# merge together
-ryoe_lag_py = ryoe_now_py.merge(
-    ryoe_last_py, how="inner", on=["rusher_id", "rusher", "season"]
+# pair each season with the rusher's previous season (*_last columns)
+ryoe_lag_py = lag_table(
+    ryoe_py[cols_keep], ["rusher_id", "rusher"], ["ryoe_per", "yards_per_carry"]
 )
 
 ## Look at correlation
@@ -91,3 +78,14 @@ ryoe_lag_py[["yards_per_carry_last", "yards_per_carry"]].corr()
 
 ## repeat with RYOE
 ryoe_lag_py[["ryoe_per_last", "ryoe_per"]].corr()
+
+## bootstrap intervals and permutation p-values for both correlations
+print(
+    correlation_interval(
+        ryoe_lag_py["yards_per_carry"], ryoe_lag_py["yards_per_carry_last"]
+    )
+)
+print(correlation_interval(ryoe_lag_py["ryoe_per"], ryoe_lag_py["ryoe_per_last"]))
+
+## draw any figures recorded in headless mode (FOOTBALL_PLOTS=defer)
+render_plots()
@@ -1,26 +1,37 @@
 ## load packages
 import pandas as pd
 import numpy as np
-import nfl_data_py as nfl
-import statsmodels.formula.api as smf
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-
-## load data
-chap_4_file = "./data/pbp_py_chap_4.csv"
-if os.path.isfile(chap_4_file):
-    pbp_py = pd.read_csv(chap_4_file, low_memory=False)
-else:
-    seasons = range(2016, 2022 + 1)
-    pbp_py = nfl.import_pbp_data(seasons)
-    pbp_py.to_csv(chap_4_file)
-
-
-pbp_py_run = pbp_py.query(
-    'play_type == "run" & rusher_id.notnull() &'
-    + "down.notnull() & run_location.notnull()"
-).reset_index()
+from plots import sns, plt, render_plots, play_scatterplot
+from pbp_data import load_pbp
+from stability import lag_table
+from resampling import correlation_interval
+from fitting import SufficientFit, fit_groups
+from fit_cache import FitCache
+from player_effects import fit_effects
+from scoring import save_model
+
+## load only the run data and columns needed
+pbp_py_run = load_pbp(
+    range(2016, 2022 + 1),
+    columns=[
+        "season",
+        "play_type",
+        "rusher_id",
+        "rusher",
+        "rushing_yards",
+        "down",
+        "ydstogo",
+        "yardline_100",
+        "run_location",
+        "score_differential",
+    ],
+    filters=[
+        ("play_type", "==", "run"),
+        ("rusher_id", "notnull"),
+        ("down", "notnull"),
+        ("run_location", "notnull"),
+    ],
+)
 
 pbp_py_run.loc[pbp_py_run.rushing_yards.isnull(), "rushing_yards"] = 0
 
@@ -46,10 +57,13 @@ sns.boxplot(data=pbp_py_run.query("ydstogo == 10"), x="down", y="rushing_yards")
 plt.show()
 
 ## scatterplot for trendline
-sns.regplot(
+# the line is the least-squares fit of rushing_yards on yardline_100 alone
+# (as sns.regplot() draws it), not the multiple regression fit below
+play_scatterplot(
     data=pbp_py_run,
     x="yardline_100",
     y="rushing_yards",
+    fit=True,
     scatter_kws={"alpha": 0.25},
     line_kws={"color": "red"},
 )
@@ -90,21 +104,43 @@ sns.regplot(
 )
 plt.show()
 
+## fitted models are saved in ./data/fits/ and reused while the data
+## and formula are unchanged
+fit_cache = FitCache()
+
 ## Multiple regression Python
 pbp_py_run.down = pbp_py_run.down.astype(str)
-expected_yards_py = smf.ols(
-    data=pbp_py_run,
-    formula="rushing_yards ~ 1 + down + ydstogo + "
+expected_yards_py = fit_cache.fit(
+    "rushing_yards ~ 1 + down + ydstogo + "
     + "down:ydstogo + yardline_100 + "
     + "run_location + score_differential",
-).fit()
+    pbp_py_run,
+)
 pbp_py_run["ryoe"] = expected_yards_py.resid
 
+## save the model so single plays can be scored without rerunning this file
+save_model(expected_yards_py, "expected_yards")
+
+## the same model from per-season summaries; adding a new season (or week)
+## only summarizes its own plays instead of refitting every play
+expected_yards_stats = SufficientFit(expected_yards_py.formula, by=["season"])
+for season in range(2016, 2022 + 1):
+    expected_yards_stats.update(pbp_py_run.query("season == @season"))
+print((expected_yards_stats.params - expected_yards_py.params).abs().max())
+
+## the model fit separately for each season, with each play's expected
+## yards from its own season's model
+season_coefs_py, pbp_py_run["exp_yards_season"] = fit_groups(
+    expected_yards_py.formula, pbp_py_run, by=["season"]
+)
+print(season_coefs_py.pivot(index="term", columns="season", values="estimate"))
+
 ## Look at model outputs
-print(expected_yards_py.summary())
+print(expected_yards_py.summary().round(3))
+print(expected_yards_py.fit_stats().round(3))
 
 ## Analyze RYOE
-ryoe_py = pbp_py_run.groupby(["season", "rusher_id", "rusher"]).agg(
+ryoe_py = pbp_py_run.groupby(["season", "rusher_id", "rusher"], observed=True).agg(
     {"ryoe": ["count", "sum", "mean"], "rushing_yards": ["mean"]}
 )
 ryoe_py.columns = list(map("_".join, ryoe_py.columns))
@@ -122,28 +158,27 @@ print(ryoe_py.sort_values("ryoe_total", ascending=False))
 ## sort by RYOE per carry
 print(ryoe_py.sort_values("ryoe_per", ascending=False))
 
+## one-step RYOE: each rusher's season gets its own effect in the expected
+## yards model, shrunk toward zero for rushers with few carries
+ryoe_effects_py = fit_effects(
+    expected_yards_py.formula,
+    pbp_py_run,
+    effects=[["season", "rusher_id"]],
+    ridge=25.0,
+)
+ryoe_py = ryoe_py.merge(
+    ryoe_effects_py.effects["season:rusher_id"][["season", "rusher_id", "estimate"]],
+    on=["season", "rusher_id"],
+).rename(columns={"estimate": "ryoe_effect"})
+print(ryoe_py[["ryoe_per", "ryoe_effect"]].corr())
+
 ## RYOE stability
 #  keep only the columns needed
 cols_keep = ["season", "rusher_id", "rusher", "ryoe_per", "yards_per_carry"]
 
-# create current dataframe
-ryoe_now_py = ryoe_py[cols_keep].copy()
-
-# create last-year's dataframe
-ryoe_last_py = ryoe_py[cols_keep].copy()
-
-# rename columns
-ryoe_last_py.rename(
-    columns={"ryoe_per": "ryoe_per_last", "yards_per_carry": "yards_per_carry_last"},
-    inplace=True,
-)
-
-# add 1 to season
-ryoe_last_py["season"] += 1
-
-# merge together
-ryoe_lag_py = ryoe_now_py.merge(
-    ryoe_last_py, how="inner", on=["rusher_id", "rusher", "season"]
+# pair each season with the rusher's previous season (*_last columns)
+ryoe_lag_py = lag_table(
+    ryoe_py[cols_keep], ["rusher_id", "rusher"], ["ryoe_per", "yards_per_carry"]
 )
 
 ## Stability for yards per carry
@@ -151,3 +186,14 @@ ryoe_lag_py[["yards_per_carry_last", "yards_per_carry"]].corr()
 
 ## Stability for RYOE
 ryoe_lag_py[["ryoe_per_last", "ryoe_per"]].corr()
+
+## bootstrap intervals and permutation p-values for both correlations
+print(
+    correlation_interval(
+        ryoe_lag_py["yards_per_carry"], ryoe_lag_py["yards_per_carry_last"]
+    )
+)
+print(correlation_interval(ryoe_lag_py["ryoe_per"], ryoe_lag_py["ryoe_per_last"]))
+
+## draw any figures recorded in headless mode (FOOTBALL_PLOTS=defer)
+render_plots()
@@ -1,25 +1,37 @@
 ## load packages
 import pandas as pd
 import numpy as np
-import nfl_data_py as nfl
-import statsmodels.formula.api as smf
-import statsmodels.api as sm
-import matplotlib.pyplot as plt
-import seaborn as sns
-import os
-
-## load data and filter data
-chap_5_file = "./data/pbp_py_chap_5.csv"
-if os.path.isfile(chap_5_file):
-    pbp_py = pd.read_csv(chap_5_file, low_memory=False)
-else:
-    seasons = range(2016, 2022 + 1)
-    pbp_py = nfl.import_pbp_data(seasons)
-    pbp_py.to_csv(chap_5_file)
-
-pbp_py_pass = pbp_py.query(
-    'play_type == "pass" & passer_id.notnull() &' + "air_yards.notnull()"
-).reset_index()
+from plots import sns, plt, render_plots, play_scatterplot
+from pbp_data import load_pbp
+from stability import lag_table
+from resampling import correlation_interval
+from fitting import SufficientFit, fit_groups
+from fit_cache import FitCache
+from player_effects import fit_effects
+from scoring import save_model
+
+## load data and filter data, only reading the columns needed
+pbp_py_pass = load_pbp(
+    range(2016, 2022 + 1),
+    columns=[
+        "season",
+        "play_type",
+        "passer_id",
+        "passer",
+        "complete_pass",
+        "air_yards",
+        "down",
+        "ydstogo",
+        "yardline_100",
+        "pass_location",
+        "qb_hit",
+    ],
+    filters=[
+        ("play_type", "==", "pass"),
+        ("passer_id", "notnull"),
+        ("air_yards", "notnull"),
+    ],
+)
 
 # Change theme for chapter
 sns.set_theme(style="whitegrid", palette="colorblind")
@@ -39,18 +51,31 @@ pass_pct_py.rename(columns={"complete_pass_mean": "comp_pct"}, inplace=True)
 sns.regplot(data=pass_pct_py, x="air_yards", y="comp_pct", line_kws={"color": "red"})
 plt.show()
 
+## fitted models are saved in ./data/fits/ and reused while the data
+## and formula are unchanged
+fit_cache = FitCache()
+
 ## building a glm
-complete_ay_py = smf.glm(
-    formula="complete_pass ~ air_yards", data=pbp_py_pass, family=sm.families.Binomial()
-).fit()
+complete_ay_py = fit_cache.fit("complete_pass ~ air_yards", pbp_py_pass, "binomial")
 
 complete_ay_py.summary()
+complete_ay_py.fit_stats()
+
+## the same model from per-season summaries of IRLS steps, updated a season
+## at a time (close to the full fit; see fitting.SufficientFit)
+complete_ay_stats = SufficientFit(complete_ay_py.formula, "binomial", by=["season"])
+for season in range(2016, 2022 + 1):
+    complete_ay_stats.update(pbp_py_pass.query("season == @season"))
+print((complete_ay_stats.params - complete_ay_py.params).abs().max())
 
 ## logistic plot
-sns.regplot(
+# binned plots (FOOTBALL_BINNED_PLOTS=1) use the fitted model for the line
+play_scatterplot(
     data=pbp_py_pass,
     x="air_yards",
     y="complete_pass",
+    fit=complete_ay_py,
+    bins=(100, 2),
     logistic=True,
     line_kws={"color": "red"},
     scatter_kws={"alpha": 0.05},
@@ -62,7 +87,7 @@ pbp_py_pass["exp_completion"] = complete_ay_py.predict()
 pbp_py_pass["cpoe"] = pbp_py_pass["complete_pass"] - pbp_py_pass["exp_completion"]
 
 ## cpoe
-cpoe_py = pbp_py_pass.groupby(["season", "passer_id", "passer"]).agg(
+cpoe_py = pbp_py_pass.groupby(["season", "passer_id", "passer"], observed=True).agg(
     {"cpoe": ["count", "mean"], "complete_pass": ["mean"]}
 )
 cpoe_py.columns = list(map("_".join, cpoe_py.columns))
@@ -91,22 +116,34 @@ pbp_py_pass_no_miss = pbp_py_pass[
 ].dropna(axis=0)
 
 ## build and fit model
-complete_more_py = smf.glm(
-    formula="complete_pass ~ down * ydstogo + "
+complete_more_py = fit_cache.fit(
+    "complete_pass ~ down * ydstogo + "
     + "yardline_100 + air_yards + "
     + "pass_location + qb_hit",
-    data=pbp_py_pass_no_miss,
-    family=sm.families.Binomial(),
-).fit()
+    pbp_py_pass_no_miss,
+    "binomial",
+)
 
 ## extract output and calculate CPOE
 pbp_py_pass_no_miss["exp_completion"] = complete_more_py.predict()
+
+## save the model so single plays can be scored without rerunning this file
+save_model(complete_more_py, "complete_more")
 pbp_py_pass_no_miss["cpoe"] = (
     pbp_py_pass_no_miss["complete_pass"] - pbp_py_pass_no_miss["exp_completion"]
 )
 
+## the model fit separately for each down (the down terms drop out, shown
+## as NaN), with each pass's expected completion from its down's model
+down_coefs_py, pbp_py_pass_no_miss["exp_completion_down"] = fit_groups(
+    complete_more_py.formula, pbp_py_pass_no_miss, by=["down"], family="binomial"
+)
+print(down_coefs_py.pivot(index="term", columns="down", values="estimate"))
+
 ## summarize outputs, reformat, and rename
-cpoe_py_more = pbp_py_pass_no_miss.groupby(["season", "passer_id", "passer"]).agg(
+cpoe_py_more = pbp_py_pass_no_miss.groupby(
+    ["season", "passer_id", "passer"], observed=True
+).agg(
     {"cpoe": ["count", "mean"], "complete_pass": ["mean"], "exp_completion": ["mean"]}
 )
 
@@ -125,31 +162,30 @@ cpoe_py_more = cpoe_py_more.rename(
 ## print outputs
 print(cpoe_py_more.sort_values("cpoe", ascending=False))
 
+## one-step CPOE: each passer's season gets its own effect (on the log-odds
+## scale) in the completion model, shrunk toward zero for few passes
+cpoe_effects_py = fit_effects(
+    complete_more_py.formula,
+    pbp_py_pass_no_miss,
+    effects=[["season", "passer_id"]],
+    family="binomial",
+    ridge=25.0,
+)
+cpoe_py_more = cpoe_py_more.merge(
+    cpoe_effects_py.effects["season:passer_id"][["season", "passer_id", "estimate"]],
+    on=["season", "passer_id"],
+).rename(columns={"estimate": "cpoe_effect"})
+print(cpoe_py_more[["cpoe", "cpoe_effect"]].corr())
+
 ## stability
 #  keep only the columns needed
 cols_keep = ["season", "passer_id", "passer", "cpoe", "compl", "exp_completion"]
 
-# create current dataframe
-cpoe_now_py = cpoe_py_more[cols_keep].copy()
-
-# create last-year's dataframe
-cpoe_last_py = cpoe_now_py[cols_keep].copy()
-
-# rename columns
-cpoe_last_py.rename(
-    columns={
-        "cpoe": "cpoe_last",
-        "compl": "compl_last",
-        "exp_completion": "exp_completion_last",
-    },
-    inplace=True,
-)
-# add 1 to season
-cpoe_last_py["season"] += 1
-
-# merge together
-cpoe_lag_py = cpoe_now_py.merge(
-    cpoe_last_py, how="inner", on=["passer_id", "passer", "season"]
+# pair each season with the passer's previous season (*_last columns)
+cpoe_lag_py = lag_table(
+    cpoe_py_more[cols_keep],
+    ["passer_id", "passer"],
+    ["cpoe", "compl", "exp_completion"],
 )
 
 ## look at pass completion stability
@@ -157,3 +193,10 @@ cpoe_lag_py[["compl_last", "compl"]].corr()
 
 ## look at cpoe stability
 cpoe_lag_py[["cpoe_last", "cpoe"]].corr()
+
+## bootstrap intervals and permutation p-values for both correlations
+print(correlation_interval(cpoe_lag_py["compl"], cpoe_lag_py["compl_last"]))
+print(correlation_interval(cpoe_lag_py["cpoe"], cpoe_lag_py["cpoe_last"]))
+
+## draw any figures recorded in headless mode (FOOTBALL_PLOTS=defer)
+render_plots()
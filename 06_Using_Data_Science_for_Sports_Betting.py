@@ -1,32 +1,46 @@
 ## load packages
 import pandas as pd
 import numpy as np
-import nfl_data_py as nfl
 import statsmodels.formula.api as smf
 import statsmodels.api as sm
-import matplotlib.pyplot as plt
-import seaborn as sns
+from plots import sns, plt, render_plots
 from scipy.stats import poisson
-import os
+from pbp_data import load_pbp
+from pbp_tables import load_games
+from rates import prior_rates
+from features import FeatureStore
+from pricing import count_probabilities, price_props
+from simulate import simulate_totals, summarize_totals
+from backtest import walk_forward, evaluate_bets
+from scoring import save_model
 
 ## load data
-chap_6_file = "./data/pbp_py_chap_6.csv"
-if os.path.isfile(chap_6_file):
-    pbp_py = pd.read_csv(chap_6_file, low_memory=False)
-else:
-    seasons = range(2016, 2022 + 1)
-    pbp_py = nfl.import_pbp_data(seasons)
-    pbp_py.to_csv(chap_6_file)
+pbp_py = load_pbp(
+    range(2016, 2022 + 1),
+    columns=[
+        "game_id",
+        "season",
+        "week",
+        "posteam",
+        "passer_id",
+        "passer",
+        "pass_touchdown",
+        "touchdown",
+    ],
+)
+
+## load game-level data (one row per game)
+games_py = load_games(range(2016, 2022 + 1), columns=["game_id", "total_line"])
 
 pbp_py_pass = pbp_py.query("passer_id.notnull()").reset_index()
 
 ## format data
 pbp_py_pass.loc[pbp_py_pass.pass_touchdown.isnull(), "pass_touchdown"] = 0
+pbp_py_pass["passer"] = pbp_py_pass["passer"].cat.add_categories("none")
 pbp_py_pass.loc[pbp_py_pass.passer.isnull(), "passer"] = "none"
-pbp_py_pass.loc[pbp_py_pass.passer_id.isnull(), "passer_id"] = "none"
-pbp_py_pass_td_y = pbp_py_pass.groupby(["season", "week", "passer_id", "passer"]).agg(
-    {"pass_touchdown": ["sum"], "total_line": ["count", "mean"]}
-)
+pbp_py_pass_td_y = pbp_py_pass.groupby(
+    ["season", "week", "game_id", "passer_id", "passer"], observed=True
+).agg({"pass_touchdown": ["sum", "count"]})
 
 pbp_py_pass_td_y.columns = list(map("_".join, pbp_py_pass_td_y.columns))
 pbp_py_pass_td_y.reset_index(inplace=True)
@@ -34,12 +48,17 @@ pbp_py_pass_td_y.reset_index(inplace=True)
 pbp_py_pass_td_y.rename(
     columns={
         "pass_touchdown_sum": "pass_td_y",
-        "total_line_mean": "total_line",
-        "total_line_count": "n_passes",
+        "pass_touchdown_count": "n_passes",
     },
     inplace=True,
 )
 
+## add the game total from the game-level data
+pbp_py_pass_td_y["game_id"] = pbp_py_pass_td_y["game_id"].astype(str)
+pbp_py_pass_td_y = pbp_py_pass_td_y.merge(games_py, on="game_id", how="left").drop(
+    columns="game_id"
+)
+
 pbp_py_pass_td_y = pbp_py_pass_td_y.query("n_passes >= 10")
 
 ## print summary output to screen
@@ -68,40 +87,21 @@ pbp_py_pass_td_y_geq10 = pbp_py_pass_td_y.query("n_passes >= 10")
 
 # take the average touchdown passes for each QB for the previous season
 # and current season up to the current game
-x_py = pd.DataFrame()
-for season_idx in range(2017, 2022 + 1):
-    for week_idx in range(1, 22 + 1):
-        week_calc_py = (
-            pbp_py_pass_td_y_geq10.query(
-                "(season == "
-                + str(season_idx - 1)
-                + ") |"
-                + "(season == "
-                + str(season_idx)
-                + "&"
-                + "week < "
-                + str(week_idx)
-                + ")"
-            )
-            .groupby(["passer_id", "passer"])
-            .agg({"pass_td_y": ["count", "mean"]})
-        )
-        week_calc_py.columns = list(map("_".join, week_calc_py.columns))
-        week_calc_py.reset_index(inplace=True)
-        week_calc_py.rename(
-            columns={"pass_td_y_count": "n_games", "pass_td_y_mean": "pass_td_rate"},
-            inplace=True,
-        )
-        week_calc_py["season"] = season_idx
-        week_calc_py["week"] = week_idx
-        x_py = pd.concat([x_py, week_calc_py])
+# (one cumulative pass over the games; see rates.py)
+x_py = prior_rates(
+    pbp_py_pass_td_y_geq10, ["passer_id", "passer"], "pass_td_y", range(2017, 2022 + 1)
+).rename(columns={"rate": "pass_td_rate"})
 
 ## look at example output
 x_py.query('passer == "P.Mahomes"').tail()
 
-## include game total
-pbp_py_pass_td_y_geq10 = pbp_py_pass_td_y_geq10.query("season != 2016").merge(
-    x_py, on=["season", "week", "passer_id", "passer"], how="inner"
+## save the rates as point-in-time features and add the rate known before
+## each game (x_py has a row for every week, so this is the game week's row;
+## max_seasons=0 keeps rates from the game's own season only)
+feature_store = FeatureStore()
+feature_store.add("pass_td_rate", x_py, ["passer_id", "passer"])
+pbp_py_pass_td_y_geq10 = feature_store.lookup(
+    "pass_td_rate", pbp_py_pass_td_y_geq10.query("season != 2016"), max_seasons=0
 )
 
 ## Poisson regression
@@ -113,6 +113,9 @@ pass_fit_py = smf.glm(
 
 pbp_py_pass_td_y_geq10["exp_pass_td"] = pass_fit_py.predict()
 
+## save the model so single games can be scored without rerunning this file
+save_model(pass_fit_py, "pass_td")
+
 print(pass_fit_py.summary())
 
 ## look at coefficients
@@ -135,18 +138,12 @@ cols_look = [
 pbp_py_pass_td_y_geq10.query(filter_by)[cols_look]
 
 ## PMF and CDF
-pbp_py_pass_td_y_geq10["p_0_td"] = poisson.pmf(
-    k=0, mu=pbp_py_pass_td_y_geq10["exp_pass_td"]
-)
-pbp_py_pass_td_y_geq10["p_1_td"] = poisson.pmf(
-    k=1, mu=pbp_py_pass_td_y_geq10["exp_pass_td"]
-)
-pbp_py_pass_td_y_geq10["p_2_td"] = poisson.pmf(
-    k=2, mu=pbp_py_pass_td_y_geq10["exp_pass_td"]
-)
-pbp_py_pass_td_y_geq10["p_g2_td"] = 1 - poisson.cdf(
-    k=2, mu=pbp_py_pass_td_y_geq10["exp_pass_td"]
-)
+# probabilities of 0 to 6 or more touchdowns for every passer and game
+td_probs_py = count_probabilities(pbp_py_pass_td_y_geq10["exp_pass_td"])
+pbp_py_pass_td_y_geq10["p_0_td"] = td_probs_py["p_0"]
+pbp_py_pass_td_y_geq10["p_1_td"] = td_probs_py["p_1"]
+pbp_py_pass_td_y_geq10["p_2_td"] = td_probs_py["p_2"]
+pbp_py_pass_td_y_geq10["p_g2_td"] = 1 - td_probs_py[["p_0", "p_1", "p_2"]].sum(axis=1)
 
 # specify filter criteria on own line for space
 filter_by = 'passer == "P.Mahomes" & season == 2022 & week == 22'
@@ -166,6 +163,33 @@ cols_look = [
 
 pbp_py_pass_td_y_geq10.query(filter_by)[cols_look]
 
+## fair prices (decimal and American odds) for the over and under of each line
+price_props(
+    pbp_py_pass_td_y_geq10.query(filter_by)["exp_pass_td"], lines=[0.5, 1.5, 2.5, 3.5]
+)
+
+## simulate each passer's 2022 season from the expected touchdowns per game
+pass_td_2022_py = pbp_py_pass_td_y_geq10.query("season == 2022")
+season_sims_py, _ = simulate_totals(
+    pass_td_2022_py["exp_pass_td"], pass_td_2022_py["passer"], n_sims=100_000
+)
+
+# chance of 30 or more touchdown passes
+summarize_totals(season_sims_py, lines=[29.5]).sort_values("mean", ascending=False)
+
+## walk-forward backtest: refit the model before each week of 2018-2022
+## and bet the over or under 1.5 touchdown passes at -110
+backtest_py = walk_forward(
+    pbp_py_pass_td_y_geq10,
+    {
+        "rate_and_total": "pass_td_y ~ pass_td_rate + total_line",
+        "rate_only": "pass_td_y ~ pass_td_rate",
+        "total_only": "pass_td_y ~ total_line",
+    },
+    seasons=range(2018, 2022 + 1),
+)
+evaluate_bets(backtest_py)
+
 ## Regression coefficients
 x = poisson.rvs(mu=1, size=10)
 print(x)
@@ -183,7 +207,7 @@ print(np.exp(glm_out_py.params))
 # subset the data
 bal_td_py = (
     pbp_py.query('posteam=="BAL" & season == 2022')
-    .groupby(["game_id", "week"])
+    .groupby(["game_id", "week"], observed=True)
     .agg({"touchdown": ["sum"]})
 )
 
@@ -213,3 +237,6 @@ glm_bal_td_py = smf.glm(
 print(glm_bal_td_py.params)
 
 print(np.exp(glm_bal_td_py.params))
+
+## draw any figures recorded in headless mode (FOOTBALL_PLOTS=defer)
+render_plots()
@@ -2,12 +2,12 @@
 
 ## Load packages
 import pandas as pd
-import seaborn as sns
+from plots import sns, plt, render_plots
 import os.path
-import matplotlib.pyplot as plt
 import statsmodels.formula.api as smf
 import numpy as np
 import os
+from resampling import batch_mean, group_bootstrap
 
 ## download data
 ## be careful to hit webpage too many time and get locked out~
@@ -148,3 +148,17 @@ draft_py_use_pre2019_tm["upper_bound"] = (
 )
 
 print(draft_py_use_pre2019_tm)
+
+## bootstrap intervals, which do not assume OE_mean is normally distributed
+draft_py_use_pre2019_tm = draft_py_use_pre2019_tm.merge(
+    group_bootstrap(batch_mean, draft_py_use_pre2019, "Tm", "OE").rename(
+        columns={"lower": "boot_lower_bound", "upper": "boot_upper_bound"}
+    ),
+    left_on="Tm_",
+    right_on="Tm",
+).drop(columns="Tm")
+
+print(draft_py_use_pre2019_tm)
+
+## draw any figures recorded in headless mode (FOOTBALL_PLOTS=defer)
+render_plots()
@@ -1,7 +1,6 @@
 ## load packages
 import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
+from plots import sns, plt, render_plots
 import matplotlib
 import numpy as np
 import os
@@ -161,3 +160,6 @@ sns.catplot(
 plt.savefig("fig_8_18.png", dpi=600)
 
 combine_knn_py_cluster.groupby("cluster").agg({"Ht": ["mean"], "Wt": ["mean"]})
+
+## draw any figures recorded in headless mode (FOOTBALL_PLOTS=defer)
+render_plots()
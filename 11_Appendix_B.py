@@ -1,13 +1,10 @@
 ## load packages
 import pandas as pd
 import numpy as np
-import nfl_data_py as nfl
+from pbp_data import load_game
 
-# Load all data
-pbp_py = nfl.import_pbp_data([2020])
-
-# filter out game data
-gb_det_2020_py = pbp_py.query("home_team == 'GB' & away_team == 'DET'")
+# Load only the game data (the rest of the season is not read)
+gb_det_2020_py = load_game(season=2020, home_team="GB", away_team="DET")
 
 gb_det_2020_pass_py = gb_det_2020_py[
     ["posteam", "yards_after_catch", "air_yards", "pass_location", "qb_scramble"]
@@ -24,14 +21,14 @@ print(
 )
 
 print(
-    gb_det_2020_pass_py.groupby("posteam").agg(
+    gb_det_2020_pass_py.groupby("posteam", observed=True).agg(
         {"air_yards": ["min", "max", "mean", "median", "std", "var", "count"]}
     )
 )
 
 ## group_by
 print(
-    gb_det_2020_pass_py.groupby("posteam").agg(
+    gb_det_2020_pass_py.groupby("posteam", observed=True).agg(
         {
             "yards_after_catch": [
                 "min",
@@ -20,13 +20,20 @@ np.where((score >= 7) & (team == "DEN") | (score == 0))
 ## Filtering and sorting data
 import pandas as pd
 import numpy as np
-import nfl_data_py as nfl
-
-pbp_py = nfl.import_pbp_data([2020])
-
-gb_det_2020_py_pass = pbp_py.query("home_team == 'GB' & away_team == 'DET'")[
-    ["posteam", "yards_after_catch", "air_yards", "pass_location", "qb_scramble"]
-]
+from pbp_data import load_game
+
+gb_det_2020_py_pass = load_game(
+    season=2020,
+    home_team="GB",
+    away_team="DET",
+    columns=[
+        "posteam",
+        "yards_after_catch",
+        "air_yards",
+        "pass_location",
+        "qb_scramble",
+    ],
+)
 
 print(gb_det_2020_py_pass.query("yards_after_catch > 15"))
 
@@ -0,0 +1,189 @@
+## Walk-forward backtests of the Chapter 6 touchdown model
+## For each week of a season the Poisson model is refit on every game
+## before that week, used to price that week's games, and bets are placed
+## where the model disagrees with the market. The design matrix is built
+## once; each week's refit uses the rows before the week and starts from
+## the previous week's coefficients, so it only needs a step or two. Each
+## season and model runs in its own process (see parallel.py), and the
+## processes share one memory-mapped copy of each model's design matrix.
+from contextlib import ExitStack
+import numpy as np
+import pandas as pd
+from patsy import dmatrices
+from scipy.special import gammaln
+from features import time_key
+from fitting import fit_irls
+from parallel import map_arrays, parallel_map, shared_arrays
+from pricing import decimal_from_american, over_under
+
+
+def flat_stake(p_win, decimal_odds, min_edge=0.02):
+    """Bet 1 unit whenever the expected return per unit is at least min_edge."""
+    return np.where(p_win * decimal_odds - 1 >= min_edge, 1.0, 0.0)
+
+
+def kelly_stake(p_win, decimal_odds, fraction=0.25, bankroll=100):
+    """Bet a fraction of the Kelly stake on a fixed bankroll (in units)."""
+    kelly = (p_win * decimal_odds - 1) / (decimal_odds - 1)
+    return fraction * bankroll * np.clip(kelly, 0, None)
+
+
+STAKING_RULES = {"flat": flat_stake, "quarter_kelly": kelly_stake}
+
+
+def column_or_value(data, value):
+    """The column named value, or value itself for every row."""
+    if isinstance(value, str):
+        return data[value].to_numpy(dtype=float)
+    return np.full(len(data), value, dtype=float)
+
+
+def model_arrays(data, formula):
+    """Arrays of the rows of data that formula can use (outcome y, design
+    matrix X, time key and season), and those rows of data."""
+    y, X = dmatrices(formula, data, return_type="dataframe")
+    games = data.loc[X.index]
+    arrays = {
+        "X": X.to_numpy(),
+        "y": y.to_numpy().ravel(),
+        "time": time_key(games),
+        "season": games["season"].to_numpy(),
+    }
+    return arrays, games
+
+
+def week_expectations(arrays, season):
+    """Row numbers and expected counts of the games of season, each week's
+    games priced by the model refit on every game before that week."""
+    X, y, times = arrays["X"], arrays["y"], arrays["time"]
+    in_season = arrays["season"] == season
+    coefs = None
+    rows = []
+    expected = []
+    for time in np.unique(times[in_season]):
+        before = times < time
+        if before.sum() <= X.shape[1]:
+            continue
+        coefs, _ = fit_irls(X[before], y[before], "poisson", coefs)
+        week_rows = np.flatnonzero(times == time)
+        rows.append(week_rows)
+        expected.append(np.exp(X[week_rows] @ coefs))
+    return np.concatenate(rows), np.concatenate(expected)
+
+
+def shared_week_expectations(arrays_dir, season):
+    """week_expectations() of the arrays saved in arrays_dir, which every
+    worker maps from the same files instead of getting a copy."""
+    return week_expectations(map_arrays(arrays_dir), season)
+
+
+def price_games(games, expected, line, over_odds, under_odds):
+    """games with their expected counts, the chances of the over and under,
+    and the market's line and decimal odds."""
+    priced = games.copy()
+    priced["expected"] = expected
+    priced["line"] = column_or_value(priced, line)
+    priced["over_decimal"] = decimal_from_american(column_or_value(priced, over_odds))
+    priced["under_decimal"] = decimal_from_american(column_or_value(priced, under_odds))
+    priced["p_over"], priced["p_under"], priced["p_push"] = over_under(
+        priced["expected"], priced["line"]
+    )
+    return priced
+
+
+def backtest_season(data, formula, season, line, over_odds, under_odds):
+    """Price each week's games of season with the model refit before it.
+
+    Returns one row per game of the season with the expected count, the
+    chances of the over and under, and the market's line and decimal odds.
+    """
+    arrays, games = model_arrays(data, formula)
+    rows, expected = week_expectations(arrays, season)
+    return price_games(games.iloc[rows], expected, line, over_odds, under_odds)
+
+
+def walk_forward(
+    data,
+    formulas,
+    seasons,
+    line=1.5,
+    over_odds=-110,
+    under_odds=-110,
+    max_workers=4,
+):
+    """Walk-forward predictions of each model (formulas maps names to
+    formulas) for each season, computed in a process pool.
+
+    Each model's design matrix is built once and shared with the workers
+    as memory-mapped files, so a task only carries a folder name and a
+    season. line, over_odds and under_odds (American odds) are numbers or
+    names of columns of data holding each game's market. Returns the rows
+    of backtest_season() for every model and season, with a model column.
+    """
+    designs = {name: model_arrays(data, formula) for name, formula in formulas.items()}
+    tasks = [(name, season) for name in formulas for season in seasons]
+    with ExitStack() as stack:
+        arrays_dirs = {
+            name: stack.enter_context(shared_arrays(arrays))
+            for name, (arrays, games) in designs.items()
+        }
+        results = parallel_map(
+            shared_week_expectations,
+            [(arrays_dirs[name], season) for name, season in tasks],
+            max_workers,
+        )
+    priced = [
+        price_games(
+            designs[name][1].iloc[rows], expected, line, over_odds, under_odds
+        ).assign(model=name)
+        for (rows, expected), (name, season) in zip(results, tasks)
+    ]
+    return pd.concat(priced, ignore_index=True)
+
+
+def evaluate_bets(predictions, outcome="pass_td_y", staking_rules=STAKING_RULES):
+    """Results of betting the predictions with each staking rule.
+
+    Each game is bet on the side (over or under) with the higher expected
+    return, staked by the rule. Returns, for each model and rule, the
+    number of bets, units staked, profit, return on stake and the models'
+    mean Poisson log-likelihood.
+    """
+    actual = predictions[outcome].to_numpy(dtype=float)
+    line = predictions["line"].to_numpy()
+    over_return = predictions["p_over"] * predictions["over_decimal"]
+    under_return = predictions["p_under"] * predictions["under_decimal"]
+    bet_over = (over_return >= under_return).to_numpy()
+    p_win = np.where(bet_over, predictions["p_over"], predictions["p_under"])
+    odds = np.where(bet_over, predictions["over_decimal"], predictions["under_decimal"])
+    won = np.where(bet_over, actual > line, actual < line)
+    push = actual == line
+    expected = predictions["expected"].to_numpy()
+    log_likelihood = actual * np.log(expected) - expected - gammaln(actual + 1)
+    results = []
+    for rule_name, rule in staking_rules.items():
+        stake = rule(p_win, odds)
+        profit = np.where(push, 0.0, np.where(won, stake * (odds - 1), -stake))
+        bets = pd.DataFrame(
+            {
+                "model": predictions["model"],
+                "rule": rule_name,
+                "n_bets": stake > 0,
+                "staked": stake,
+                "profit": profit,
+                "log_likelihood": log_likelihood,
+            }
+        )
+        results.append(
+            bets.groupby(["model", "rule"]).agg(
+                {
+                    "n_bets": "sum",
+                    "staked": "sum",
+                    "profit": "sum",
+                    "log_likelihood": "mean",
+                }
+            )
+        )
+    results = pd.concat(results)
+    results["roi"] = results["profit"] / results["staked"]
+    return results.reset_index()
@@ -0,0 +1,109 @@
+## Design matrices of formula models, built with numpy
+## design_spec() records how each column of a patsy design matrix is built
+## from a play's values: a numeric variable, or a categorical variable equal
+## to a level (for example down[T.2]). design_matrix() builds the matrix from
+## that recipe without patsy, so fitting.py uses it for its fits and
+## scoring.py saves it with a model's coefficients to score single plays.
+import re
+import numpy as np
+import pandas as pd
+
+
+def level_name(value):
+    """Text of a categorical level. Whole numbers are written without
+    decimals, so the numbers 2 and 2.0 are both the level "2"; text is kept
+    as it is, so "01" and "1" are different levels."""
+    is_number = isinstance(value, (int, float, np.integer, np.floating))
+    if is_number and not isinstance(value, bool) and float(value).is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def unknown_levels(var, levels, known):
+    """Raise ValueError if any of levels is not one of the known levels."""
+    unknown = sorted(set(levels) - set(known))
+    if unknown:
+        raise ValueError(
+            "Unknown levels of %s: %s (the model has %s)" % (var, unknown, known)
+        )
+
+
+def design_spec(design_info):
+    """How each column of a patsy design matrix is built from a play.
+
+    Each design column is a product of parts: a numeric variable, or a
+    categorical variable equal to a level (for example down[T.2]).
+    Transformations such as np.log(x) in the formula are not supported.
+    """
+    categories = {}
+    ## the design column names write each level with str()
+    column_levels = {}
+    for factor, info in design_info.factor_infos.items():
+        if info.type == "categorical":
+            categories[factor.name()] = [level_name(level) for level in info.categories]
+            column_levels[factor.name()] = {
+                str(level): level_name(level) for level in info.categories
+            }
+    numeric = [
+        factor.name()
+        for factor, info in design_info.factor_infos.items()
+        if info.type == "numerical"
+    ]
+    columns = []
+    for column_name in design_info.column_names:
+        parts = []
+        if column_name != "Intercept":
+            for part in column_name.split(":"):
+                level = re.match(r"^(.+)\[(?:T\.)?(.*)\]$", part)
+                if level is not None and level.group(1) in categories:
+                    var = level.group(1)
+                    parts.append([var, column_levels[var][level.group(2)]])
+                elif part in numeric and re.match(r"^\w+$", part):
+                    parts.append([part, None])
+                else:
+                    raise ValueError("Cannot score design column " + column_name)
+        columns.append(parts)
+    return {
+        "column_names": list(design_info.column_names),
+        "columns": columns,
+        "categories": categories,
+    }
+
+
+def design_matrix(spec, plays):
+    """The design matrix (plays x design columns) of a design_spec() (or a
+    scoring.model_spec()) for a data frame or a dict of equal-length lists.
+
+    Raises ValueError if a categorical variable has a level the spec has
+    no column for.
+    """
+    values = {}
+    for parts in spec["columns"]:
+        for var, level in parts:
+            if var in values:
+                continue
+            if var in spec["categories"]:
+                ## compare small codes instead of every play's level as text
+                values[var] = plays[var]
+                if not hasattr(values[var], "dtype"):
+                    values[var] = np.asarray(values[var], dtype=object)
+                codes, levels = pd.factorize(values[var])
+                levels = {level_name(level): code for code, level in enumerate(levels)}
+                unknown_levels(var, levels, spec["categories"][var])
+                values[var] = (codes, levels)
+            else:
+                values[var] = np.asarray(plays[var], dtype=float)
+    if hasattr(plays, "columns"):
+        n_plays = len(plays)
+    else:
+        n_plays = len(next(iter(plays.values()))) if plays else 1
+    ## column-major, so each column is built in place and LAPACK needs no copy
+    X = np.ones((n_plays, len(spec["columns"])), order="F")
+    for j, parts in enumerate(spec["columns"]):
+        for var, level in parts:
+            if level is None:
+                X[:, j] *= values[var]
+            else:
+                codes, levels = values[var]
+                X[:, j] *= codes == levels.get(level, -2)
+    return X
@@ -0,0 +1,148 @@
+## Point-in-time player and team features
+## Each feature row is saved with the season and week from which it is
+## known, for example a passer's touchdown rate over the games before that
+## week. Looking a feature up for a game then uses the latest row known by
+## the game's week (as with pd.merge_asof), so a game only sees features
+## from before it, and weeks a player missed (byes, injuries) still get the
+## player's latest value instead of being dropped.
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+FEATURES_DIR = "./data/features"
+
+
+def time_key(data):
+    """One sortable number per season and week, for example 202205."""
+    return data["season"].to_numpy(dtype=np.int64) * 100 + data["week"].to_numpy(
+        dtype=np.int64
+    )
+
+
+class FeatureStore:
+    """Named feature tables saved in ./data/features/, one folder each.
+
+        store = FeatureStore()
+        store.add("pass_td_rate", x_py, ["passer_id", "passer"])
+        games = store.lookup("pass_td_rate", games)
+
+    A feature table has the entity columns (player or team), season, week
+    and any number of feature columns.
+    """
+
+    def __init__(self, store_dir=FEATURES_DIR):
+        self.store_dir = store_dir
+
+    def feature_dir(self, name):
+        return os.path.join(self.store_dir, name)
+
+    def snapshot_file(self, name, season, week, max_seasons=None):
+        max_part = "" if max_seasons is None else "_max_%d" % max_seasons
+        return os.path.join(
+            self.feature_dir(name),
+            "snapshots",
+            "season_%d_week_%02d%s.parquet" % (season, week, max_part),
+        )
+
+    def add(self, name, features, entity_cols):
+        """Save features under name, replacing any saved before.
+
+        The snapshots of the old features are removed with them.
+        """
+        out_dir = self.feature_dir(name)
+        os.makedirs(out_dir, exist_ok=True)
+        shutil.rmtree(os.path.join(out_dir, "snapshots"), ignore_errors=True)
+        features = features.iloc[np.argsort(time_key(features), kind="stable")]
+        tmp_file = os.path.join(out_dir, "features.tmp.parquet")
+        features.reset_index(drop=True).to_parquet(tmp_file, compression="zstd")
+        os.replace(tmp_file, os.path.join(out_dir, "features.parquet"))
+        with open(os.path.join(out_dir, "info.json"), "w") as info_file:
+            json.dump({"entity_cols": list(entity_cols)}, info_file)
+        return out_dir
+
+    def entity_cols(self, name):
+        with open(os.path.join(self.feature_dir(name), "info.json")) as info_file:
+            return json.load(info_file)["entity_cols"]
+
+    def load(self, name):
+        """All saved rows of the features, sorted by season and week."""
+        return pd.read_parquet(os.path.join(self.feature_dir(name), "features.parquet"))
+
+    def lookup(self, name, requests, how="inner", max_seasons=None):
+        """Add the features known by each request's season and week.
+
+        requests has the entity columns, season and week, for example one
+        row per player and game. With how="inner" requests with no feature
+        known yet are dropped; with how="left" they get missing values.
+        max_seasons limits how many seasons old a feature may be (0 for
+        features from the same season only). Rows keep the order of requests.
+        """
+        entity_cols = self.entity_cols(name)
+        features = self.load(name)
+        feature_cols = [
+            col
+            for col in features.columns
+            if col not in entity_cols + ["season", "week"]
+        ]
+        feature_types = features[feature_cols].dtypes
+        features = features[entity_cols + feature_cols].assign(
+            _time=time_key(features), _season=features["season"], _found=True
+        )
+        requests = requests.assign(_row=np.arange(len(requests)))
+        requests["_time"] = time_key(requests)
+        ## merge_asof needs plain (not categorical) entity columns
+        for col in entity_cols:
+            if isinstance(features[col].dtype, pd.CategoricalDtype):
+                features[col] = features[col].astype(str)
+            if isinstance(requests[col].dtype, pd.CategoricalDtype):
+                requests["_" + col] = requests[col]
+                requests[col] = requests[col].astype(str)
+        matched = pd.merge_asof(
+            requests.sort_values("_time", kind="stable"),
+            features,
+            on="_time",
+            by=entity_cols,
+            direction="backward",
+        ).sort_values("_row")
+        for col in entity_cols:
+            if "_" + col in matched.columns:
+                matched[col] = matched["_" + col]
+                matched = matched.drop(columns="_" + col)
+        found = matched["_found"].notnull()
+        if max_seasons is not None:
+            too_old = matched["_season"] < matched["season"] - max_seasons
+            ## where() turns integer and boolean columns into ones that can
+            ## hold missing values, which setting NaN in place does not
+            matched[feature_cols] = matched[feature_cols].where(~too_old, axis=0)
+            found = found & ~too_old
+        if how == "inner":
+            matched = matched[found.to_numpy()]
+            matched = matched.astype(feature_types)
+        return matched.drop(columns=["_row", "_time", "_season", "_found"]).reset_index(
+            drop=True
+        )
+
+    def snapshot(self, name, season, week, max_seasons=None):
+        """Latest features of every entity known by the season and week.
+
+        max_seasons limits how many seasons old a feature may be, as in
+        lookup(); entities whose latest features are older are left out.
+        Each snapshot is saved the first time it is asked for, until the
+        features are replaced with add().
+        """
+        snapshot_file = self.snapshot_file(name, season, week, max_seasons)
+        if os.path.isfile(snapshot_file):
+            return pd.read_parquet(snapshot_file)
+        features = self.load(name)
+        known = features[time_key(features) <= season * 100 + week]
+        snapshot = known.groupby(self.entity_cols(name), observed=True).tail(1)
+        if max_seasons is not None:
+            snapshot = snapshot[snapshot["season"] >= season - max_seasons]
+        snapshot = snapshot.reset_index(drop=True)
+        os.makedirs(os.path.dirname(snapshot_file), exist_ok=True)
+        tmp_file = snapshot_file + ".tmp"
+        snapshot.to_parquet(tmp_file, compression="zstd")
+        os.replace(tmp_file, snapshot_file)
+        return snapshot
@@ -0,0 +1,129 @@
+## Saved design matrices and fitted models, reused while their inputs match
+## Building a formula's design matrix and fitting the model are the slow
+## parts of each chapter's regressions. FitCache saves both in ./data/fits/
+## under a key made from the formula, the model options, the fitting code
+## and a hash of the data's rows (only the columns the formula uses), so a
+## rerun on unchanged data loads the fitted model instead of refitting it,
+## and any change to the data or formula makes a new fit.
+## Files saved by other versions of the fitting code can never be loaded
+## again, so they are removed the next time a fit is saved. Fits of old
+## data are kept until prune() removes those not used for a while, or the
+## folder is deleted (which is always safe).
+import glob
+import hashlib
+import os
+import pickle
+import time
+import numpy as np
+import pandas as pd
+import patsy
+import scipy
+import fitting
+from source_hash import source_hash
+
+FITS_DIR = "./data/fits"
+
+# libraries whose versions can change a design matrix or fit
+LIBRARIES = [np, pd, patsy, scipy]
+
+
+def code_hash():
+    """Hash of the fitting code (with the repository modules it uses, such
+    as design.py) and of the versions of LIBRARIES."""
+    return source_hash(fitting, LIBRARIES)
+
+
+def data_hash(data, columns):
+    """Hash of the index and the given columns of data."""
+    row_hashes = pd.util.hash_pandas_object(data[columns], index=True)
+    return hashlib.sha256(row_hashes.to_numpy().tobytes()).hexdigest()
+
+
+class FitCache:
+    """Design matrices and fitted models saved in cache_dir.
+
+    fit_cache = FitCache()
+    expected_yards_py = fit_cache.fit("rushing_yards ~ 1 + down", pbp_py_run)
+    """
+
+    def __init__(self, cache_dir=FITS_DIR):
+        self.cache_dir = cache_dir
+        ## the fitting code is part of every key, so changing it refits
+        self.code_hash = code_hash()
+        self.removed_old = False
+
+    def key(self, formula, data, **options):
+        """Key of formula fit to data with options, which changes whenever
+        any of them does."""
+        outcome, variables = fitting.formula_variables(formula)
+        key_parts = [
+            formula,
+            repr(sorted(options.items())),
+            self.code_hash,
+            data_hash(data, outcome + variables),
+        ]
+        return hashlib.sha256("\n".join(key_parts).encode()).hexdigest()
+
+    def cache_file(self, kind, key):
+        """File of a saved object, named after the code version and key."""
+        return os.path.join(
+            self.cache_dir, "%s_%s_%s.pkl" % (kind, self.code_hash[:8], key[:16])
+        )
+
+    def load(self, kind, key):
+        """The saved object, or None if there is none."""
+        if not os.path.isfile(self.cache_file(kind, key)):
+            return None
+        with open(self.cache_file(kind, key), "rb") as cache:
+            output = pickle.load(cache)
+        ## mark the file as used, for prune()
+        os.utime(self.cache_file(kind, key))
+        return output
+
+    def remove_old(self):
+        """Remove files saved by other versions of the fitting code."""
+        for cache_file in glob.glob(os.path.join(self.cache_dir, "*.pkl")):
+            if "_" + self.code_hash[:8] + "_" not in os.path.basename(cache_file):
+                os.remove(cache_file)
+        self.removed_old = True
+
+    def prune(self, max_age_days=30):
+        """Remove saved files not saved or loaded in the last max_age_days."""
+        oldest = time.time() - max_age_days * 24 * 60 * 60
+        removed = []
+        for cache_file in glob.glob(os.path.join(self.cache_dir, "*.pkl")):
+            if os.path.getmtime(cache_file) < oldest:
+                os.remove(cache_file)
+                removed.append(cache_file)
+        return removed
+
+    def save(self, kind, key, output):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if not self.removed_old:
+            self.remove_old()
+        tmp_file = self.cache_file(kind, key) + ".tmp"
+        with open(tmp_file, "wb") as cache:
+            pickle.dump(output, cache)
+        os.replace(tmp_file, self.cache_file(kind, key))
+        return output
+
+    def design(self, formula, data):
+        """Outcome, design matrix, row index and design spec of formula for
+        data (see fitting.build_design()), built once and then loaded."""
+        key = self.key(formula, data)
+        design = self.load("design", key)
+        if design is None:
+            design = self.save("design", key, fitting.build_design(formula, data))
+        return design
+
+    def fit(self, formula, data, family=None):
+        """fitting.fit_formula(formula, data, family), fit once and then
+        loaded while formula, data and family are unchanged."""
+        key = self.key(formula, data, family=family)
+        fit = self.load("fit", key)
+        if fit is None:
+            y, X, index, spec = self.design(formula, data)
+            fit = self.save(
+                "fit", key, fitting.fit_design(formula, family, y, X, index, spec)
+            )
+        return fit
@@ -0,0 +1,506 @@
+## Lean model fitting with numpy for the RYOE and CPOE models
+## The chapters only use the coefficients, residuals and predictions of
+## their regressions, so these are fit straight from the numeric design
+## matrix: ordinary least squares through a QR decomposition, and logistic
+## and Poisson regression through iteratively reweighted least squares
+## (IRLS), which can start from earlier coefficients. Standard errors and
+## p-values are only computed when summary() is called. SufficientFit fits
+## the same models from small per-season or per-week summaries, so new
+## weeks can be added without reading the earlier plays again, and
+## fit_groups() fits a model separately for each season, team or down.
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+from patsy import ModelDesc, dmatrices
+from scipy import stats
+from scipy.linalg import qr, qr_multiply, solve, solve_triangular
+from scipy.special import gammaln
+from parallel import map_arrays, parallel_map, shared_arrays
+from design import design_matrix, design_spec, level_name
+
+# IRLS mean and variance functions (of the linear predictor eta), by family
+FAMILIES = {
+    "binomial": {
+        "link": "Logit",
+        "mean": lambda eta: 1 / (1 + np.exp(-eta)),
+        "weight": lambda mu: mu * (1 - mu),
+        "start": lambda y: (y + 0.5) / 2,
+        "link_of": lambda mu: np.log(mu / (1 - mu)),
+    },
+    "poisson": {
+        "link": "Log",
+        "mean": np.exp,
+        "weight": lambda mu: mu,
+        "start": lambda y: (y + y.mean()) / 2,
+        "link_of": np.log,
+    },
+}
+
+
+def least_squares(X, y, overwrite=False):
+    """Coefficients and the R of the QR decomposition of X.
+
+    Q'y is computed without forming Q, which would be as large as X. With
+    overwrite, X is used as workspace instead of being copied.
+    """
+    qty, R = qr_multiply(X, y[np.newaxis, :], mode="right", overwrite_a=overwrite)
+    return solve_triangular(R, qty.ravel()), R
+
+
+def fit_ols(X, y):
+    """Ordinary least squares: returns the coefficients and the R of X."""
+    return least_squares(np.asarray(X, dtype=float), np.asarray(y, dtype=float))
+
+
+def fit_irls(X, y, family, start=None, max_iter=100, tol=1e-8):
+    """Logistic (family="binomial") or Poisson regression fit by IRLS.
+
+    start is a starting guess for the coefficients, for example from an
+    earlier fit on similar data, which saves iterations. Returns the
+    coefficients and the R of the last weighted least-squares step.
+    """
+    funcs = FAMILIES[family]
+    X = np.asarray(X, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if start is None:
+        eta = funcs["link_of"](funcs["start"](y))
+    else:
+        eta = X @ np.asarray(start, dtype=float)
+    deviance = np.inf
+    for _ in range(max_iter):
+        mu = funcs["mean"](eta)
+        weight = funcs["weight"](mu)
+        ## weighted least squares on the working response
+        root_weight = np.sqrt(weight)
+        working = eta + (y - mu) / weight
+        coefs, R = least_squares(
+            X * root_weight[:, np.newaxis], working * root_weight, overwrite=True
+        )
+        eta = X @ coefs
+        new_deviance = family_deviance(family, y, funcs["mean"](eta))
+        if abs(deviance - new_deviance) <= tol * (abs(new_deviance) + tol):
+            break
+        deviance = new_deviance
+    return coefs, R
+
+
+def family_loglike(family, y, mu):
+    """Log-likelihood of counts or 0/1 outcomes y with means mu."""
+    if family == "binomial":
+        mu = np.clip(mu, 1e-15, 1 - 1e-15)
+        return np.sum(y * np.log(mu) + (1 - y) * np.log(1 - mu))
+    return np.sum(y * np.log(mu) - mu - gammaln(y + 1))
+
+
+def family_deviance(family, y, mu):
+    if family == "binomial":
+        mu = np.clip(mu, 1e-15, 1 - 1e-15)
+        return -2 * np.sum(y * np.log(mu) + (1 - y) * np.log(1 - mu))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 2 * np.sum(np.where(y > 0, y * np.log(y / mu), 0) - (y - mu))
+
+
+class LeanFit:
+    """Coefficients, fitted values and residuals of a model fit by fit_formula().
+
+    Has the attributes the chapters use from statsmodels results (params,
+    fittedvalues, resid and predict()), summary() for standard errors and
+    fit_stats() for R-squared, the F test, log-likelihood and deviance.
+    """
+
+    def __init__(self, formula, family, coefs, R, X, y, index, spec):
+        self.formula = formula
+        self.family = family
+        self.params = pd.Series(coefs, index=spec["column_names"])
+        self.spec = spec
+        eta = X @ coefs
+        mean = FAMILIES[family]["mean"] if family in FAMILIES else lambda eta: eta
+        self.fittedvalues = pd.Series(mean(eta), index=index)
+        self.resid = pd.Series(y - self.fittedvalues.to_numpy(), index=index)
+        self.nobs = len(y)
+        self.R = R
+        if family is None:
+            ## share of the variance explained (centered)
+            self.rsquared = 1 - np.sum(self.resid**2) / np.sum((y - y.mean()) ** 2)
+
+    def refit(self, data):
+        """The same model fit to data (for example with a new week of plays),
+        reusing the design columns and starting from these coefficients."""
+        return fit_formula(self.formula, data, self.family, self.params, self.spec)
+
+    def predict(self, data=None):
+        """Predictions for the rows of data, or the fitted values."""
+        if data is None:
+            return self.fittedvalues
+        return pd.Series(predict_design(self.spec, self.family, data), index=data.index)
+
+    def summary(self):
+        """Coefficient table with standard errors, test statistics,
+        p-values and 95% confidence intervals."""
+        R_inv = solve_triangular(self.R, np.eye(self.R.shape[0]))
+        cov = R_inv @ R_inv.T
+        if self.family is None:
+            df_resid = self.nobs - len(self.params)
+            cov = cov * np.sum(self.resid**2) / df_resid
+            dist = stats.t(df_resid)
+        else:
+            dist = stats.norm()
+        std_err = np.sqrt(np.diag(cov))
+        statistic = self.params / std_err
+        return pd.DataFrame(
+            {
+                "coef": self.params,
+                "std err": std_err,
+                "t" if self.family is None else "z": statistic,
+                "P>|t|" if self.family is None else "P>|z|": 2
+                * dist.sf(np.abs(statistic)),
+                "[0.025": self.params - dist.ppf(0.975) * std_err,
+                "0.975]": self.params + dist.ppf(0.975) * std_err,
+            }
+        )
+
+    def fit_stats(self):
+        """Fit statistics from the top of a statsmodels summary, as a Series.
+
+        Least squares gets R-squared, adjusted R-squared, the F test of all
+        coefficients but the intercept, log-likelihood, AIC and BIC. Logistic
+        and Poisson regression get the deviance (and that of a model with
+        only an intercept), Pearson chi2, log-likelihood, AIC and the
+        Cox-Snell pseudo R-squared.
+        """
+        mu = self.fittedvalues.to_numpy()
+        y = mu + self.resid.to_numpy()
+        n_obs = self.nobs
+        has_intercept = "Intercept" in self.params.index
+        df_model = len(self.params) - has_intercept
+        df_resid = n_obs - len(self.params)
+        fit_stats = {
+            "No. Observations": n_obs,
+            "Df Residuals": df_resid,
+            "Df Model": df_model,
+        }
+        if self.family is None:
+            ssr = np.sum((y - mu) ** 2)
+            tss = np.sum((y - y.mean()) ** 2) if has_intercept else np.sum(y**2)
+            llf = -n_obs / 2 * (np.log(2 * np.pi * ssr / n_obs) + 1)
+            f_value = (tss - ssr) / df_model / (ssr / df_resid)
+            fit_stats.update(
+                {
+                    "R-squared": 1 - ssr / tss,
+                    "Adj. R-squared": 1
+                    - (ssr / df_resid) / (tss / (n_obs - has_intercept)),
+                    "F-statistic": f_value,
+                    "Prob (F-statistic)": stats.f.sf(f_value, df_model, df_resid),
+                    "Log-Likelihood": llf,
+                    "AIC": 2 * len(self.params) - 2 * llf,
+                    "BIC": np.log(n_obs) * len(self.params) - 2 * llf,
+                }
+            )
+        else:
+            llf = family_loglike(self.family, y, mu)
+            null_llf = family_loglike(self.family, y, np.full(n_obs, y.mean()))
+            fit_stats.update(
+                {
+                    "Log-Likelihood": llf,
+                    "Deviance": family_deviance(self.family, y, mu),
+                    "Null Deviance": family_deviance(
+                        self.family, y, np.full(n_obs, y.mean())
+                    ),
+                    "Pearson chi2": np.sum(
+                        (y - mu) ** 2 / FAMILIES[self.family]["weight"](mu)
+                    ),
+                    "AIC": 2 * len(self.params) - 2 * llf,
+                    "Pseudo R-squ. (CS)": 1 - np.exp(2 * (null_llf - llf) / n_obs),
+                }
+            )
+        return pd.Series(fit_stats, dtype=float)
+
+
+def formula_variables(formula):
+    """Names of the outcome and of the variables used by formula."""
+    desc = ModelDesc.from_formula(formula)
+    outcome = [factor.code for term in desc.lhs_termlist for factor in term.factors]
+    variables = sorted(
+        {factor.code for term in desc.rhs_termlist for factor in term.factors}
+    )
+    return outcome, variables
+
+
+def build_design(formula, data, spec=None):
+    """Outcome, design matrix, index of the rows used and design_spec() of
+    formula for data. Rows with missing values are dropped, as by patsy.
+    Given the spec of an earlier fit, its design columns are reused.
+
+    patsy only works out the design columns, from one row with each level
+    of each categorical variable (levels that never occur are left out);
+    the matrix is then built with numpy by design.design_matrix(). The
+    outcome and variables must be columns of data (no transformations such
+    as np.log(x)).
+    """
+    outcome, variables = formula_variables(formula)
+    data = data[outcome + variables]
+    data = data[data.notnull().all(axis=1).to_numpy()]
+    if spec is None:
+        spec = sample_spec(formula, data, outcome, variables)
+    y = data[outcome[0]].to_numpy(dtype=float)
+    return y, design_matrix(spec, data), data.index, spec
+
+
+def sample_spec(formula, data, outcome, variables):
+    """design_spec() of formula, from one row with each level of each
+    categorical variable of data."""
+    rows = {0}
+    for var in variables:
+        if not is_numeric_dtype(data[var]) or is_bool_dtype(data[var]):
+            _, first = np.unique(pd.factorize(data[var])[0], return_index=True)
+            rows.update(first)
+    ## plain arrays, which patsy reads much faster than pandas columns
+    sample = {}
+    for var in outcome + variables:
+        values = data[var].iloc[sorted(rows)]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            sample[var] = values.array.remove_unused_categories()
+        elif is_numeric_dtype(values) and not is_bool_dtype(values):
+            sample[var] = values.to_numpy(dtype=float)
+        else:
+            sample[var] = values.to_numpy(dtype=object)
+    _, sample_X = dmatrices(formula, sample)
+    return design_spec(sample_X.design_info)
+
+
+def fit_formula(formula, data, family=None, start=None, spec=None):
+    """Fit formula to data: least squares if family is None, otherwise
+    "binomial" (logistic) or "poisson" regression.
+
+    The design matrix is built by build_design() and the model is fit with
+    fit_ols() or fit_irls(), starting from the coefficients start if given.
+    """
+    y, X, index, spec = build_design(formula, data, spec)
+    return fit_design(formula, family, y, X, index, spec, start)
+
+
+def fit_design(formula, family, y, X, index, spec, start=None):
+    """Fit a model to a design built by build_design() (see fit_formula())."""
+    if family is None:
+        coefs, R = fit_ols(X, y)
+        link = "Identity"
+    else:
+        coefs, R = fit_irls(X, y, family, start)
+        link = FAMILIES[family]["link"]
+    spec = {
+        **spec,
+        "outcome": formula.split("~")[0].strip(),
+        "link": link,
+        "coefs": [float(coef) for coef in coefs],
+    }
+    return LeanFit(formula, family, coefs, R, X, y, index, spec)
+
+
+def predict_design(spec, family, data):
+    """Predictions of a fit's spec (design and coefficients) for data."""
+    eta = design_matrix(spec, data) @ np.asarray(spec["coefs"])
+    return eta if family is None else FAMILIES[family]["mean"](eta)
+
+
+def partial_stats(X, y, weight=None):
+    """Sufficient statistics of a least-squares fit of y on X (optionally
+    weighted): X'X, X'y, y'y, the sum of y and the number of rows."""
+    Xw = X if weight is None else X * weight[:, np.newaxis]
+    yw = y if weight is None else y * weight
+    return {
+        "xtx": Xw.T @ X,
+        "xty": Xw.T @ y,
+        "yty": float(yw @ y),
+        "y_sum": float(yw.sum()),
+        "n": len(y),
+    }
+
+
+def merge_stats(partials):
+    """Sum of the statistics of several partitions (see partial_stats())."""
+    partials = list(partials)
+    return {key: sum(partial[key] for partial in partials) for key in partials[0]}
+
+
+class SufficientFit:
+    """A formula model fit from per-partition summaries instead of rows.
+
+    Each partition of the data (for example each season, or each week with
+    by=["season", "week"]) is summarized once by partial_stats(), and the
+    coefficients are solved from the summed summaries, so adding a week
+    only reads that week's plays and refitting costs the same however many
+    plays were summarized before. update() with a partition that was
+    already added replaces its summary.
+
+    Least squares (family None) is exact. For "binomial" and "poisson"
+    the summaries are of an IRLS step: update() iterates on the new
+    partitions' plays while the other partitions keep the summaries from
+    the coefficients they were last updated with, so after several
+    updates the coefficients are close to, not exactly, those of a full
+    fit; updating every partition again makes them exact.
+    """
+
+    def __init__(self, formula, family=None, by=("season", "week")):
+        self.formula = formula
+        self.family = family
+        self.by = list(by)
+        self.partials = {}
+        self.design = None
+        self.coefs = None
+
+    def partitions(self, data):
+        """Design matrix and outcome of the rows of each partition of data."""
+        y, X, index, self.design = build_design(self.formula, data, self.design)
+        groups = data.loc[index, self.by].groupby(self.by, observed=True).indices
+        return {
+            key if isinstance(key, tuple) else (key,): (X[rows], y[rows])
+            for key, rows in groups.items()
+        }
+
+    def update(self, data, max_iter=100, tol=1e-10):
+        """Summarize the partitions in data and refit the coefficients."""
+        if self.design is not None:
+            check_levels(self.design, data)
+        new = self.partitions(data)
+        if self.family is None:
+            for key, (X, y) in new.items():
+                self.partials[key] = partial_stats(X, y)
+            self.coefs = solve_stats(merge_stats(self.partials.values()))
+            return self
+        old = [partial for key, partial in self.partials.items() if key not in new]
+        funcs = FAMILIES[self.family]
+        for _ in range(max_iter):
+            partials = {}
+            for key, (X, y) in new.items():
+                if self.coefs is None:
+                    eta = funcs["link_of"](funcs["start"](y))
+                else:
+                    eta = X @ self.coefs
+                mu = funcs["mean"](eta)
+                weight = funcs["weight"](mu)
+                ## IRLS step: weighted least squares on the working response
+                partials[key] = partial_stats(X, eta + (y - mu) / weight, weight)
+            coefs = solve_stats(merge_stats(old + list(partials.values())))
+            converged = self.coefs is not None and np.allclose(
+                coefs, self.coefs, rtol=tol, atol=tol
+            )
+            self.coefs = coefs
+            if converged:
+                break
+        self.partials.update(partials)
+        return self
+
+    @property
+    def params(self):
+        return pd.Series(self.coefs, index=self.design["column_names"])
+
+    @property
+    def nobs(self):
+        return sum(partial["n"] for partial in self.partials.values())
+
+    @property
+    def spec(self):
+        """The model_spec() of the current coefficients, for scoring."""
+        return {
+            **self.design,
+            "outcome": self.formula.split("~")[0].strip(),
+            "link": FAMILIES[self.family]["link"] if self.family else "Identity",
+            "coefs": [float(coef) for coef in self.coefs],
+        }
+
+    def predict(self, data):
+        """Predictions for the rows of data."""
+        return pd.Series(predict_design(self.spec, self.family, data), index=data.index)
+
+
+def solve_stats(stats):
+    """Coefficients of the least-squares fit with the statistics stats."""
+    return solve(stats["xtx"], stats["xty"], assume_a="pos")
+
+
+def check_levels(design, data):
+    """Raise ValueError if data has a level of a categorical variable that
+    the design has no column for."""
+    for var, levels in design["categories"].items():
+        observed = np.asarray(data[var].dropna().unique(), dtype=object)
+        new_levels = {level_name(level) for level in observed} - set(levels)
+        if new_levels:
+            raise ValueError(
+                "%s has levels not in the model: %s" % (var, sorted(new_levels))
+            )
+
+
+def fit_group(X, y, family=None, tol=1e-7):
+    """Fit one group's rows: coefficients, standard errors and fitted values.
+
+    Columns that are zero or a combination of earlier columns in this
+    group (for example down[T.2] when fitting each down separately) are
+    left out and get NaN coefficients.
+    """
+    R = qr(X, mode="r")[0]
+    ## a column adds nothing new when its part not explained by the earlier
+    ## columns (the diagonal of R) is tiny compared to its length
+    kept = np.flatnonzero(
+        np.abs(np.diag(R)[: X.shape[1]]) > tol * np.linalg.norm(X, axis=0)
+    )
+    rank = len(kept)
+    X_kept = X[:, kept]
+    if family is None:
+        coefs, R = fit_ols(X_kept, y)
+        fitted = X_kept @ coefs
+        scale = np.sum((y - fitted) ** 2) / max(len(y) - rank, 1)
+    else:
+        coefs, R = fit_irls(X_kept, y, family)
+        fitted = FAMILIES[family]["mean"](X_kept @ coefs)
+        scale = 1.0
+    R_inv = solve_triangular(R, np.eye(rank))
+    all_coefs = np.full(X.shape[1], np.nan)
+    all_coefs[kept] = coefs
+    std_err = np.full(X.shape[1], np.nan)
+    std_err[kept] = np.sqrt(scale * np.sum(R_inv**2, axis=1))
+    return all_coefs, std_err, fitted
+
+
+def fit_shared_group(arrays_dir, rows, family=None):
+    """fit_group() on the rows of the X and y saved in arrays_dir, which
+    every worker maps from the same files instead of getting a copy."""
+    arrays = map_arrays(arrays_dir, ["X", "y"])
+    return fit_group(arrays["X"][rows], arrays["y"][rows], family)
+
+
+def fit_groups(formula, data, by, family=None, max_workers=4):
+    """Fit formula separately to each group of data (for example by
+    ["season"], ["posteam"] or ["down"]), in a process pool (see
+    parallel.py).
+
+    The design matrix is built once for all rows and shared with the
+    workers as memory-mapped files, so each task only carries its group's
+    row numbers. Returns a tidy data frame of coefficients (the by columns, term,
+    estimate, std_err and the group's number of plays n) and a Series of
+    each row's prediction from its group's model, in the order of data
+    (NaN for rows with missing values).
+    """
+    y, X, index, spec = build_design(formula, data)
+    groups = data.loc[index, by].groupby(by, observed=True).indices
+    with shared_arrays({"X": X, "y": y}) as arrays_dir:
+        results = parallel_map(
+            fit_shared_group,
+            [(arrays_dir, rows, family) for rows in groups.values()],
+            max_workers,
+        )
+    ## rows whose group is missing belong to no model
+    predictions = np.full(len(y), np.nan)
+    coef_tables = []
+    for (key, rows), (coefs, std_err, fitted) in zip(groups.items(), results):
+        predictions[rows] = fitted
+        table = pd.DataFrame(
+            {"term": spec["column_names"], "estimate": coefs, "std_err": std_err}
+        )
+        table.insert(0, "n", len(rows))
+        for col, value in zip(by, key if isinstance(key, tuple) else (key,)):
+            table.insert(0, col, value)
+        coef_tables.append(table)
+    coef_table = pd.concat(coef_tables, ignore_index=True)
+    coef_table = coef_table[by + ["term", "estimate", "std_err", "n"]]
+    predictions = pd.Series(predictions, index=index).reindex(data.index)
+    return coef_table, predictions
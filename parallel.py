@@ -0,0 +1,130 @@
+## Process pools that work from the chapter scripts
+## The chapters run their analyses at the top level of the script, without
+## an if __name__ == "__main__": guard. Worker processes started with
+## "spawn" or "forkserver" (the default on Windows and macOS, and from
+## Python 3.14 on Linux) import the script again, which reruns it and
+## breaks the pool. Forked workers start from a copy of the running
+## process instead, so they are used where fork is available and safe;
+## elsewhere (macOS and Windows) the tasks run one after another in this
+## process, with a warning the first time.
+## Each task's arguments are pickled and copied to its worker, so large
+## arrays are instead saved once as .npy files with shared_arrays() and
+## opened by the workers as memory maps (map_arrays()), which all share
+## one copy of the data through the operating system's file cache.
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import numpy as np
+
+# set once parallel_map() has warned that it runs the tasks serially
+warned_serial = False
+
+
+def fork_context():
+    """The "fork" multiprocessing context, or None where it is not safe."""
+    if sys.platform == "darwin":
+        ## system libraries on macOS can crash in forked processes
+        return None
+    if "fork" not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context("fork")
+
+
+def parallel_map(func, tasks, max_workers=4):
+    """[func(*task) for task in tasks], in forked processes where possible.
+
+    With max_workers=1, or where fork_context() is None, the tasks run in
+    this process; the latter gives a RuntimeWarning the first time. Results
+    are in the order of tasks either way.
+    """
+    global warned_serial
+    tasks = list(tasks)
+    context = fork_context()
+    if context is None and max_workers > 1 and len(tasks) > 1 and not warned_serial:
+        warnings.warn(
+            "forked worker processes are not used on "
+            + sys.platform
+            + ", so parallel_map() runs its tasks one after another",
+            RuntimeWarning,
+            stacklevel=2,
+        )
+        warned_serial = True
+    if context is None or max_workers <= 1 or len(tasks) <= 1:
+        return [func(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=context) as pool:
+        futures = [pool.submit(func, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def save_arrays(out_dir, arrays, info=None):
+    """Save each array of arrays (a dict) as out_dir/<name>.npy.
+
+    info.json lists the names, plus anything in info. The folder is written
+    under a temporary name and renamed once complete, replacing any folder
+    saved before.
+    """
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_dir, name + ".npy"), np.asarray(values))
+    with open(os.path.join(tmp_dir, "info.json"), "w") as info_file:
+        json.dump({**(info or {}), "names": list(arrays)}, info_file)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+
+def array_info(in_dir):
+    """The info.json saved with the arrays in in_dir."""
+    with open(os.path.join(in_dir, "info.json")) as info_file:
+        return json.load(info_file)
+
+
+def map_arrays(in_dir, names=None):
+    """Open the arrays saved in in_dir as read-only memory maps (a dict).
+
+    No data is read until it is used, and processes that open the same
+    arrays share the same physical memory.
+    """
+    saved = array_info(in_dir)["names"]
+    if names is None:
+        names = saved
+    missing = [name for name in names if name not in saved]
+    if len(missing) > 0:
+        raise KeyError(
+            "Not saved in "
+            + in_dir
+            + ": "
+            + ", ".join(missing)
+            + " (saved: "
+            + ", ".join(saved)
+            + ")"
+        )
+    return {
+        name: np.load(os.path.join(in_dir, name + ".npy"), mmap_mode="r")
+        for name in names
+    }
+
+
+@contextmanager
+def shared_arrays(arrays):
+    """Save arrays (a dict) in a temporary folder for a with block.
+
+        with shared_arrays({"X": X, "y": y}) as arrays_dir:
+            results = parallel_map(fit_rows, [(arrays_dir, rows) ...])
+
+    The tasks only carry the folder name; each worker opens the arrays
+    with map_arrays(arrays_dir). The folder is removed afterwards.
+    """
+    tmp_dir = tempfile.mkdtemp(prefix="shared_arrays_")
+    try:
+        yield save_arrays(os.path.join(tmp_dir, "arrays"), arrays)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
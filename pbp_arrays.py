@@ -0,0 +1,96 @@
+## Memory-mapped numeric arrays of the pbp columns used to fit models
+## Each column of a named set of plays (for example "runs") is saved once as
+## a fixed-type .npy file in ./data/pbp_arrays/. Opening the arrays maps the
+## files into memory without copying, so several processes fitting models
+## share one copy of the data through the operating system's file cache
+## (see parallel.py, which also shares the design matrices of fit_groups()
+## and walk_forward() with their workers in the same way).
+import hashlib
+import os
+import numpy as np
+from parallel import array_info, map_arrays, save_arrays
+from pbp_data import PBP_DIR, cache_seasons, load_pbp, season_files
+
+ARRAYS_DIR = "./data/pbp_arrays"
+
+# numeric columns used by the model-fitting chapters
+HOT_COLUMNS = [
+    "season",
+    "week",
+    "down",
+    "ydstogo",
+    "yardline_100",
+    "score_differential",
+    "air_yards",
+    "rushing_yards",
+    "complete_pass",
+    "total_line",
+]
+
+
+def arrays_dir(name, base_dir=ARRAYS_DIR):
+    """Folder holding the arrays saved under name."""
+    return os.path.join(base_dir, name)
+
+
+def export_arrays(name, pbp, columns=HOT_COLUMNS, base_dir=ARRAYS_DIR, key=None):
+    """Save columns of pbp as float32 .npy files under name.
+
+    Missing values (including those in integer and 0/1 flag columns) are
+    saved as NaN. The arrays replace any saved under name before, and
+    info.json lists the columns, the number of rows and key.
+    """
+    arrays = {
+        col: pbp[col].to_numpy(dtype=np.float32, na_value=np.nan) for col in columns
+    }
+    return save_arrays(
+        arrays_dir(name, base_dir), arrays, {"n_rows": len(pbp), "key": key}
+    )
+
+
+def open_arrays(name, columns=None, base_dir=ARRAYS_DIR):
+    """Open saved arrays as read-only memory maps, returned as a dict.
+
+    No data is copied into memory until it is used, and processes that open
+    the same arrays share the same physical memory. Asking for a column
+    that was not exported raises a KeyError.
+    """
+    return map_arrays(arrays_dir(name, base_dir), columns)
+
+
+def export_key(seasons, columns, filters, pbp_dir=PBP_DIR):
+    """Key of the arrays of seasons, columns and filters, which also changes
+    when the stored pbp files of the seasons change (see update_pbp())."""
+    key_parts = [repr(sorted(seasons)), repr(list(columns)), repr(filters)]
+    for season in sorted(seasons):
+        for file in season_files(season, pbp_dir):
+            file_stat = os.stat(file)
+            key_parts.append(file + str(file_stat.st_size) + str(file_stat.st_mtime_ns))
+    return hashlib.sha256("\n".join(key_parts).encode()).hexdigest()
+
+
+def cache_arrays(
+    name,
+    seasons,
+    columns=HOT_COLUMNS,
+    filters=None,
+    base_dir=ARRAYS_DIR,
+    pbp_dir=PBP_DIR,
+):
+    """Open the arrays saved under name, exporting them from pbp data first
+    if they do not exist yet or were exported from other seasons, columns,
+    filters or stored files.
+
+    filters are passed to load_pbp(), for example
+    [("play_type", "==", "run"), ("rusher_id", "notnull")] for runs.
+    """
+    ## download any missing season first, so its files are part of the key
+    cache_seasons(seasons, pbp_dir)
+    key = export_key(seasons, columns, filters, pbp_dir)
+    out_dir = arrays_dir(name, base_dir)
+    if not os.path.isfile(os.path.join(out_dir, "info.json")) or (
+        array_info(out_dir).get("key") != key
+    ):
+        pbp = load_pbp(seasons, columns=list(columns), filters=filters, pbp_dir=pbp_dir)
+        export_arrays(name, pbp, columns, base_dir, key)
+    return open_arrays(name, columns, base_dir)
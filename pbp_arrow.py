@@ -0,0 +1,82 @@
+## Shared Arrow (Feather) files read by both the Python and R chapters
+## The files in ./data/arrow/ are uncompressed Arrow files, so both Python
+## (pyarrow) and R (arrow) can memory-map them: the data is read straight
+## from the operating system's file cache instead of being parsed or copied,
+## and running both languages side by side keeps one copy in memory.
+## The pbp files are only written by export_pbp_arrow() here (R runs it
+## through Python), so every season has the column types of the Python pbp
+## store whichever language asked for it first.
+## The R functions with the same names are in pbp_arrow.R.
+import os
+import pyarrow as pa
+import pyarrow.feather as feather
+from pbp_data import PBP_DIR, load_pbp
+
+ARROW_DIR = "./data/arrow"
+
+
+def arrow_file(name, arrow_dir=ARROW_DIR):
+    """Path of the Arrow file saved under name."""
+    return os.path.join(arrow_dir, name + ".arrow")
+
+
+def write_arrow(data, name, arrow_dir=ARROW_DIR):
+    """Save a data frame as an uncompressed Arrow file that R can read.
+
+    The file is written under a temporary name and then renamed, so the
+    other language never sees a partly written file.
+    """
+    os.makedirs(arrow_dir, exist_ok=True)
+    out_file = arrow_file(name, arrow_dir)
+    tmp_file = out_file + ".tmp"
+    feather.write_feather(data, tmp_file, compression="uncompressed")
+    os.replace(tmp_file, out_file)
+    return out_file
+
+
+def read_arrow(name, columns=None, as_data_frame=True, arrow_dir=ARROW_DIR):
+    """Memory-map an Arrow file saved by Python or R.
+
+    With as_data_frame=False the pyarrow Table is returned; it points
+    straight into the mapped file without copying any data.
+    """
+    arrow_table = feather.read_table(
+        arrow_file(name, arrow_dir), columns=columns, memory_map=True
+    )
+    if as_data_frame:
+        return arrow_table.to_pandas(split_blocks=True)
+    return arrow_table
+
+
+def export_pbp_arrow(seasons, arrow_dir=ARROW_DIR, pbp_dir=PBP_DIR):
+    """Save each season of pbp data as an Arrow file if it is not saved yet.
+
+    The files are named pbp_<season>, for example pbp_2022.arrow, and use
+    the same column types as the pbp store (see pbp_data.apply_schema()).
+    """
+    for season in seasons:
+        name = "pbp_" + str(season)
+        if not os.path.isfile(arrow_file(name, arrow_dir)):
+            write_arrow(load_pbp([season], pbp_dir=pbp_dir), name, arrow_dir)
+
+
+def load_pbp_arrow(
+    seasons, columns=None, as_data_frame=True, arrow_dir=ARROW_DIR, pbp_dir=PBP_DIR
+):
+    """Load pbp data for the seasons from the shared Arrow files.
+
+    Seasons not yet saved are exported from the pbp store first. The
+    seasons are joined without copying their data; a column that is
+    missing in every play of a season gets its type from the others.
+    """
+    export_pbp_arrow(seasons, arrow_dir, pbp_dir)
+    season_tables = [
+        read_arrow("pbp_" + str(season), columns, False, arrow_dir)
+        for season in seasons
+    ]
+    ## as in R, a column that is null in one season takes the other seasons' type
+    pbp_schema = pa.unify_schemas([table.schema for table in season_tables])
+    pbp_table = pa.concat_tables([table.cast(pbp_schema) for table in season_tables])
+    if as_data_frame:
+        return pbp_table.to_pandas(split_blocks=True)
+    return pbp_table
@@ -0,0 +1,422 @@
+## Shared play-by-play (pbp) data store for the chapter scripts
+## Each season is saved once in ./data/pbp/ as compressed parquet files,
+## one file per week (for example ./data/pbp/pbp_2016/week_01.parquet),
+## and every chapter loads from the same files instead of its own csv.
+import glob
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pbp_fetch import PBP_URL, download_season, fetch_seasons
+
+PBP_DIR = "./data/pbp"
+
+## declared column types for the pbp table
+# low-cardinality text columns are stored as categoricals
+CATEGORY_COLUMNS = [
+    "game_id",
+    "season_type",
+    "home_team",
+    "away_team",
+    "posteam",
+    "defteam",
+    "side_of_field",
+    "play_type",
+    "pass_length",
+    "pass_location",
+    "run_location",
+    "run_gap",
+    "passer",
+    "rusher",
+    "receiver",
+]
+
+# player IDs such as "00-0023459" are stored as int32 codes (23459)
+PLAYER_ID_COLUMNS = ["passer_id", "rusher_id", "receiver_id"]
+
+# 0/1 flags are stored as nullable int8
+FLAG_COLUMNS = [
+    "complete_pass",
+    "incomplete_pass",
+    "pass_attempt",
+    "rush_attempt",
+    "pass_touchdown",
+    "rush_touchdown",
+    "touchdown",
+    "interception",
+    "sack",
+    "qb_hit",
+    "qb_scramble",
+    "qb_dropback",
+    "fumble",
+    "fumble_lost",
+    "first_down",
+    "penalty",
+    "shotgun",
+    "no_huddle",
+]
+
+# small whole numbers
+INTEGER_COLUMNS = {
+    "season": "int16",
+    "week": "int8",
+    "qtr": "Int8",
+    "down": "Int8",
+}
+
+
+def season_dir(season, pbp_dir=PBP_DIR):
+    """Folder holding the weekly parquet files for one season of pbp data."""
+    return os.path.join(pbp_dir, "pbp_" + str(season))
+
+
+def week_file(season, week, pbp_dir=PBP_DIR):
+    """Path of the parquet file holding one week of pbp data."""
+    return os.path.join(season_dir(season, pbp_dir), "week_%02d.parquet" % week)
+
+
+def season_files(season, pbp_dir=PBP_DIR):
+    """Weekly parquet files stored for a season (empty if not downloaded)."""
+    return sorted(
+        glob.glob(os.path.join(season_dir(season, pbp_dir), "week_*.parquet"))
+    )
+
+
+def player_id_to_code(player_ids):
+    """Convert player IDs like "00-0023459" to int32 codes like 23459."""
+    player_ids = player_ids.astype("string")
+    is_valid = player_ids.str.fullmatch(r"\d{2}-\d{7}")
+    if not is_valid.fillna(True).all():
+        bad_id = player_ids[is_valid == False].iloc[0]  # noqa: E712
+        raise ValueError("Unexpected player ID format: " + bad_id)
+    return pd.to_numeric(player_ids.str.replace("-", "", regex=False)).astype("Int32")
+
+
+def code_to_player_id(codes):
+    """Convert int32 player codes back to IDs like "00-0023459"."""
+    codes = pd.Series(codes).astype("Int64")
+    player_ids = (
+        (codes // 10**7).astype("string").str.zfill(2)
+        + "-"
+        + (codes % 10**7).astype("string").str.zfill(7)
+    )
+    return player_ids
+
+
+def apply_schema(pbp):
+    """Convert a pbp data frame to the declared column types.
+
+    Columns not listed in the schema keep their type, except that float64
+    columns are downcast to float32. Data already in the schema is unchanged.
+    """
+    pbp = pbp.copy()
+    for col in pbp.columns:
+        if col in CATEGORY_COLUMNS:
+            # string categories keep all-missing weeks compatible with the rest
+            pbp[col] = pbp[col].astype("string").astype("category")
+        elif col in PLAYER_ID_COLUMNS:
+            if not pd.api.types.is_integer_dtype(pbp[col]):
+                pbp[col] = player_id_to_code(pbp[col])
+        elif col in FLAG_COLUMNS:
+            pbp[col] = pbp[col].astype("Int8")
+        elif col in INTEGER_COLUMNS:
+            pbp[col] = pbp[col].astype(INTEGER_COLUMNS[col])
+        elif pbp[col].dtype == np.float64:
+            pbp[col] = pbp[col].astype(np.float32)
+    return pbp
+
+
+def write_week(pbp_week, out_file):
+    """Write one week of pbp data using the declared schema.
+
+    Each game is written as its own parquet row group, so one game can be
+    read without the rest of the week (see load_game()). The file is written
+    under a temporary name and then renamed so that an interrupted write
+    never leaves a partial file behind.
+    """
+    pbp_week = apply_schema(pbp_week).sort_values("game_id", kind="stable")
+    week_table = pa.Table.from_pandas(pbp_week, preserve_index=False)
+    game_codes = pbp_week["game_id"].cat.codes.to_numpy()
+    game_starts = np.flatnonzero(np.diff(game_codes)) + 1
+    game_starts = [0] + list(game_starts) + [len(pbp_week)]
+    tmp_file = out_file + ".tmp"
+    with pq.ParquetWriter(tmp_file, week_table.schema, compression="zstd") as writer:
+        for start, stop in zip(game_starts[:-1], game_starts[1:]):
+            writer.write_table(week_table.slice(start, stop - start))
+    os.replace(tmp_file, out_file)
+    return out_file
+
+
+def save_season(pbp_season, season, pbp_dir=PBP_DIR):
+    """Write one season of pbp data to the store, replacing any old copy.
+
+    The weekly files are written to a temporary folder that is renamed once
+    all weeks are done, so a season is either fully stored or not at all.
+    """
+    out_dir = season_dir(season, pbp_dir)
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for week, pbp_week in pbp_season.groupby("week"):
+        write_week(pbp_week, os.path.join(tmp_dir, "week_%02d.parquet" % week))
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    return season_files(season, pbp_dir)
+
+
+def save_weeks(pbp_new, season, pbp_dir=PBP_DIR):
+    """Add or replace games in the weekly files of a stored season.
+
+    Only the weeks that pbp_new touches are rewritten. Plays already stored
+    for the same games are dropped so the new copy replaces them.
+    """
+    for week, pbp_week in pbp_new.groupby("week"):
+        out_file = week_file(season, week, pbp_dir)
+        pbp_week = apply_schema(pbp_week)
+        if os.path.isfile(out_file):
+            pbp_old = pd.read_parquet(out_file)
+            pbp_old = pbp_old[~pbp_old.game_id.isin(pbp_week.game_id.unique())]
+            pbp_week = pd.concat([pbp_old, pbp_week], ignore_index=True)
+        write_week(pbp_week, out_file)
+
+
+def cache_seasons(seasons, pbp_dir=PBP_DIR, url=PBP_URL, max_workers=4):
+    """Download any season not yet in the store and return all file paths.
+
+    Missing seasons are downloaded in parallel and each is saved as soon as
+    it arrives, so after an interruption only unfinished seasons are fetched.
+    """
+    missing = [season for season in seasons if len(season_files(season, pbp_dir)) == 0]
+    fetch_seasons(
+        missing,
+        lambda pbp_season, season: save_season(pbp_season, season, pbp_dir),
+        url=url,
+        max_workers=max_workers,
+    )
+    return [file for season in seasons for file in season_files(season, pbp_dir)]
+
+
+def stored_games(seasons, pbp_dir=PBP_DIR):
+    """Final score of every game in the store, one row per game_id."""
+    files = [file for season in seasons for file in season_files(season, pbp_dir)]
+    if len(files) == 0:
+        return pd.DataFrame(
+            columns=["game_id", "season", "week", "home_score", "away_score"]
+        )
+    games = load_files(
+        files,
+        columns=["game_id", "season", "week", "total_home_score", "total_away_score"],
+    )
+    games = games.groupby(["game_id", "season", "week"], observed=True).agg(
+        {"total_home_score": "max", "total_away_score": "max"}
+    )
+    games.reset_index(inplace=True)
+    games["game_id"] = games["game_id"].astype(str)
+    return games.rename(
+        columns={"total_home_score": "home_score", "total_away_score": "away_score"}
+    )
+
+
+def update_pbp(seasons, pbp_dir=PBP_DIR, url=PBP_URL):
+    """Bring the store up to date with the games played so far.
+
+    The schedule is compared with the stored games. Seasons that are not
+    stored are downloaded in full. For stored seasons, only games that are
+    missing, or whose stored final score differs from the schedule (for
+    example a game saved while it was still being played), are added or
+    replaced, and only their weeks are rewritten. Returns the game IDs that
+    were updated.
+    """
+    ## only needed here, so the rest of the store works without it
+    import nfl_data_py as nfl
+
+    schedule = nfl.import_schedules(list(seasons))
+    played = schedule.query("home_score.notnull() & away_score.notnull()")
+    updated = []
+    for season in seasons:
+        played_season = played.query("season == @season")
+        if len(season_files(season, pbp_dir)) == 0:
+            cache_seasons([season], pbp_dir, url)
+            updated += list(played_season.game_id)
+            continue
+        games = played_season.merge(
+            stored_games([season], pbp_dir),
+            how="left",
+            on="game_id",
+            suffixes=("", "_stored"),
+            indicator=True,
+        )
+        is_stale = (
+            (games["_merge"] == "left_only")
+            | (games["home_score"] != games["home_score_stored"])
+            | (games["away_score"] != games["away_score_stored"])
+        )
+        stale_games = list(games.loc[is_stale, "game_id"])
+        if len(stale_games) > 0:
+            pbp_new = download_season(season, url)
+            save_weeks(pbp_new[pbp_new.game_id.isin(stale_games)], season, pbp_dir)
+            updated += stale_games
+    return updated
+
+
+def filter_expression(filters):
+    """Turn a list of (column, op, value) filters into a pyarrow expression.
+
+    All filters are combined with "and". The supported ops are "==", "!=",
+    "<", "<=", ">", ">=", "in", "not in", "notnull" and "isnull"; the last
+    two do not take a value, for example ("rusher_id", "notnull").
+    """
+    expression = None
+    for column, op, *value in filters:
+        field = pc.field(column)
+        if op == "notnull":
+            term = field.is_valid()
+        elif op == "isnull":
+            term = field.is_null()
+        elif op == "in":
+            term = field.isin(value[0])
+        elif op == "not in":
+            term = ~field.isin(value[0])
+        elif op == "==":
+            term = field == value[0]
+        elif op == "!=":
+            term = field != value[0]
+        elif op == "<":
+            term = field < value[0]
+        elif op == "<=":
+            term = field <= value[0]
+        elif op == ">":
+            term = field > value[0]
+        elif op == ">=":
+            term = field >= value[0]
+        else:
+            raise ValueError("Unknown filter op: " + str(op))
+        expression = term if expression is None else expression & term
+    return expression
+
+
+def load_pbp(seasons, columns=None, filters=None, pbp_dir=PBP_DIR):
+    """Load pbp data for the seasons, downloading only what is missing.
+
+    Only the listed columns are read from disk, and rows are filtered while
+    reading, so memory use depends on what an analysis needs rather than on
+    the ~370 columns in the full table. Columns used in the filters do not
+    need to be in columns.
+    """
+    files = cache_seasons(seasons, pbp_dir)
+    return load_files(files, columns, filters)
+
+
+def stored_seasons(pbp_dir=PBP_DIR):
+    """Seasons that have been saved to the store."""
+    season_dirs = glob.glob(os.path.join(pbp_dir, "pbp_[0-9][0-9][0-9][0-9]"))
+    return sorted(int(os.path.basename(folder)[4:]) for folder in season_dirs)
+
+
+def game_index(seasons=None, pbp_dir=PBP_DIR):
+    """Index of the stored games and where their plays are saved.
+
+    Returns one row per game with game_id, season, week, home_team,
+    away_team, the file and parquet row group holding the game, and the
+    number of plays. The index only reads the parquet file footers, which
+    keep the smallest and largest value of each column in each row group.
+    """
+    if seasons is None:
+        seasons = stored_seasons(pbp_dir)
+    index = []
+    for season in seasons:
+        for file in season_files(season, pbp_dir):
+            metadata = pq.read_metadata(file)
+            col_pos = {
+                metadata.schema.column(i).name: i for i in range(metadata.num_columns)
+            }
+            for row_group in range(metadata.num_row_groups):
+                rg_metadata = metadata.row_group(row_group)
+                game = {}
+                for col in ["game_id", "season", "week", "home_team", "away_team"]:
+                    stats = rg_metadata.column(col_pos[col]).statistics
+                    game[col] = stats.min
+                    if col == "game_id" and stats.min != stats.max:
+                        raise ValueError(
+                            file
+                            + " holds more than one game per row group;"
+                            + " save the season again to index it."
+                        )
+                game["file"] = file
+                game["row_group"] = row_group
+                game["n_plays"] = rg_metadata.num_rows
+                index.append(game)
+    return pd.DataFrame(index)
+
+
+def load_game(
+    game_id=None,
+    season=None,
+    week=None,
+    home_team=None,
+    away_team=None,
+    columns=None,
+    pbp_dir=PBP_DIR,
+):
+    """Load the plays of the games matching all of the given criteria.
+
+    For example load_game(season=2020, home_team="GB", away_team="DET") or
+    load_game("2020_02_DET_GB"). Only the row groups holding the matching
+    games are read, not the rest of the season.
+    """
+    if season is not None:
+        seasons = [season]
+    elif game_id is not None:
+        seasons = [int(game_id[:4])]
+    else:
+        seasons = stored_seasons(pbp_dir)
+    cache_seasons(seasons, pbp_dir)
+    games = game_index(seasons, pbp_dir)
+    criteria = {
+        "game_id": game_id,
+        "week": week,
+        "home_team": home_team,
+        "away_team": away_team,
+    }
+    for col, value in criteria.items():
+        if value is not None:
+            games = games[games[col] == value]
+    if len(games) == 0:
+        raise ValueError("No stored game matches " + str(criteria))
+    game_tables = [
+        pq.ParquetFile(file).read_row_group(row_group, columns=columns)
+        for file, row_group in zip(games["file"], games["row_group"])
+    ]
+    game_table = pa.concat_tables(game_tables, promote_options="permissive")
+    return game_table.to_pandas()
+
+
+def pbp_columns(seasons, pbp_dir=PBP_DIR):
+    """Names of the columns stored for the seasons."""
+    return files_schema(cache_seasons(seasons, pbp_dir)).names
+
+
+def files_schema(files):
+    """Combined schema of stored pbp parquet files.
+
+    Weeks can differ slightly in their column types (for example a column
+    that is all missing in one week), so the file schemas are unified.
+    """
+    return pa.unify_schemas(
+        [pq.read_schema(file) for file in files], promote_options="permissive"
+    )
+
+
+def load_files(files, columns=None, filters=None):
+    """Read columns and rows from a list of stored pbp parquet files."""
+    schema = files_schema(files)
+    if filters is not None:
+        filters = filter_expression(filters)
+    pbp_table = ds.dataset(files, schema=schema, format="parquet").to_table(
+        columns=columns, filter=filters
+    )
+    return pbp_table.to_pandas()
@@ -0,0 +1,57 @@
+## Download play-by-play (pbp) seasons from nflverse in parallel
+## Each season is handed to a save function as soon as it arrives, so an
+## interrupted download only needs to fetch the seasons that did not finish.
+import io
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+
+# nflverse publishes one parquet file per season; change this to point at
+# a mirror or a local file server (for example python -m http.server)
+PBP_URL = (
+    "https://github.com/nflverse/nflverse-data/releases/download/pbp/"
+    + "play_by_play_{season}.parquet"
+)
+
+
+def download_season(season, url=PBP_URL, timeout=120):
+    """Download one season of pbp data and return it as a data frame."""
+    with urllib.request.urlopen(url.format(season=season), timeout=timeout) as response:
+        pbp_bytes = response.read()
+    return pd.read_parquet(io.BytesIO(pbp_bytes))
+
+
+def fetch_and_save(season, save, url=PBP_URL):
+    """Download one season and pass it to save(pbp_season, season)."""
+    save(download_season(season, url), season)
+    return season
+
+
+def fetch_seasons(seasons, save, url=PBP_URL, max_workers=4):
+    """Download seasons in parallel and save each one as soon as it arrives.
+
+    save(pbp_season, season) is called from the worker threads. At most
+    max_workers seasons are downloaded at once. If any season fails the
+    others still finish and are saved, and a RuntimeError listing the failed
+    seasons is raised at the end; running again only fetches those seasons.
+    """
+    failed = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(fetch_and_save, season, save, url): season for season in seasons
+        }
+        for future in as_completed(futures):
+            season = futures[future]
+            try:
+                future.result()
+                print(str(season) + " done.")
+            except Exception as error:
+                failed[season] = error
+    if len(failed) > 0:
+        raise RuntimeError(
+            "Failed to download seasons "
+            + ", ".join(str(season) for season in sorted(failed))
+            + " ("
+            + "; ".join(str(error) for error in failed.values())
+            + "). Run again to download only the missing seasons."
+        )
@@ -0,0 +1,193 @@
+## Split the wide pbp table into a play-level table plus dimension tables
+## Every pbp row repeats game-level columns (home_team, total_line, ...) and
+## player names next to player IDs. Here they are stored once per game and
+## once per player, in the same way Appendix C joins schedule and city_data.
+## The tables are only built in memory: the store in ./data/pbp/ keeps the
+## wide table, so this does not reduce what is stored or what load_pbp()
+## reads. Memory is saved by holding the slim tables instead of the wide
+## pbp data, or by reading just the game columns with load_games(), as
+## Chapter 6 does.
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+from pbp_data import load_pbp, pbp_columns
+
+# columns with one value per game
+# season and week are also kept on the plays table as compact filter keys
+GAME_COLUMNS = [
+    "game_id",
+    "old_game_id",
+    "season",
+    "week",
+    "season_type",
+    "game_date",
+    "start_time",
+    "home_team",
+    "away_team",
+    "home_score",
+    "away_score",
+    "location",
+    "result",
+    "total",
+    "spread_line",
+    "total_line",
+    "div_game",
+    "roof",
+    "surface",
+    "temp",
+    "wind",
+    "home_coach",
+    "away_coach",
+    "stadium_id",
+    "game_stadium",
+]
+
+# player ID columns and the name column that goes with each of them
+PLAYER_COLUMNS = {
+    "passer_id": "passer",
+    "rusher_id": "rusher",
+    "receiver_id": "receiver",
+}
+
+
+def game_table(pbp):
+    """One row per game with the game-level columns in pbp."""
+    cols = [col for col in GAME_COLUMNS if col in pbp.columns]
+    games = pbp[cols].drop_duplicates("game_id").reset_index(drop=True)
+    games["game_id"] = games["game_id"].astype(str)
+    return games
+
+
+def player_table(pbp):
+    """One row per player ID with the player's name.
+
+    If a player's name is spelled more than one way, the most common
+    spelling is used.
+    """
+    players = []
+    for id_col, name_col in PLAYER_COLUMNS.items():
+        if id_col in pbp.columns and name_col in pbp.columns:
+            player_names = pbp[[id_col, name_col]].dropna()
+            player_names.columns = ["player_id", "player_name"]
+            players.append(player_names.astype({"player_name": str}))
+    players = pd.concat(players, ignore_index=True)
+    players = (
+        players.groupby(["player_id", "player_name"])
+        .size()
+        .reset_index(name="n")
+        .sort_values(["player_id", "n"], ascending=[True, False])
+        .drop_duplicates("player_id")
+    )
+    return players[["player_id", "player_name"]].reset_index(drop=True)
+
+
+def team_table(games):
+    """One row per team with the seasons the team appears in."""
+    teams = pd.concat(
+        [
+            games[["home_team", "season"]].rename(columns={"home_team": "team"}),
+            games[["away_team", "season"]].rename(columns={"away_team": "team"}),
+        ]
+    ).astype({"team": str})
+    teams = teams.groupby("team").agg({"season": ["min", "max", "count"]})
+    teams.columns = ["first_season", "last_season", "n_games"]
+    return teams.reset_index()
+
+
+def play_table(pbp):
+    """The plays without game-level columns and player names."""
+    drop_cols = [
+        col for col in GAME_COLUMNS if col not in ["game_id", "season", "week"]
+    ]
+    drop_cols += list(PLAYER_COLUMNS.values())
+    return pbp.drop(columns=[col for col in drop_cols if col in pbp.columns])
+
+
+def build_tables(pbp):
+    """Split pbp into a dict of "plays", "games", "players" and "teams" tables."""
+    games = game_table(pbp)
+    return {
+        "plays": play_table(pbp),
+        "games": games,
+        "players": player_table(pbp),
+        "teams": team_table(games),
+    }
+
+
+def load_games(seasons, columns=None):
+    """Load the games table for the seasons without reading any play columns.
+
+    columns defaults to all game-level columns that are stored; game_id is
+    always included.
+    """
+    stored = pbp_columns(seasons)
+    if columns is None:
+        columns = GAME_COLUMNS
+    columns = ["game_id"] + [col for col in columns if col != "game_id"]
+    return game_table(
+        load_pbp(seasons, columns=[col for col in columns if col in stored])
+    )
+
+
+def load_tables(seasons):
+    """Load the play, game, player and team tables for the seasons.
+
+    The tables are built one season at a time, so the full-width pbp data
+    for all seasons is never in memory at once.
+    """
+    tables = [build_tables(load_pbp([season])) for season in seasons]
+    plays = pd.concat([table["plays"] for table in tables], ignore_index=True)
+    games = pd.concat([table["games"] for table in tables], ignore_index=True)
+    for col in plays.columns:
+        if isinstance(tables[0]["plays"][col].dtype, pd.CategoricalDtype):
+            plays[col] = plays[col].astype("category")
+    players = pd.concat([table["players"] for table in tables], ignore_index=True)
+    return {
+        "plays": plays,
+        "games": games,
+        "players": players.drop_duplicates("player_id", keep="last"),
+        "teams": team_table(games),
+    }
+
+
+def join_pbp(tables, columns=None):
+    """Re-join game columns and player names onto the plays.
+
+    Returns the plays with the requested columns (all columns by default),
+    looking up game-level columns by game_id and names by player ID.
+    """
+    plays = tables["plays"]
+    games = tables["games"]
+    if columns is None:
+        columns = list(plays.columns) + [
+            col for col in games.columns if col not in plays.columns
+        ]
+        columns += [
+            name for id_col, name in PLAYER_COLUMNS.items() if id_col in plays.columns
+        ]
+    pbp = plays[[col for col in columns if col in plays.columns]].copy()
+
+    ## look up game columns by the position of each play's game in games
+    ## (-1 for plays whose game_id is missing or not in games)
+    game_cols = [
+        col for col in columns if col in games.columns and col not in plays.columns
+    ]
+    if len(game_cols) > 0:
+        game_index = pd.Index(games["game_id"])
+        if isinstance(plays["game_id"].dtype, pd.CategoricalDtype):
+            codes = plays["game_id"].cat.codes.to_numpy()
+            game_pos = game_index.get_indexer(plays["game_id"].cat.categories)
+            game_pos = np.where(codes >= 0, game_pos[codes], -1)
+        else:
+            game_pos = game_index.get_indexer(plays["game_id"])
+        for col in game_cols:
+            ## allow_fill gives missing values where game_pos is -1, instead
+            ## of counting back from the last game
+            pbp[col] = take(games[col].array, game_pos, allow_fill=True)
+
+    ## look up names by player ID
+    player_names = tables["players"].set_index("player_id")["player_name"]
+    for id_col, name_col in PLAYER_COLUMNS.items():
+        if name_col in columns and id_col in plays.columns:
+            pbp[name_col] = plays[id_col].map(player_names).astype("category")
+    return pbp[[col for col in columns if col in pbp.columns]]
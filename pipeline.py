@@ -0,0 +1,184 @@
+## Run analysis steps as named stages with saved (memoized) outputs
+## Each stage declares the stages it uses as inputs. A stage's output is
+## saved in ./data/pipeline/ under a key made from the stage's code (with
+## the code of the helper modules it calls, see source_hash.py), its
+## parameters, any files it watches and the keys of its inputs, so a stage
+## only runs again when something it depends on has changed. Outputs saved
+## under older keys are removed after each run.
+## Stages that do not depend on each other run at the same time, in threads
+## of this process, so that outputs are passed on without copying. Python
+## code in a stage holds the GIL, so only the work that releases it (reading
+## parquet files, numpy and the linear algebra of model fits) overlaps;
+## a stage that needs several CPUs should use parallel_map() (parallel.py)
+## itself.
+import glob
+import hashlib
+import os
+import pickle
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from source_hash import source_hash
+
+PIPELINE_DIR = "./data/pipeline"
+
+
+class Pipeline:
+    """A set of named stages that can be run with run().
+
+    Stages are added with the stage() decorator:
+
+        pipeline = Pipeline()
+
+        @pipeline.stage("runs", inputs=["pbp"])
+        def runs(pbp):
+            return pbp.query('play_type == "run"')
+
+    Each input is passed to the stage function as a keyword argument with
+    the input stage's name, followed by the stage's params.
+    """
+
+    def __init__(self, cache_dir=PIPELINE_DIR):
+        self.cache_dir = cache_dir
+        self.stages = {}
+
+    def stage(self, name, inputs=(), params=None, watch=()):
+        """Decorator that adds a function as a stage.
+
+        watch lists file patterns (for example "./data/pbp/*/*.parquet")
+        whose names, sizes and modification times are part of the stage's
+        key, so the stage runs again when the files change.
+        """
+
+        def add_stage(func):
+            self.stages[name] = {
+                "func": func,
+                "inputs": list(inputs),
+                "params": dict(params or {}),
+                "watch": list(watch),
+            }
+            return func
+
+        return add_stage
+
+    def stage_keys(self):
+        """Key of every stage, which changes whenever the stage must rerun:
+        when its code or the code it calls, its params, its watched files or
+        the key of any of its inputs change."""
+        keys = {}
+        for name in self.run_order(list(self.stages)):
+            stage = self.stages[name]
+            key_parts = [name, source_hash(stage["func"]), repr(stage["params"])]
+            for pattern in stage["watch"]:
+                for file in sorted(glob.glob(pattern)):
+                    file_stat = os.stat(file)
+                    key_parts.append(
+                        file + str(file_stat.st_size) + str(file_stat.st_mtime_ns)
+                    )
+            key_parts += [keys[input_name] for input_name in stage["inputs"]]
+            keys[name] = hashlib.sha256("\n".join(key_parts).encode()).hexdigest()
+        return keys
+
+    def run_order(self, targets):
+        """Stages needed for targets, each listed after all of its inputs."""
+        order = []
+
+        def visit(name, path):
+            if name in path:
+                raise ValueError("Stages depend on each other: " + " -> ".join(path))
+            if name not in order:
+                for input_name in self.stages[name]["inputs"]:
+                    visit(input_name, path + [name])
+                order.append(name)
+
+        for name in targets:
+            visit(name, [])
+        return order
+
+    def cache_file(self, name, key):
+        return os.path.join(self.cache_dir, name + "_" + key[:16] + ".pkl")
+
+    def remove_old(self, keys=None):
+        """Remove outputs of this pipeline's stages saved under other keys.
+
+        keys defaults to stage_keys(). Files of stages that are not in this
+        pipeline are left alone.
+        """
+        if keys is None:
+            keys = self.stage_keys()
+        for name in self.stages:
+            pattern = os.path.join(self.cache_dir, glob.escape(name) + "_*.pkl")
+            for cache_file in glob.glob(pattern):
+                ## "ryoe_*.pkl" also matches the files of "ryoe_stability"
+                if not re.fullmatch(
+                    re.escape(name) + r"_[0-9a-f]{16}\.pkl",
+                    os.path.basename(cache_file),
+                ):
+                    continue
+                if cache_file != self.cache_file(name, keys[name]):
+                    os.remove(cache_file)
+
+    def run(self, targets=None, max_workers=4, force=()):
+        """Run the stages needed for targets (all stages by default).
+
+        Stages with a saved output for their current key are not run; their
+        saved output is only loaded if a stage that does run needs it. Stages
+        listed in force, and the stages that use their outputs, run even if
+        they have a saved output. Returns a dict with the output of each
+        target.
+
+        Up to max_workers stages run at once, in threads (see the note at
+        the top of pipeline.py).
+        """
+        if targets is None:
+            targets = list(self.stages)
+        keys = self.stage_keys()
+        order = self.run_order(targets)
+        forced = set(force)
+        to_run = []
+        for name in order:
+            if any(input_name in forced for input_name in self.stages[name]["inputs"]):
+                forced.add(name)
+            if name in forced or not os.path.isfile(self.cache_file(name, keys[name])):
+                to_run.append(name)
+        outputs = {}
+
+        def load_output(name):
+            if name not in outputs:
+                with open(self.cache_file(name, keys[name]), "rb") as cache:
+                    outputs[name] = pickle.load(cache)
+            return outputs[name]
+
+        def run_stage(name):
+            stage = self.stages[name]
+            kwargs = {input_name: outputs[input_name] for input_name in stage["inputs"]}
+            output = stage["func"](**kwargs, **stage["params"])
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_file = self.cache_file(name, keys[name]) + ".tmp"
+            with open(tmp_file, "wb") as cache:
+                pickle.dump(output, cache)
+            os.replace(tmp_file, self.cache_file(name, keys[name]))
+            return output
+
+        ## run each stage as soon as all of its inputs are available
+        waiting = list(to_run)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while len(waiting) > 0 or len(running) > 0:
+                for name in list(waiting):
+                    inputs = self.stages[name]["inputs"]
+                    if all(input_name not in waiting for input_name in inputs) and all(
+                        input_name not in running.values() for input_name in inputs
+                    ):
+                        for input_name in inputs:
+                            if input_name not in to_run:
+                                load_output(input_name)
+                        running[pool.submit(run_stage, name)] = name
+                        waiting.remove(name)
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    outputs[name] = future.result()
+                    print(name + " done.")
+        results = {name: load_output(name) for name in targets}
+        self.remove_old(keys)
+        return results
@@ -0,0 +1,140 @@
+## One-step player value models: RYOE and CPOE with player effects
+## Chapters 4 and 5 fit a league model and then average each player's
+## residuals. Here each player (and optionally each team or defense) gets
+## their own column in the model, fit together with the situation
+## variables. The player columns are one-hot, so the design matrix is kept
+## sparse and solved with LSMR, an iterative least-squares solver, with
+## optional ridge shrinkage of the player effects toward zero. Completion
+## models are fit by IRLS with one sparse solve per step.
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import lsmr
+from fitting import FAMILIES, build_design, family_deviance
+
+
+def effect_columns(data, effects):
+    """Sparse one-hot columns of each effect of data.
+
+    Each effect is a column name or a list of column names, for example
+    "rusher_id" or ["season", "rusher_id"] for a rusher's season. Returns
+    the (rows x levels) matrix and a dict with a data frame of each
+    effect's levels (key columns and number of plays n), named like
+    "season:rusher_id".
+    """
+    matrices = []
+    levels = {}
+    for effect in effects:
+        keys = [effect] if isinstance(effect, str) else list(effect)
+        groups = data.groupby(keys, observed=True, sort=True)
+        codes = groups.ngroup().to_numpy()
+        matrices.append(
+            sparse.csr_matrix(
+                (np.ones(len(data)), (np.arange(len(data)), codes)),
+                shape=(len(data), groups.ngroups),
+            )
+        )
+        levels[":".join(keys)] = groups.size().rename("n").reset_index()
+    return sparse.hstack(matrices, format="csr"), levels
+
+
+def solve_sparse(A, y, scale, n_fixed, ridge, x0=None, tol=1e-10):
+    """Least-squares coefficients of A (columns divided by scale), with
+    ridge * sum(coefficient ** 2) added for the columns after n_fixed."""
+    n_effects = A.shape[1] - n_fixed
+    if ridge > 0:
+        ## ridge as extra rows: sqrt(ridge) * coefficient should be zero
+        penalty = sparse.hstack(
+            [
+                sparse.csr_matrix((n_effects, n_fixed)),
+                sparse.diags(np.sqrt(ridge) / scale[n_fixed:]),
+            ]
+        )
+        A = sparse.vstack([A, penalty], format="csr")
+        y = np.concatenate([y, np.zeros(n_effects)])
+    if x0 is not None:
+        x0 = x0 * scale
+    scaled = lsmr(A, y, atol=tol, btol=tol, maxiter=10 * A.shape[1], x0=x0)[0]
+    return scaled / scale
+
+
+class EffectsFit:
+    """Situation coefficients and player effects fit by fit_effects().
+
+    effects has a data frame for each effect (for example
+    effects["season:rusher_id"]) with the key columns, the number of plays
+    n and the estimate.
+    """
+
+    def __init__(self, params, effects, fittedvalues, y):
+        self.params = params
+        self.effects = effects
+        self.fittedvalues = fittedvalues
+        self.resid = pd.Series(y - fittedvalues.to_numpy(), index=fittedvalues.index)
+
+
+def fit_effects(
+    formula,
+    data,
+    effects=("rusher_id",),
+    family=None,
+    ridge=0.0,
+    max_iter=25,
+    tol=1e-8,
+):
+    """Fit formula plus a one-hot effect for each level of each of effects.
+
+    Least squares if family is None (effects in yards, for RYOE) or
+    "binomial" (effects on the log-odds scale, for CPOE). ridge shrinks
+    the effects toward zero, more so for players with few plays. Each
+    effect's estimates are centered to a play-weighted mean of zero (the
+    mean goes into the intercept), so they are relative to an average
+    player. Returns an EffectsFit.
+    """
+    y, X, index, spec = build_design(formula, data)
+    onehot, levels = effect_columns(data.loc[index], effects)
+    A = sparse.hstack([sparse.csr_matrix(X), onehot], format="csr")
+    n_fixed = X.shape[1]
+    ## LSMR converges faster on columns of equal length
+    scale = np.sqrt(np.asarray(A.multiply(A).sum(axis=0))).ravel()
+    scale[scale == 0] = 1
+    A = A @ sparse.diags(1 / scale)
+    if family is None:
+        coefs = solve_sparse(A, y, scale, n_fixed, ridge)
+        eta = A @ (coefs * scale)
+        fitted = eta
+    else:
+        funcs = FAMILIES[family]
+        eta = funcs["link_of"](funcs["start"](y))
+        coefs = None
+        deviance = np.inf
+        for _ in range(max_iter):
+            mu = funcs["mean"](eta)
+            weight = funcs["weight"](mu)
+            root_weight = np.sqrt(weight)
+            coefs = solve_sparse(
+                sparse.diags(root_weight) @ A,
+                (eta + (y - mu) / weight) * root_weight,
+                scale,
+                n_fixed,
+                ridge,
+                x0=coefs,
+            )
+            eta = A @ (coefs * scale)
+            new_deviance = family_deviance(family, y, funcs["mean"](eta))
+            if abs(deviance - new_deviance) <= tol * (abs(new_deviance) + tol):
+                break
+            deviance = new_deviance
+        fitted = funcs["mean"](eta)
+    params = pd.Series(coefs[:n_fixed], index=spec["column_names"])
+    start = n_fixed
+    for effect_levels in levels.values():
+        estimates = coefs[start : start + len(effect_levels)]
+        start += len(effect_levels)
+        ## move the effect's play-weighted mean into the intercept
+        if "Intercept" in params.index:
+            mean = np.average(estimates, weights=effect_levels["n"])
+            estimates = estimates - mean
+            params["Intercept"] += mean
+        effect_levels["estimate"] = estimates
+    return EffectsFit(params, levels, pd.Series(fitted, index=index), y)
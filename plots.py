@@ -0,0 +1,284 @@
+## Plotting modes for running the chapter files on servers
+## The chapters import sns and plt from here. The FOOTBALL_PLOTS environment
+## variable picks what the plotting calls do:
+##   show  (default) the real seaborn and matplotlib, as in the book
+##   defer plotting calls are only recorded while the numbers are computed;
+##         render_plots() then draws the recorded figures in a process pool
+##         (see parallel.py) and saves them to ./figures/ (or to the file
+##         given to savefig)
+##   skip  plotting calls do nothing
+## For example: FOOTBALL_PLOTS=defer python 04_Multiple_Regression.py
+## Setting FOOTBALL_BINNED_PLOTS=1 also draws the scatterplots of every play
+## made with play_scatterplot() as binned counts (see binned_plot()).
+import os
+import sys
+import numpy as np
+import pandas as pd
+from parallel import parallel_map
+
+PLOT_MODE = os.environ.get("FOOTBALL_PLOTS", "show")
+BINNED_PLOTS = os.environ.get("FOOTBALL_BINNED_PLOTS", "0") == "1"
+FIGURES_DIR = "./figures"
+
+# seaborn calls that change settings for all later figures
+SETTINGS_CALLS = ["set", "set_theme", "set_style", "set_palette", "set_context"]
+
+# matplotlib calls that finish a figure
+FINISH_CALLS = ["show", "close"]
+
+
+class Ref:
+    """Reference to a module ("sns" or "plt") or to the result of a recorded
+    call, plus the attribute names looked up on it."""
+
+    def __init__(self, target, path=()):
+        self.target = target
+        self.path = tuple(path)
+
+
+class Recorder:
+    """Collects plotting calls into one list of steps per figure."""
+
+    def __init__(self, record=True):
+        self.record = record
+        self.settings = []
+        self.steps = []
+        self.figures = []
+        self.n_results = 0
+
+    def add_step(self, ref, args, kwargs):
+        if not self.record:
+            return None
+        result = self.n_results
+        self.n_results += 1
+        step = (ref, args, kwargs, result)
+        self.steps.append(step)
+        if ref.target == "sns" and ref.path[-1] in SETTINGS_CALLS:
+            self.settings.append(step)
+        if ref.target == "plt" and ref.path[-1] in FINISH_CALLS:
+            self.finish_figure()
+        return result
+
+    def finish_figure(self):
+        """Store the steps since the last finished figure as one figure.
+
+        The figure starts with the settings calls made before it, so it is
+        drawn with the same theme as in the book.
+        """
+        setting_results = [step[3] for step in self.settings]
+        step_results = [step[3] for step in self.steps]
+        if any(result not in setting_results for result in step_results):
+            settings_before = [
+                step for step in self.settings if step[3] not in step_results
+            ]
+            self.figures.append(slim_figure(settings_before + self.steps))
+        self.steps = []
+
+
+class Recording:
+    """Stand-in for seaborn, matplotlib.pyplot and the objects they return."""
+
+    def __init__(self, recorder, ref):
+        self._recorder = recorder
+        self._ref = ref
+
+    def __getattr__(self, name):
+        return Recording(
+            self._recorder, Ref(self._ref.target, self._ref.path + (name,))
+        )
+
+    def __call__(self, *args, **kwargs):
+        args = [to_ref(arg) for arg in args]
+        kwargs = {key: to_ref(value) for key, value in kwargs.items()}
+        result = self._recorder.add_step(self._ref, args, kwargs)
+        return Recording(self._recorder, Ref(result))
+
+
+def to_ref(value):
+    if isinstance(value, Recording):
+        return value._ref
+    return value
+
+
+def slim_figure(steps):
+    """Keep only the data frame columns that a figure's steps mention."""
+    names = set()
+    for ref, args, kwargs, result in steps:
+        for value in list(args) + list(kwargs.values()):
+            if isinstance(value, str):
+                names.add(value)
+            elif isinstance(value, (list, tuple)):
+                names.update(item for item in value if isinstance(item, str))
+    slim_steps = []
+    for ref, args, kwargs, result in steps:
+        slim_kwargs = {}
+        for key, value in kwargs.items():
+            if isinstance(value, pd.DataFrame) and names & set(value.columns):
+                value = value[[col for col in value.columns if col in names]]
+            slim_kwargs[key] = value
+        slim_args = [
+            (
+                arg[[col for col in arg.columns if col in names]]
+                if isinstance(arg, pd.DataFrame) and names & set(arg.columns)
+                else arg
+            )
+            for arg in args
+        ]
+        slim_steps.append((ref, slim_args, slim_kwargs, result))
+    return slim_steps
+
+
+def play_scatterplot(
+    data,
+    x,
+    y,
+    fit=None,
+    bins=100,
+    logistic=False,
+    scatter_kws=None,
+    line_kws=None,
+    **kwargs,
+):
+    """Scatterplot of every play, drawn as binned counts for large data.
+
+    Normally this is sns.scatterplot() (if fit is None) or sns.regplot()
+    (otherwise) with the other arguments passed on; regplot() fits its own
+    least-squares (or with logistic=True, logistic) line of y on x, which is
+    the line of a fitted model passed as fit when x is its only input.
+    With FOOTBALL_BINNED_PLOTS=1 it is binned_plot() instead, whose drawing
+    time does not grow with the number of plays. There are no points to
+    style then, so scatter_kws is not used, and other seaborn arguments
+    raise a TypeError rather than being dropped.
+    """
+    if BINNED_PLOTS:
+        if len(kwargs) > 0:
+            raise TypeError(
+                "binned_plot() does not take the arguments: " + ", ".join(kwargs)
+            )
+        return binned_plot(data, x, y, fit, bins, line_kws, logistic)
+    if fit is None:
+        return sns.scatterplot(data=data, x=x, y=y, **(scatter_kws or {}), **kwargs)
+    return sns.regplot(
+        data=data,
+        x=x,
+        y=y,
+        logistic=logistic,
+        scatter_kws=scatter_kws,
+        line_kws=line_kws,
+        **kwargs,
+    )
+
+
+def binned_plot(data, x, y, fit=None, bins=100, line_kws=None, logistic=False):
+    """Plot the number of plays in each bin of x and y, plus a trend line.
+
+    The counts are computed with numpy and drawn as one raster image, so
+    only the bins are drawn however many plays there are. bins is the
+    number of bins for both x and y or a pair (x bins, y bins). The trend
+    line is
+      fit=True              the least-squares line of y on x, as drawn by
+                            sns.regplot(), or with logistic=True the
+                            logistic regression curve
+      a fitted model        the model's predictions, for example from
+                            smf.glm(...).fit() with x as its only input
+      a function            fit(x values) gives the line's y values
+    """
+    x_values = data[x].to_numpy(dtype=float, na_value=np.nan)
+    y_values = data[y].to_numpy(dtype=float, na_value=np.nan)
+    keep = np.isfinite(x_values) & np.isfinite(y_values)
+    x_values = x_values[keep]
+    y_values = y_values[keep]
+    counts, x_edges, y_edges = np.histogram2d(x_values, y_values, bins=bins)
+    counts[counts == 0] = np.nan
+    plt.pcolormesh(
+        x_edges, y_edges, counts.T, cmap="Blues", norm="log", rasterized=True
+    )
+    plt.colorbar(label="Number of plays")
+    if fit is not None:
+        x_line = np.linspace(x_edges[0], x_edges[-1], 200)
+        if fit is True and logistic:
+            from fitting import fit_irls
+
+            X = np.column_stack([np.ones(len(x_values)), x_values])
+            (intercept, slope), _ = fit_irls(X, y_values, "binomial")
+            y_line = 1 / (1 + np.exp(-(intercept + slope * x_line)))
+        elif fit is True:
+            slope, intercept = np.polyfit(x_values, y_values, 1)
+            y_line = intercept + slope * x_line
+        elif hasattr(fit, "predict"):
+            y_line = np.asarray(fit.predict(pd.DataFrame({x: x_line})))
+        else:
+            y_line = fit(x_line)
+        plt.plot(x_line, y_line, **(line_kws or {"color": "red"}))
+    plt.xlabel(x)
+    plt.ylabel(y)
+
+
+def draw_figure(steps, out_file):
+    """Replay the recorded steps of one figure and save it to out_file."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt_real
+    import seaborn as sns_real
+
+    ## start from the default settings, as in a new process, since figures
+    ## are drawn one after another in this process where fork is not used
+    matplotlib.rc_file_defaults()
+    objects = {"sns": sns_real, "plt": plt_real}
+    saved = False
+
+    def resolve(value):
+        if isinstance(value, Ref):
+            obj = objects[value.target]
+            for name in value.path:
+                obj = getattr(obj, name)
+            return obj
+        return value
+
+    for ref, args, kwargs, result in steps:
+        if ref.target == "plt" and ref.path[-1] == "show":
+            break
+        if ref.target == "plt" and ref.path[-1] == "savefig":
+            saved = True
+        func = resolve(ref)
+        objects[result] = func(
+            *[resolve(arg) for arg in args],
+            **{key: resolve(value) for key, value in kwargs.items()},
+        )
+    if not saved and len(plt_real.get_fignums()) > 0:
+        plt_real.savefig(out_file)
+    plt_real.close("all")
+    return out_file
+
+
+def render_plots(max_workers=4):
+    """Draw the figures recorded in defer mode; does nothing in other modes.
+
+    Each figure is drawn in a separate process where possible. Figures
+    that were not saved with savefig are saved as
+    ./figures/<script name>_<number>.png.
+    """
+    if PLOT_MODE != "defer":
+        return []
+    recorder.finish_figure()
+    os.makedirs(FIGURES_DIR, exist_ok=True)
+    script = os.path.splitext(os.path.basename(sys.argv[0]))[0] or "figure"
+    out_files = [
+        os.path.join(FIGURES_DIR, script + "_%02d.png" % (i + 1))
+        for i in range(len(recorder.figures))
+    ]
+    drawn = parallel_map(draw_figure, zip(recorder.figures, out_files), max_workers)
+    recorder.figures = []
+    return drawn
+
+
+if PLOT_MODE == "show":
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+elif PLOT_MODE in ["defer", "skip"]:
+    recorder = Recorder(record=PLOT_MODE == "defer")
+    sns = Recording(recorder, Ref("sns"))
+    plt = Recording(recorder, Ref("plt"))
+else:
+    raise ValueError("FOOTBALL_PLOTS must be show, defer or skip, not " + PLOT_MODE)
@@ -0,0 +1,106 @@
+## Fair prices for player prop bets from Poisson expectations
+## Chapter 6 models a passer's touchdowns in a game as Poisson with the
+## expected count from a regression. The probability of every count, and of
+## the over and under for every line, is computed for all passers at once
+## as one matrix, then turned into fair decimal and American odds.
+import numpy as np
+import pandas as pd
+
+
+def count_probabilities(expected, max_count=6):
+    """Poisson probability of each count from 0 to max_count or more.
+
+    expected is one expected count per player-market. Returns a data frame
+    with columns p_0, p_1, ..., p_<max_count - 1> and p_<max_count>_plus,
+    with the index of expected if it is a Series.
+    """
+    index = expected.index if isinstance(expected, pd.Series) else None
+    probs = poisson_matrix(np.asarray(expected, dtype=float), max_count - 1)
+    probs = np.column_stack([probs, np.clip(1 - probs.sum(axis=1), 0, 1)])
+    columns = ["p_%d" % count for count in range(max_count)]
+    return pd.DataFrame(probs, index=index, columns=columns + ["p_%d_plus" % max_count])
+
+
+def poisson_matrix(expected, max_count):
+    """P(count = k) for k = 0 to max_count, one row per expected count.
+
+    Uses P(k) = P(k - 1) * expected / k, so the whole matrix is one
+    cumulative product.
+    """
+    counts = np.arange(1, max_count + 1)
+    ratios = expected[:, np.newaxis] / counts[np.newaxis, :]
+    ratios = np.column_stack([np.ones(len(expected)), ratios])
+    return np.exp(-expected)[:, np.newaxis] * np.cumprod(ratios, axis=1)
+
+
+def decimal_odds(probability):
+    """Fair decimal odds (total returned per 1 staked) of a probability."""
+    with np.errstate(divide="ignore"):
+        return 1 / np.asarray(probability, dtype=float)
+
+
+def american_odds(probability):
+    """Fair American odds: -100 * p / (1 - p) for favorites (p >= 0.5),
+    otherwise 100 * (1 - p) / p."""
+    probability = np.asarray(probability, dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(
+            probability >= 0.5,
+            -100 * probability / (1 - probability),
+            100 * (1 - probability) / probability,
+        )
+
+
+def decimal_from_american(odds):
+    """Decimal odds of American odds, for example -110 is 1.909."""
+    odds = np.asarray(odds, dtype=float)
+    return np.where(odds < 0, 1 + 100 / -odds, 1 + odds / 100)
+
+
+def over_under(expected, line):
+    """Chance of the over, under and push of each row's own line.
+
+    expected and line have one value per row (or line is one number).
+    Returns the three arrays; only whole-number lines can push.
+    """
+    expected = np.asarray(expected, dtype=float)
+    line = np.broadcast_to(np.asarray(line, dtype=float), expected.shape)
+    ## P(count <= k) for every k up to the largest line
+    cdf = np.cumsum(poisson_matrix(expected, int(line.max(initial=0))), axis=1)
+    rows = np.arange(len(expected))
+    below = np.ceil(line).astype(int) - 1
+    p_under = np.where(below >= 0, cdf[rows, np.maximum(below, 0)], 0.0)
+    p_over = 1 - cdf[rows, np.floor(line).astype(int)]
+    p_push = np.where(line == np.floor(line), 1 - p_over - p_under, 0.0)
+    return p_over, p_under, np.clip(p_push, 0, 1)
+
+
+def price_props(expected, lines=(0.5, 1.5, 2.5)):
+    """Probabilities and fair odds of the over and under of each line.
+
+    Returns one row per expected count and line, indexed by the index of
+    expected (or row number) and the line. Whole-number lines can push
+    (the count equals the line), which is in p_push.
+    """
+    index = expected.index if isinstance(expected, pd.Series) else None
+    expected = np.repeat(np.asarray(expected, dtype=float), len(lines))
+    p_over, p_under, p_push = over_under(
+        expected, np.tile(np.asarray(lines, dtype=float), len(expected) // len(lines))
+    )
+    if index is None:
+        index = pd.RangeIndex(len(expected) // len(lines))
+    props = pd.DataFrame(
+        {
+            "expected": expected,
+            "p_over": p_over,
+            "p_under": p_under,
+            "p_push": p_push,
+        },
+        index=pd.MultiIndex.from_product([index, lines], names=[index.name, "line"]),
+    )
+    ## odds of the over and under among bets that do not push
+    for side in ["over", "under"]:
+        probability = props["p_" + side] / (1 - props["p_push"])
+        props[side + "_decimal"] = decimal_odds(probability)
+        props[side + "_american"] = american_odds(probability)
+    return props
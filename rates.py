@@ -0,0 +1,55 @@
+## Player rates from the games before each week
+## Chapter 6 predicts a game from a player's average over the previous
+## season and the current season up to that week. Sorted by player, season
+## and week, those games are always one run of rows, so every player, season
+## and week's count and mean come from one cumulative sum.
+import numpy as np
+
+
+def prior_rates(games, id_cols, value, seasons, weeks=range(1, 22 + 1)):
+    """Count and mean of value over each player's earlier games.
+
+    games has one row per player (id_cols) and game, with season and week
+    columns. For every season in seasons and week in weeks, the earlier games
+    are all of the previous season's games plus the current season's games
+    before the week. Returns id_cols, n_games, rate (the mean), season and
+    week for each player with at least one earlier game, sorted by season,
+    week and player.
+    """
+    weeks = np.asarray(weeks)
+    seasons = np.asarray(seasons)
+    players = games.groupby(id_cols, observed=True, sort=True)
+    player_codes = players.ngroup().to_numpy()
+    n_players = players.ngroups
+
+    ## one sortable number per player, season and week
+    def game_key(player_code, season, week):
+        return (player_code * 10_000 + season) * 100 + week
+
+    keys = game_key(
+        player_codes,
+        games["season"].to_numpy(dtype=np.int64),
+        games["week"].to_numpy(dtype=np.int64),
+    )
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    values = games[value].to_numpy(dtype=float)[order]
+    total = np.concatenate([[0.0], np.cumsum(values)])
+
+    ## every season, week and player (in that order)
+    season_grid, week_grid, player_grid = [
+        grid.ravel()
+        for grid in np.meshgrid(seasons, weeks, np.arange(n_players), indexing="ij")
+    ]
+    first = np.searchsorted(keys, game_key(player_grid, season_grid - 1, 0))
+    last = np.searchsorted(keys, game_key(player_grid, season_grid, week_grid))
+    n_games = last - first
+    found = n_games > 0
+
+    rates = players.size().reset_index()[id_cols].iloc[player_grid[found]]
+    rates = rates.reset_index(drop=True)
+    rates["n_games"] = n_games[found]
+    rates["rate"] = (total[last[found]] - total[first[found]]) / n_games[found]
+    rates["season"] = season_grid[found]
+    rates["week"] = week_grid[found]
+    return rates
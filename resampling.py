@@ -0,0 +1,146 @@
+## Bootstrap confidence intervals and permutation tests
+## The resampled row numbers for a whole batch of replicates are drawn at
+## once as one numpy array, and the batches are spread over a process pool
+## (see parallel.py).
+## Each batch gets its own seed spawned from the seed passed in, so the
+## results are the same however many processes are used.
+import numpy as np
+import pandas as pd
+from parallel import parallel_map
+
+# rows resampled per batch (replicates x rows), which bounds the memory used
+BATCH_ROWS = 2_000_000
+
+
+def batch_mean(x):
+    """Mean of each replicate (row) of x, skipping missing values."""
+    return np.nanmean(x, axis=-1)
+
+
+def batch_corr(x, y):
+    """Pearson correlation of x and y within each replicate (row)."""
+    x = x - x.mean(axis=-1, keepdims=True)
+    y = y - y.mean(axis=-1, keepdims=True)
+    return (x * y).sum(axis=-1) / np.sqrt((x * x).sum(axis=-1) * (y * y).sum(axis=-1))
+
+
+def resample_batch(kind, statistic, arrays, seed, size):
+    """statistic for size replicates of arrays drawn with seed.
+
+    kind "bootstrap" draws the rows with replacement, the same rows for every
+    array. kind "permutation" shuffles the first array and keeps the others
+    in place, which breaks any link between them.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = len(arrays[0])
+    if kind == "bootstrap":
+        rows = rng.integers(0, n_rows, size=(size, n_rows))
+        return statistic(*[array[rows] for array in arrays])
+    rows = rng.permuted(np.tile(np.arange(n_rows), (size, 1)), axis=1)
+    others = [np.broadcast_to(array, (size, n_rows)) for array in arrays[1:]]
+    return statistic(arrays[0][rows], *others)
+
+
+def resample(kind, statistic, array_sets, n_resamples, seed, max_workers):
+    """Replicates of statistic for each set of arrays, in a process pool."""
+    set_seeds = np.random.SeedSequence(seed).spawn(len(array_sets))
+    tasks = []
+    n_batches = []
+    for arrays, set_seed in zip(array_sets, set_seeds):
+        batch_size = max(1, min(n_resamples, BATCH_ROWS // max(len(arrays[0]), 1)))
+        sizes = [batch_size] * (n_resamples // batch_size)
+        if n_resamples % batch_size > 0:
+            sizes.append(n_resamples % batch_size)
+        tasks += [
+            (kind, statistic, arrays, batch_seed, size)
+            for batch_seed, size in zip(set_seed.spawn(len(sizes)), sizes)
+        ]
+        n_batches.append(len(sizes))
+    results = parallel_map(resample_batch, tasks, max_workers)
+    ends = np.cumsum(n_batches)
+    return [np.concatenate(results[end - n : end]) for n, end in zip(n_batches, ends)]
+
+
+def as_arrays(arrays):
+    return [np.asarray(array, dtype=float) for array in arrays]
+
+
+def bootstrap(statistic, *arrays, n_resamples=10000, seed=0, max_workers=4):
+    """n_resamples bootstrap replicates of statistic(*arrays).
+
+    statistic gets arrays with one replicate per row, for example
+    batch_mean or batch_corr, and returns one value per replicate.
+    """
+    return resample(
+        "bootstrap", statistic, [as_arrays(arrays)], n_resamples, seed, max_workers
+    )[0]
+
+
+def permutation_test(statistic, *arrays, n_resamples=10000, seed=0, max_workers=4):
+    """Observed statistic(*arrays) and its two-sided permutation p-value.
+
+    The p-value is the share of replicates, with the first array shuffled,
+    whose statistic is at least as far from zero as the observed one.
+    """
+    arrays = as_arrays(arrays)
+    observed = statistic(*[array[np.newaxis] for array in arrays])[0]
+    replicates = resample(
+        "permutation", statistic, [arrays], n_resamples, seed, max_workers
+    )[0]
+    p_value = (np.sum(np.abs(replicates) >= np.abs(observed)) + 1) / (n_resamples + 1)
+    return observed, p_value
+
+
+def interval(replicates, level=0.95):
+    """Percentile confidence interval (lower, upper) of the replicates."""
+    tail = (1 - level) / 2 * 100
+    return tuple(np.nanpercentile(replicates, [tail, 100 - tail]))
+
+
+def correlation_interval(x, y, level=0.95, n_resamples=10000, seed=0, max_workers=4):
+    """Correlation of x and y with a bootstrap interval and permutation p-value.
+
+    Pairs with a missing value are left out. Returns a Series with the
+    correlation, the interval's lower and upper bounds and the p-value.
+    """
+    x, y = as_arrays([x, y])
+    paired = np.isfinite(x) & np.isfinite(y)
+    x, y = x[paired], y[paired]
+    replicates = bootstrap(
+        batch_corr, x, y, n_resamples=n_resamples, seed=seed, max_workers=max_workers
+    )
+    corr, p_value = permutation_test(
+        batch_corr, x, y, n_resamples=n_resamples, seed=seed, max_workers=max_workers
+    )
+    lower, upper = interval(replicates, level)
+    return pd.Series(
+        {"corr": corr, "lower": lower, "upper": upper, "p_value": p_value, "n": len(x)}
+    )
+
+
+def group_bootstrap(
+    statistic, data, by, column, level=0.95, n_resamples=10000, seed=0, max_workers=4
+):
+    """Bootstrap interval of statistic(column) within each group of data.
+
+    Every group is resampled on its own, all in the same process pool.
+    Returns a data frame with the by column and the lower and upper bounds.
+    """
+    groups = data.groupby(by, observed=True)[column]
+    names = list(groups.groups)
+    replicates = resample(
+        "bootstrap",
+        statistic,
+        [as_arrays([groups.get_group(name)]) for name in names],
+        n_resamples,
+        seed,
+        max_workers,
+    )
+    bounds = [interval(group_replicates, level) for group_replicates in replicates]
+    return pd.DataFrame(
+        {
+            by: names,
+            "lower": [lower for lower, upper in bounds],
+            "upper": [upper for lower, upper in bounds],
+        }
+    )
@@ -0,0 +1,160 @@
+## Run the RYOE (Chapter 4) and CPOE (Chapter 5) analyses as pipeline stages
+## Only stages whose code, settings or data changed since the last run are
+## recomputed; everything else is loaded from ./data/pipeline/.
+## Run from the repository folder with: python run_pipeline.py
+from fitting import fit_formula
+from pbp_data import PBP_DIR, load_pbp
+from pipeline import Pipeline
+from stability import stability
+
+seasons = list(range(2016, 2022 + 1))
+pipeline = Pipeline()
+
+
+## load data
+@pipeline.stage(
+    "pbp",
+    params={"seasons": seasons},
+    watch=[PBP_DIR + "/pbp_*/week_*.parquet"],
+)
+def pbp(seasons):
+    return load_pbp(
+        seasons,
+        columns=[
+            "season",
+            "play_type",
+            "passer_id",
+            "passer",
+            "rusher_id",
+            "rusher",
+            "rushing_yards",
+            "complete_pass",
+            "air_yards",
+            "down",
+            "ydstogo",
+            "yardline_100",
+            "run_location",
+            "pass_location",
+            "score_differential",
+            "qb_hit",
+        ],
+        filters=[("play_type", "in", ["run", "pass"])],
+    )
+
+
+## filter runs and passes
+@pipeline.stage("runs", inputs=["pbp"])
+def runs(pbp):
+    pbp_run = pbp.query(
+        'play_type == "run" & rusher_id.notnull() &'
+        + "down.notnull() & run_location.notnull()"
+    ).reset_index(drop=True)
+    pbp_run.loc[pbp_run.rushing_yards.isnull(), "rushing_yards"] = 0
+    pbp_run["down"] = pbp_run["down"].astype(str)
+    return pbp_run
+
+
+@pipeline.stage("passes", inputs=["pbp"])
+def passes(pbp):
+    pbp_pass = pbp.query(
+        'play_type == "pass" & passer_id.notnull() & air_yards.notnull()'
+    ).reset_index(drop=True)
+    pbp_pass["down"] = pbp_pass["down"].astype(str)
+    pbp_pass["qb_hit"] = pbp_pass["qb_hit"].astype(str)
+    return pbp_pass[
+        [
+            "passer",
+            "passer_id",
+            "season",
+            "down",
+            "qb_hit",
+            "complete_pass",
+            "ydstogo",
+            "yardline_100",
+            "air_yards",
+            "pass_location",
+        ]
+    ].dropna(axis=0)
+
+
+## fit models
+@pipeline.stage("expected_yards", inputs=["runs"])
+def expected_yards(runs):
+    return fit_formula(
+        "rushing_yards ~ 1 + down + ydstogo + "
+        + "down:ydstogo + yardline_100 + "
+        + "run_location + score_differential",
+        runs,
+    )
+
+
+@pipeline.stage("complete_more", inputs=["passes"])
+def complete_more(passes):
+    return fit_formula(
+        "complete_pass ~ down * ydstogo + "
+        + "yardline_100 + air_yards + "
+        + "pass_location + qb_hit",
+        passes,
+        "binomial",
+    )
+
+
+## player-season summaries
+@pipeline.stage("ryoe", inputs=["runs", "expected_yards"])
+def ryoe(runs, expected_yards):
+    runs = runs.assign(ryoe=expected_yards.resid)
+    ryoe_py = runs.groupby(["season", "rusher_id", "rusher"], observed=True).agg(
+        {"ryoe": ["count", "sum", "mean"], "rushing_yards": ["mean"]}
+    )
+    ryoe_py.columns = list(map("_".join, ryoe_py.columns))
+    ryoe_py.reset_index(inplace=True)
+    return ryoe_py.rename(
+        columns={
+            "ryoe_count": "n",
+            "ryoe_sum": "ryoe_total",
+            "ryoe_mean": "ryoe_per",
+            "rushing_yards_mean": "yards_per_carry",
+        }
+    ).query("n > 50")
+
+
+@pipeline.stage("cpoe", inputs=["passes", "complete_more"])
+def cpoe(passes, complete_more):
+    passes = passes.assign(exp_completion=complete_more.predict())
+    passes["cpoe"] = passes["complete_pass"] - passes["exp_completion"]
+    cpoe_py = passes.groupby(["season", "passer_id", "passer"], observed=True).agg(
+        {
+            "cpoe": ["count", "mean"],
+            "complete_pass": ["mean"],
+            "exp_completion": ["mean"],
+        }
+    )
+    cpoe_py.columns = list(map("_".join, cpoe_py.columns))
+    cpoe_py.reset_index(inplace=True)
+    return cpoe_py.rename(
+        columns={
+            "cpoe_count": "n",
+            "cpoe_mean": "cpoe",
+            "complete_pass_mean": "compl",
+            "exp_completion_mean": "exp_completion",
+        }
+    ).query("n > 100")
+
+
+## year-to-year stability, for each number of seasons apart
+@pipeline.stage("ryoe_stability", inputs=["ryoe"], params={"max_lag": 3})
+def ryoe_stability(ryoe, max_lag):
+    return stability(
+        ryoe, ["rusher_id", "rusher"], ["ryoe_per", "yards_per_carry"], max_lag
+    )
+
+
+@pipeline.stage("cpoe_stability", inputs=["cpoe"], params={"max_lag": 3})
+def cpoe_stability(cpoe, max_lag):
+    return stability(cpoe, ["passer_id", "passer"], ["cpoe", "compl"], max_lag)
+
+
+if __name__ == "__main__":
+    results = pipeline.run(["ryoe_stability", "cpoe_stability"])
+    print(results["ryoe_stability"])
+    print(results["cpoe_stability"])
@@ -0,0 +1,166 @@
+## Score single plays or small batches with saved model coefficients
+## save_model() writes a fitted statsmodels formula model (for example
+## expected_yards_py from Chapter 4) to ./data/models/<name>.json as its
+## coefficients plus how each design column is built from the play's
+## values (see design.py). ScoringService loads each model once and then
+## scores plays without patsy or statsmodels, in microseconds per play. Run
+##   python scoring.py
+## to serve the saved models over HTTP on this computer (see serve()).
+import json
+import os
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+from design import design_matrix, design_spec, level_name, unknown_levels
+
+MODELS_DIR = "./data/models"
+
+# inverse link functions, by statsmodels link class name
+INVERSE_LINKS = {
+    "Identity": lambda eta: eta,
+    "Logit": lambda eta: 1 / (1 + np.exp(-eta)),
+    "Log": np.exp,
+}
+
+
+def model_file(name, models_dir=MODELS_DIR):
+    return os.path.join(models_dir, name + ".json")
+
+
+def model_spec(fit):
+    """Coefficients and column recipes (see design_spec()) of a fitted
+    statsmodels formula model or a fitting.LeanFit."""
+    if hasattr(fit, "spec"):
+        return fit.spec
+    ## statsmodels 0.15 renamed design_info to model_spec
+    design_info = getattr(fit.model.data, "design_info", None)
+    if design_info is None:
+        design_info = fit.model.data.model_spec
+    family = getattr(fit.model, "family", None)
+    return {
+        "outcome": fit.model.endog_names,
+        "link": type(family.link).__name__ if family is not None else "Identity",
+        "coefs": [float(coef) for coef in fit.params],
+        **design_spec(design_info),
+    }
+
+
+def save_model(fit, name, models_dir=MODELS_DIR):
+    """Save a fitted statsmodels formula model (or LeanFit) for scoring
+    under name."""
+    os.makedirs(models_dir, exist_ok=True)
+    out_file = model_file(name, models_dir)
+    with open(out_file + ".tmp", "w") as spec_file:
+        json.dump(model_spec(fit), spec_file)
+    os.replace(out_file + ".tmp", out_file)
+    return out_file
+
+
+class ScoringModel:
+    """A saved model ready to score plays."""
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.coefs = np.array(spec["coefs"])
+        self.columns = [[tuple(part) for part in parts] for parts in spec["columns"]]
+        self.inverse_link = INVERSE_LINKS[spec["link"]]
+        self.variables = sorted({var for parts in self.columns for var, _ in parts})
+
+    def score_play(self, play):
+        """Prediction for one play, a dict of the model's variables.
+
+        Raises ValueError if a categorical variable has a level the model
+        has no column for.
+        """
+        values = {var: play[var] for var in self.variables}
+        for var, known in self.spec["categories"].items():
+            if var in values:
+                values[var] = level_name(values[var])
+                if values[var] not in known:
+                    unknown_levels(var, [values[var]], known)
+        eta = 0.0
+        for coef, parts in zip(self.spec["coefs"], self.columns):
+            term = coef
+            for var, level in parts:
+                if level is None:
+                    term *= values[var]
+                elif values[var] != level:
+                    term = 0.0
+                    break
+            eta += term
+        return float(self.inverse_link(eta))
+
+    def score(self, plays):
+        """Predictions for a batch of plays (a data frame or a dict of
+        equal-length lists), as an array. Faster than score_play() per play
+        for batches of more than a few hundred plays."""
+        return self.inverse_link(design_matrix(self.spec, plays) @ self.coefs)
+
+
+class ScoringService:
+    """Saved models, each loaded from ./data/models/ the first time it is used.
+
+    service = ScoringService()
+    service.predict("expected_yards", {"down": 1, "ydstogo": 10, ...})
+    """
+
+    def __init__(self, models_dir=MODELS_DIR):
+        self.models_dir = models_dir
+        self.models = {}
+
+    def model(self, name):
+        ## only files directly in models_dir can be loaded
+        if not re.match(r"^[\w.-]+$", name) or ".." in name:
+            raise ValueError("Invalid model name " + repr(name))
+        if name not in self.models:
+            with open(model_file(name, self.models_dir)) as spec_file:
+                self.models[name] = ScoringModel(json.load(spec_file))
+        return self.models[name]
+
+    def predict(self, name, plays):
+        """Prediction for one play (a dict of single values) or a list of
+        predictions for a batch (a data frame, or a list of dicts)."""
+        model = self.model(name)
+        if isinstance(plays, dict):
+            return model.score_play(plays)
+        if isinstance(plays, list):
+            return [model.score_play(play) for play in plays]
+        return model.score(plays).tolist()
+
+
+def make_server(port=8050, models_dir=MODELS_DIR):
+    """HTTP server for the saved models (see serve()); port 0 picks a free
+    port, which is in server.server_address."""
+    service = ScoringService(models_dir)
+
+    class ScoringHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            try:
+                length = int(self.headers["Content-Length"])
+                plays = json.loads(self.rfile.read(length))
+                name = self.path[1:] if self.path.startswith("/") else self.path
+                body = json.dumps(service.predict(name, plays))
+                self.send_response(200)
+            except (OSError, KeyError, TypeError, ValueError) as error:
+                body = json.dumps({"error": repr(error)})
+                self.send_response(400)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body.encode())
+
+    return ThreadingHTTPServer(("localhost", port), ScoringHandler)
+
+
+def serve(port=8050, models_dir=MODELS_DIR):
+    """Serve the saved models at http://localhost:<port>/<model name>.
+
+    POST a JSON play (an object) or batch (a list of objects) to get the
+    prediction (a number) or predictions (a list) back as JSON. Bad
+    requests (invalid JSON, unknown models or levels) get a 400 response
+    with the error.
+    """
+    make_server(port, models_dir).serve_forever()
+
+
+if __name__ == "__main__":
+    serve()
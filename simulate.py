@@ -0,0 +1,130 @@
+## Monte Carlo simulation of season totals and parlays from the Poisson model
+## Each simulation draws every game's touchdowns from its expected count
+## (for example exp_pass_td from the Chapter 6 model) and adds them up by
+## group, such as a passer's season. Simulations run in shards, each with
+## its own seeded random stream, spread over a process pool (see
+## parallel.py). Only a count of how often each group reached each total
+## is kept, so memory does not grow with the number of simulations.
+import numpy as np
+import pandas as pd
+from parallel import parallel_map
+
+# draws held in memory at once per shard (simulations x groups and games)
+BATCH_DRAWS = 5_000_000
+
+
+def simulate_shard(group_rates, game_variance, max_total, parlays, n_sims, seed):
+    """Run n_sims simulations and count the totals reached by each group.
+
+    group_rates holds each group's expected total, or with game_variance
+    a (games x groups) array of each group's expected count in each game.
+    Returns a (groups x 0 to max_total) array with the number of simulations
+    in which each group had each total (totals above max_total are counted
+    as max_total), and the number of simulations each parlay won.
+    """
+    rng = np.random.default_rng(seed)
+    n_groups = group_rates.shape[-1]
+    histogram = np.zeros(n_groups * (max_total + 1), dtype=np.int64)
+    parlay_wins = np.zeros(len(parlays), dtype=np.int64)
+    batch_size = max(1, BATCH_DRAWS // group_rates.size)
+    for start in range(0, n_sims, batch_size):
+        size = min(batch_size, n_sims - start)
+        if game_variance > 0:
+            ## gamma game factors with mean 1 make a game's groups move together
+            factors = rng.gamma(
+                1 / game_variance, game_variance, size=(size, group_rates.shape[0])
+            )
+            rates = factors @ group_rates
+        else:
+            rates = np.broadcast_to(group_rates, (size, n_groups))
+        ## a sum of Poisson counts is Poisson with the summed expectation, so
+        ## each group's total is drawn directly instead of game by game
+        totals = rng.poisson(rates)
+        cells = np.arange(n_groups) * (max_total + 1) + np.minimum(totals, max_total)
+        histogram += np.bincount(cells.ravel(), minlength=len(histogram))
+        for i, legs in enumerate(parlays):
+            won = np.ones(size, dtype=bool)
+            for group_code, line in legs:
+                won &= totals[:, group_code] > line
+            parlay_wins[i] += won.sum()
+    return histogram.reshape(n_groups, max_total + 1), parlay_wins
+
+
+def simulate_totals(
+    expected,
+    groups,
+    n_sims=1_000_000,
+    games=None,
+    game_variance=0.0,
+    max_total=80,
+    parlays=(),
+    seed=0,
+    n_shards=16,
+    max_workers=4,
+):
+    """Simulate the total of each group, for example each passer's season.
+
+    expected has one expected count per row (a player's game) and groups
+    the group of each row. With game_variance above 0, games gives each
+    row's game and the rows of a game are scaled by a shared random factor
+    with mean 1 and that variance, which correlates them (for example the
+    passers in a high-scoring game). parlays is a list of parlays, each a list of
+    (group, line) legs that win when the group's total is over the line.
+
+    Returns a data frame with the number of simulations in which each group
+    (row) had each total (column), and a Series with each parlay's chance of
+    winning. The shards' seeds come from seed, so results do not depend on
+    max_workers.
+    """
+    group_codes, group_names = pd.factorize(np.asarray(groups), sort=True)
+    group_names = pd.Index(group_names, name="group")
+    parlay_codes = [
+        [(group_names.get_loc(group), line) for group, line in legs] for legs in parlays
+    ]
+    expected = np.asarray(expected, dtype=float)
+    if game_variance > 0:
+        game_codes, game_names = pd.factorize(np.asarray(games))
+        group_rates = np.zeros((len(game_names), len(group_names)))
+        np.add.at(group_rates, (game_codes, group_codes), expected)
+    else:
+        group_rates = np.bincount(
+            group_codes, weights=expected, minlength=len(group_names)
+        )
+    shard_sizes = [
+        n_sims // n_shards + (shard < n_sims % n_shards) for shard in range(n_shards)
+    ]
+    seeds = np.random.SeedSequence(seed).spawn(n_shards)
+    tasks = [
+        (group_rates, game_variance, max_total, parlay_codes, shard_size, shard_seed)
+        for shard_size, shard_seed in zip(shard_sizes, seeds)
+        if shard_size > 0
+    ]
+    results = parallel_map(simulate_shard, tasks, max_workers)
+    histogram = pd.DataFrame(
+        sum(result[0] for result in results),
+        index=group_names,
+        columns=pd.RangeIndex(max_total + 1, name="total"),
+    )
+    parlay_chances = pd.Series(
+        sum(result[1] for result in results) / n_sims, name="p_win", dtype=float
+    )
+    return histogram, parlay_chances
+
+
+def summarize_totals(histogram, lines=()):
+    """Mean and standard deviation of each group's total, and the chance of
+    going over each line, from the counts made by simulate_totals()."""
+    totals = histogram.columns.to_numpy(dtype=float)
+    counts = histogram.to_numpy(dtype=float)
+    n_sims = counts.sum(axis=1)
+    mean = counts @ totals / n_sims
+    summary = pd.DataFrame(
+        {
+            "mean": mean,
+            "sd": np.sqrt(counts @ totals**2 / n_sims - mean**2),
+        },
+        index=histogram.index,
+    )
+    for line in lines:
+        summary["p_over_" + str(line)] = counts[:, totals > line].sum(axis=1) / n_sims
+    return summary
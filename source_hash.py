@@ -0,0 +1,87 @@
+## Hashes of the code that a function or module runs
+## Saved outputs (fits in fit_cache.py, stages in pipeline.py) are keyed on
+## the code that made them. That is more than a function's own source: a
+## stage that calls stability() or load_pbp() must also rerun when
+## stability.py or pbp_data.py changes. used_code() follows the names a
+## function or module refers to and collects the source of every module of
+## this repository it uses, directly or through each other.
+import hashlib
+import inspect
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def repo_module(value):
+    """The module of this repository that value is, or was defined in, or
+    None for anything else (such as numpy or pandas)."""
+    if inspect.ismodule(value):
+        module = value
+    else:
+        module_name = getattr(value, "__module__", None)
+        if not isinstance(module_name, str):
+            return None
+        module = sys.modules.get(module_name)
+    module_file = getattr(module, "__file__", None)
+    if module_file is None or not module_file.endswith(".py"):
+        return None
+    if os.path.dirname(os.path.abspath(module_file)) != REPO_DIR:
+        return None
+    return module
+
+
+def code_names(code):
+    """Global names used by code and by the functions defined inside it."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if inspect.iscode(const):
+            names |= code_names(const)
+    return names
+
+
+def used_code(obj, found=None):
+    """Source of obj (a function or module) and of the code of this
+    repository it uses, as a dict from module or function name to source.
+
+    A function from another module brings in that whole module, so changes
+    to its constants and helpers count too. Functions from obj's own module
+    (for example helpers next to the stages in run_pipeline.py) only bring
+    in their own source.
+    """
+    if found is None:
+        found = {}
+    if inspect.ismodule(obj):
+        found[obj.__name__] = inspect.getsource(obj)
+        values = list(vars(obj).values())
+    else:
+        obj = inspect.unwrap(obj)
+        found[obj.__module__ + "." + obj.__qualname__] = inspect.getsource(obj)
+        values = [
+            obj.__globals__[name]
+            for name in sorted(code_names(obj.__code__))
+            if name in obj.__globals__
+        ]
+    for value in values:
+        if (
+            not inspect.ismodule(obj)
+            and inspect.isfunction(value)
+            and value.__module__ == obj.__module__
+        ):
+            if value.__module__ + "." + value.__qualname__ not in found:
+                used_code(value, found)
+            continue
+        module = repo_module(value)
+        if module is not None and module.__name__ not in found:
+            used_code(module, found)
+    return found
+
+
+def source_hash(obj, libraries=()):
+    """Hash of used_code(obj) and of the versions of libraries (modules)."""
+    code = used_code(obj)
+    code_parts = [name + "\n" + code[name] for name in sorted(code)]
+    code_parts += [
+        library.__name__ + " " + library.__version__ for library in libraries
+    ]
+    return hashlib.sha256("\n".join(code_parts).encode()).hexdigest()
@@ -0,0 +1,113 @@
+## Year-to-year stability of player-season metrics
+## Chapters 2 to 5 check whether a metric is stable by pairing each player's
+## season with their previous season and correlating the two. Here the
+## previous seasons are found by sorting the table once and shifting within
+## each player, which gives every lag for every metric without any merges.
+import numpy as np
+import pandas as pd
+
+
+def lag_name(metric, lag):
+    """Column holding metric lag seasons earlier: cpoe_last, cpoe_last2, ..."""
+    return metric + "_last" + ("" if lag == 1 else str(lag))
+
+
+def lag_rows(player_season, id_cols, max_lag=1, season_col="season"):
+    """Position of the same player's row 1 to max_lag seasons earlier.
+
+    player_season has one row per player (id_cols) and season. Returns a dict
+    from lag to an array with, for each row, the position of the row lag
+    seasons earlier, or -1 if the player has no row for that season.
+    """
+    n_rows = len(player_season)
+    keys = player_season[id_cols + [season_col]].assign(_row=np.arange(n_rows))
+    keys = keys.sort_values(id_cols + [season_col])
+    grouped = keys.groupby(id_cols, observed=True, sort=False)[[season_col, "_row"]]
+    rows = keys["_row"].to_numpy()
+    seasons = keys[season_col].to_numpy()
+    earlier = {lag: np.full(n_rows, -1) for lag in range(1, max_lag + 1)}
+    ## the row j places back in a player's sorted seasons is at least j
+    ## seasons back, so shifts 1 to max_lag find every lag
+    for shift in range(1, max_lag + 1):
+        shifted = grouped.shift(shift)
+        gap = seasons - shifted[season_col].to_numpy(dtype=float, na_value=np.nan)
+        for lag in range(shift, max_lag + 1):
+            found = gap == lag
+            earlier[lag][rows[found]] = shifted["_row"].to_numpy()[found]
+    return earlier
+
+
+def lag_values(values, rows):
+    """values at the positions rows, with NaN where rows is -1."""
+    values = np.asarray(values, dtype=float)
+    return np.where(rows >= 0, values[np.maximum(rows, 0)], np.nan)
+
+
+def lag_table(player_season, id_cols, metrics, lag=1, season_col="season"):
+    """Seasons with the same player's season lag seasons earlier.
+
+    Gives the same rows as an inner merge of the table with a copy whose
+    season is moved forward by lag, with the earlier values in the columns
+    named by lag_name() (for example ypa_last).
+    """
+    rows = lag_rows(player_season, id_cols, lag, season_col)[lag]
+    found = rows >= 0
+    lagged = player_season[found].reset_index(drop=True)
+    for metric in metrics:
+        lagged[lag_name(metric, lag)] = lag_values(
+            player_season[metric].to_numpy(dtype=float, na_value=np.nan),
+            rows[found],
+        )
+    return lagged
+
+
+def stability(player_season, id_cols, metrics, max_lag=1, by=None, season_col="season"):
+    """Correlation of each metric with itself 1 to max_lag seasons earlier.
+
+    Returns a data frame with a row for each lag (and each group of the by
+    columns, such as pass length) and each metric's correlation as a column.
+    Pairs with a missing value are left out, as with Series.corr().
+    """
+    by = [] if by is None else list(by)
+    earlier = lag_rows(player_season, id_cols + by, max_lag, season_col)
+    values = {
+        metric: player_season[metric].to_numpy(dtype=float, na_value=np.nan)
+        for metric in metrics
+    }
+    ## the sums of x, y, x*y, x^2 and y^2 over the pairs give the correlations
+    sums = {}
+    for lag in range(1, max_lag + 1):
+        for metric in metrics:
+            x = values[metric]
+            y = lag_values(x, earlier[lag])
+            paired = np.isfinite(x) & np.isfinite(y)
+            x = np.where(paired, x, 0.0)
+            y = np.where(paired, y, 0.0)
+            sums[(lag, metric, "n")] = paired.astype(float)
+            sums[(lag, metric, "x")] = x
+            sums[(lag, metric, "y")] = y
+            sums[(lag, metric, "xy")] = x * y
+            sums[(lag, metric, "xx")] = x * x
+            sums[(lag, metric, "yy")] = y * y
+    sums = pd.DataFrame(sums)
+    if len(by) > 0:
+        sums = sums.groupby(
+            [player_season[col].to_numpy() for col in by], observed=True
+        ).sum()
+        sums.index.names = by
+    else:
+        sums = sums.sum().to_frame().T
+    results = []
+    for lag in range(1, max_lag + 1):
+        result = pd.DataFrame(index=sums.index)
+        for metric in metrics:
+            n, x, y, xy, xx, yy = [
+                sums[(lag, metric, name)] for name in ["n", "x", "y", "xy", "xx", "yy"]
+            ]
+            result[metric] = (xy - x * y / n) / np.sqrt(
+                (xx - x * x / n) * (yy - y * y / n)
+            )
+        result["lag"] = lag
+        results.append(result)
+    results = pd.concat(results).reset_index(drop=len(by) == 0)
+    return results.set_index(by + ["lag"]).sort_index()
@@ -0,0 +1,68 @@
+import pickle
+import numpy as np
+import pandas as pd
+import statsmodels.api as sm
+import statsmodels.formula.api as smf
+import backtest
+import parallel
+from backtest import walk_forward
+
+
+def games(seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(
+        {
+            "season": np.repeat([2021, 2022], 60),
+            "week": np.tile(np.repeat(np.arange(1, 7), 10), 2),
+            "pass_td_rate": rng.uniform(0.5, 2.5, 120),
+        }
+    )
+    data["pass_td_y"] = rng.poisson(data["pass_td_rate"])
+    return data
+
+
+def test_walk_forward_same_for_any_number_of_workers():
+    formulas = {"rate": "pass_td_y ~ pass_td_rate", "mean": "pass_td_y ~ 1"}
+    serial = walk_forward(games(), formulas, seasons=[2021, 2022], max_workers=1)
+    pooled = walk_forward(games(), formulas, seasons=[2021, 2022], max_workers=3)
+    pd.testing.assert_frame_equal(serial, pooled)
+    assert set(serial["model"]) == {"rate", "mean"}
+    ## the first week has no games before it to fit on
+    first = (serial["season"] == 2021) & (serial["week"] == 1)
+    assert not first.any() and len(serial) == 2 * 110
+
+
+def test_walk_forward_tasks_do_not_carry_the_data(monkeypatch):
+    data = games()
+    task_sizes = []
+
+    def recording_map(func, tasks, max_workers=4):
+        tasks = list(tasks)
+        task_sizes.extend(len(pickle.dumps(task)) for task in tasks)
+        return parallel.parallel_map(func, tasks, max_workers)
+
+    monkeypatch.setattr(backtest, "parallel_map", recording_map)
+    walk_forward(data, {"rate": "pass_td_y ~ pass_td_rate"}, seasons=[2021, 2022])
+    assert len(task_sizes) == 2
+    assert max(task_sizes) < len(pickle.dumps(data)) / 4
+
+
+def test_walk_forward_fits_the_games_before_each_week():
+    data = games()
+    formulas = {"rate": "pass_td_y ~ pass_td_rate", "mean": "pass_td_y ~ 1"}
+    predictions = walk_forward(data, formulas, seasons=[2021, 2022], max_workers=3)
+    time = data["season"] * 100 + data["week"]
+    ## the intercept-only Poisson model predicts the mean of the earlier games
+    means = predictions.query("model == 'mean'")
+    for (season, week), week_games in means.groupby(["season", "week"]):
+        earlier = data[time < season * 100 + week]
+        np.testing.assert_allclose(week_games["expected"], earlier["pass_td_y"].mean())
+    ## and the rate model matches a statsmodels fit of the same games
+    earlier = data[time < 2022 * 100 + 3]
+    fit = smf.glm(
+        "pass_td_y ~ pass_td_rate", earlier, family=sm.families.Poisson()
+    ).fit()
+    week_games = predictions.query("model == 'rate' & season == 2022 & week == 3")
+    np.testing.assert_allclose(
+        week_games["expected"], fit.predict(week_games), rtol=1e-6
+    )
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+from features import FeatureStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = FeatureStore(str(tmp_path))
+    features = pd.DataFrame(
+        {
+            "team": ["KC", "KC", "BUF"],
+            "season": [2021, 2022, 2021],
+            "week": [18, 3, 18],
+            "n_games": [17, 2, 17],
+            "home": [True, False, True],
+            "rate": [1.5, 2.0, 1.2],
+        }
+    )
+    store.add("team_form", features, ["team"])
+    return store
+
+
+def games():
+    return pd.DataFrame(
+        {"team": ["KC", "BUF", "KC"], "season": [2022, 2022, 2022], "week": [1, 1, 4]}
+    )
+
+
+def test_stale_features_are_dropped_inner(store):
+    matched = store.lookup("team_form", games(), max_seasons=0)
+    ## both week 1 games only have 2021 features, which are too old
+    assert len(matched) == 1
+    assert matched.loc[0, "n_games"] == 2
+    assert matched["n_games"].dtype == "int64"
+    assert matched["home"].dtype == "bool"
+
+
+def test_stale_features_are_missing_left(store):
+    matched = store.lookup("team_form", games(), how="left", max_seasons=0)
+    assert len(matched) == 3
+    assert matched["n_games"].isna().tolist() == [True, True, False]
+    assert matched["rate"].isna().tolist() == [True, True, False]
+    assert matched.loc[2, "rate"] == 2.0
+
+
+def test_older_features_allowed(store):
+    matched = store.lookup("team_form", games(), max_seasons=1)
+    assert matched["n_games"].tolist() == [17, 17, 2]
+
+
+def test_snapshot_drops_stale_features(store):
+    snapshot = store.snapshot("team_form", 2022, 1)
+    assert snapshot.set_index("team")["n_games"].to_dict() == {"KC": 17, "BUF": 17}
+    ## by week 1 of 2022 both teams only have 2021 features
+    assert len(store.snapshot("team_form", 2022, 1, max_seasons=0)) == 0
+    snapshot = store.snapshot("team_form", 2022, 4, max_seasons=0)
+    assert snapshot[["team", "n_games"]].values.tolist() == [["KC", 2]]
+    assert len(store.snapshot("team_form", 2022, 4, max_seasons=1)) == 2
+    ## the unbounded snapshot saved first is not reused for the bounded one
+    assert len(store.snapshot("team_form", 2022, 1)) == 2
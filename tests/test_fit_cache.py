@@ -0,0 +1,52 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+import fit_cache
+import source_hash
+from fit_cache import FitCache
+
+
+def plays(n=200, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({"ydstogo": rng.integers(1, 20, n).astype(float)})
+    data["rushing_yards"] = 3 + 0.1 * data["ydstogo"] + rng.normal(0, 2, n)
+    return data
+
+
+def test_fit_is_saved_and_reused(tmp_path):
+    cache = FitCache(str(tmp_path))
+    first = cache.fit("rushing_yards ~ ydstogo", plays())
+    files = sorted(os.listdir(tmp_path))
+    second = FitCache(str(tmp_path)).fit("rushing_yards ~ ydstogo", plays())
+    assert sorted(os.listdir(tmp_path)) == files
+    pd.testing.assert_series_equal(first.params, second.params)
+    refit = cache.fit("rushing_yards ~ ydstogo", plays(seed=1))
+    assert not np.allclose(refit.params, first.params)
+
+
+def test_code_hash_covers_design(monkeypatch):
+    ## the design matrices of the fits are built by design.py
+    assert {"fitting", "design"} <= set(source_hash.used_code(fit_cache.fitting))
+    before = fit_cache.code_hash()
+    getsource = source_hash.inspect.getsource
+
+    def changed_design(module):
+        source = getsource(module)
+        return source + "\n# changed" if module.__name__ == "design" else source
+
+    monkeypatch.setattr(source_hash.inspect, "getsource", changed_design)
+    assert fit_cache.code_hash() != before
+
+
+def test_old_code_files_removed_and_unused_fits_pruned(tmp_path):
+    old_file = tmp_path / "fit_00000000_0123456789abcdef.pkl"
+    old_file.write_bytes(b"")
+    cache = FitCache(str(tmp_path))
+    cache.fit("rushing_yards ~ ydstogo", plays())
+    assert not old_file.exists()
+    files = sorted(tmp_path.iterdir())
+    month_ago = time.time() - 31 * 24 * 60 * 60
+    os.utime(files[0], (month_ago, month_ago))
+    assert cache.prune(max_age_days=30) == [str(files[0])]
+    assert sorted(tmp_path.iterdir()) == files[1:]
@@ -0,0 +1,92 @@
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+import fitting
+import parallel
+from fitting import fit_formula, fit_groups
+
+
+def plays(n=400, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(
+        {
+            "season": rng.choice([2021.0, 2022.0], n),
+            "ydstogo": rng.integers(1, 20, n).astype(float),
+            "run_location": rng.choice(["left", "middle", "right"], n),
+        }
+    )
+    data["rushing_yards"] = 3 + 0.1 * data["ydstogo"] + rng.normal(0, 2, n)
+    return data
+
+
+def test_fit_groups_matches_each_group():
+    data = plays()
+    formula = "rushing_yards ~ ydstogo + run_location"
+    coefs, predictions = fit_groups(formula, data, ["season"], max_workers=2)
+    for season in [2021.0, 2022.0]:
+        rows = data["season"] == season
+        fit = fit_formula(formula, data[rows])
+        estimates = coefs[coefs["season"] == season]["estimate"].to_numpy()
+        np.testing.assert_allclose(estimates, fit.params.to_numpy())
+        np.testing.assert_allclose(predictions[rows], fit.fittedvalues)
+
+
+def test_fit_groups_missing_group_key():
+    data = plays()
+    data.loc[[3, 10], "season"] = np.nan
+    coefs, predictions = fit_groups(
+        "rushing_yards ~ ydstogo", data, ["season"], max_workers=2
+    )
+    assert predictions.index.equals(data.index)
+    assert predictions[[3, 10]].isna().all()
+    assert predictions.drop([3, 10]).notna().all()
+    assert set(coefs["season"]) == {2021.0, 2022.0}
+
+
+def test_fit_groups_same_for_any_number_of_workers():
+    data = plays()
+    formula = "rushing_yards ~ ydstogo + run_location"
+    serial = fit_groups(formula, data, ["season"], max_workers=1)
+    pooled = fit_groups(formula, data, ["season"], max_workers=2)
+    pd.testing.assert_frame_equal(serial[0], pooled[0])
+    pd.testing.assert_series_equal(serial[1], pooled[1])
+
+
+def test_fit_stats_match_statsmodels():
+    smf = pytest.importorskip("statsmodels.formula.api")
+    sm = pytest.importorskip("statsmodels.api")
+    data = plays()
+    data["long_gain"] = (data["rushing_yards"] > 4).astype(float)
+    formula = "rushing_yards ~ ydstogo + run_location"
+    fit_stats = fit_formula(formula, data).fit_stats()
+    ols = smf.ols(formula, data).fit()
+    np.testing.assert_allclose(
+        fit_stats[["R-squared", "Adj. R-squared", "F-statistic", "Log-Likelihood"]],
+        [ols.rsquared, ols.rsquared_adj, ols.fvalue, ols.llf],
+    )
+    formula = "long_gain ~ ydstogo + run_location"
+    fit_stats = fit_formula(formula, data, "binomial").fit_stats()
+    glm = smf.glm(formula, data, family=sm.families.Binomial()).fit()
+    np.testing.assert_allclose(
+        fit_stats[["Deviance", "Null Deviance", "Log-Likelihood", "Df Model"]],
+        [glm.deviance, glm.null_deviance, glm.llf, glm.df_model],
+        rtol=1e-6,
+    )
+
+
+def test_fit_groups_tasks_do_not_carry_the_data(monkeypatch):
+    data = plays(n=20000)
+    task_sizes = []
+
+    def recording_map(func, tasks, max_workers=4):
+        tasks = list(tasks)
+        task_sizes.extend(len(pickle.dumps(task)) for task in tasks)
+        return parallel.parallel_map(func, tasks, max_workers)
+
+    monkeypatch.setattr(fitting, "parallel_map", recording_map)
+    formula = "rushing_yards ~ ydstogo + run_location"
+    coefs, predictions = fitting.fit_groups(formula, data, ["season"], max_workers=2)
+    ## each task has its rows' numbers (8 bytes each), not their 4 columns
+    assert max(task_sizes) < 8 * 20000 * 0.75
+    assert coefs["estimate"].notnull().all()
@@ -0,0 +1,41 @@
+import os
+import warnings
+import numpy as np
+import pytest
+import parallel
+from parallel import map_arrays, parallel_map, save_arrays, shared_arrays
+
+
+def row_sums(arrays_dir, rows):
+    return map_arrays(arrays_dir)["X"][rows].sum(axis=1)
+
+
+def test_save_and_map_arrays(tmp_path):
+    X = np.arange(12.0).reshape(4, 3)
+    out_dir = save_arrays(str(tmp_path / "arrays"), {"X": X, "y": X[:, 0]})
+    arrays = map_arrays(out_dir)
+    assert isinstance(arrays["X"], np.memmap) and not arrays["X"].flags.writeable
+    np.testing.assert_array_equal(arrays["X"], X)
+    with pytest.raises(KeyError, match="z"):
+        map_arrays(out_dir, ["z"])
+
+
+def test_shared_arrays_reach_the_workers():
+    X = np.random.default_rng(0).normal(size=(100, 3))
+    tasks_rows = [np.arange(0, 50), np.arange(50, 100)]
+    with shared_arrays({"X": X}) as arrays_dir:
+        results = parallel_map(
+            row_sums, [(arrays_dir, rows) for rows in tasks_rows], max_workers=2
+        )
+    np.testing.assert_allclose(np.concatenate(results), X.sum(axis=1))
+    assert not os.path.exists(arrays_dir)
+
+
+def test_serial_fallback_warns_once(monkeypatch):
+    monkeypatch.setattr(parallel, "fork_context", lambda: None)
+    monkeypatch.setattr(parallel, "warned_serial", False)
+    with pytest.warns(RuntimeWarning, match="one after another"):
+        assert parallel_map(pow, [(2, 3), (3, 2)]) == [8, 9]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert parallel_map(pow, [(2, 3), (3, 2)]) == [8, 9]
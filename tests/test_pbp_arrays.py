@@ -0,0 +1,63 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from pbp_arrays import cache_arrays, open_arrays
+from pbp_data import load_pbp, save_season
+
+
+def season_pbp(season, n=40, seed=0):
+    rng = np.random.default_rng(seed + season)
+    return pd.DataFrame(
+        {
+            "play_id": np.arange(n, dtype=float),
+            "game_id": ["%d_%02d_A_B" % (season, week) for week in range(1, 5)]
+            * (n // 4),
+            "season": season,
+            "week": list(range(1, 5)) * (n // 4),
+            "play_type": rng.choice(["run", "pass"], n),
+            "ydstogo": rng.integers(1, 20, n).astype(float),
+            "rushing_yards": rng.normal(4, 3, n),
+        }
+    )
+
+
+@pytest.fixture
+def pbp_dir(tmp_path):
+    pbp_dir = str(tmp_path / "pbp")
+    for season in [2020, 2021]:
+        save_season(season_pbp(season), season, pbp_dir)
+    return pbp_dir
+
+
+def test_cache_arrays_match_the_store(pbp_dir, tmp_path):
+    columns = ["season", "ydstogo", "rushing_yards"]
+    filters = [("play_type", "==", "run")]
+    base_dir = str(tmp_path / "arrays")
+    arrays = cache_arrays("runs", [2020], columns, filters, base_dir, pbp_dir)
+    runs = load_pbp([2020], columns=columns, filters=filters, pbp_dir=pbp_dir)
+    for col in columns:
+        assert isinstance(arrays[col], np.memmap)
+        assert arrays[col].dtype == np.float32
+        np.testing.assert_allclose(arrays[col], runs[col].astype(float), rtol=1e-6)
+    ## the same request opens the saved arrays without exporting again
+    info_file = os.path.join(base_dir, "runs", "info.json")
+    info_time = os.stat(info_file).st_mtime_ns
+    cache_arrays("runs", [2020], columns, filters, base_dir, pbp_dir)
+    assert os.stat(info_file).st_mtime_ns == info_time
+
+
+def test_cache_arrays_export_again_when_the_request_changes(pbp_dir, tmp_path):
+    columns = ["season", "ydstogo"]
+    base_dir = str(tmp_path / "arrays")
+    runs = [("play_type", "==", "run")]
+    passes = [("play_type", "==", "pass")]
+    for seasons, filters in [([2020], runs), ([2020, 2021], runs), ([2021], passes)]:
+        arrays = cache_arrays("plays", seasons, columns, filters, base_dir, pbp_dir)
+        expected = load_pbp(seasons, columns=columns, filters=filters, pbp_dir=pbp_dir)
+        assert len(arrays["season"]) == len(expected)
+        assert set(arrays["season"]) == set(seasons)
+    arrays = cache_arrays("plays", [2021], ["rushing_yards"], passes, base_dir, pbp_dir)
+    assert list(arrays) == ["rushing_yards"]
+    with pytest.raises(KeyError, match="ydstogo"):
+        open_arrays("plays", ["ydstogo"], base_dir)
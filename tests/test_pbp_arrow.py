@@ -0,0 +1,111 @@
+import os
+import shutil
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pytest
+from pbp_arrow import arrow_file, export_pbp_arrow, load_pbp_arrow, read_arrow
+from pbp_data import load_pbp, save_season
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def season_pbp(season, n=40, seed=0):
+    rng = np.random.default_rng(seed + season)
+    pbp = pd.DataFrame(
+        {
+            "play_id": np.arange(n, dtype=float),
+            "game_id": ["%d_%02d_A_B" % (season, week) for week in range(1, 5)]
+            * (n // 4),
+            "season": season,
+            "week": list(range(1, 5)) * (n // 4),
+            "posteam": rng.choice(["BAL", "KC"], n),
+            "play_type": rng.choice(["run", "pass"], n),
+            "passer_id": rng.choice(["00-0023459", "00-0033873"], n),
+            "complete_pass": rng.integers(0, 2, n).astype(float),
+            "air_yards": rng.normal(8, 5, n),
+        }
+    )
+    ## a text column that is missing in every play of 2020
+    if season == 2020:
+        pbp["weather"] = None
+    else:
+        pbp["weather"] = rng.choice(["Sunny", "Rain"], n)
+    return pbp
+
+
+@pytest.fixture
+def pbp_dir(tmp_path):
+    pbp_dir = str(tmp_path / "data" / "pbp")
+    for season in [2020, 2021]:
+        save_season(season_pbp(season), season, pbp_dir)
+    return pbp_dir
+
+
+def test_export_uses_the_store_types(pbp_dir, tmp_path):
+    arrow_dir = str(tmp_path / "data" / "arrow")
+    export_pbp_arrow([2021], arrow_dir, pbp_dir)
+    arrow_table = read_arrow("pbp_2021", as_data_frame=False, arrow_dir=arrow_dir)
+    store_schema = pa.Schema.from_pandas(load_pbp([2021], pbp_dir=pbp_dir))
+    assert arrow_table.schema.remove_metadata() == store_schema.remove_metadata()
+    assert pa.types.is_dictionary(arrow_table.schema.field("posteam").type)
+    assert pa.types.is_integer(arrow_table.schema.field("passer_id").type)
+    assert arrow_table.schema.field("complete_pass").type == pa.int8()
+    ## saved files are not written again
+    export_time = os.stat(arrow_file("pbp_2021", arrow_dir)).st_mtime_ns
+    export_pbp_arrow([2021], arrow_dir, pbp_dir)
+    assert os.stat(arrow_file("pbp_2021", arrow_dir)).st_mtime_ns == export_time
+
+
+def test_load_joins_seasons_with_a_missing_column(pbp_dir, tmp_path):
+    arrow_dir = str(tmp_path / "data" / "arrow")
+    pbp_table = load_pbp_arrow(
+        [2020, 2021], as_data_frame=False, arrow_dir=arrow_dir, pbp_dir=pbp_dir
+    )
+    season_2020 = read_arrow("pbp_2020", as_data_frame=False, arrow_dir=arrow_dir)
+    season_2021 = read_arrow("pbp_2021", as_data_frame=False, arrow_dir=arrow_dir)
+    assert pa.types.is_null(season_2020.schema.field("weather").type)
+    assert pbp_table.schema == season_2021.schema
+    assert pbp_table.num_rows == 80
+    pbp = load_pbp_arrow([2020, 2021], arrow_dir=arrow_dir, pbp_dir=pbp_dir)
+    store = load_pbp([2020, 2021], pbp_dir=pbp_dir)
+    pd.testing.assert_series_equal(
+        pbp["passer_id"], store["passer_id"].reset_index(drop=True)
+    )
+    assert pbp["weather"].isna().sum() == 40
+
+
+def test_r_loads_the_python_export(pbp_dir, tmp_path, monkeypatch):
+    if shutil.which("Rscript") is None:
+        pytest.skip("R is not installed")
+    packages = subprocess.run(
+        ["Rscript", "-e", "library(arrow); library(tidyverse)"], capture_output=True
+    )
+    if packages.returncode != 0:
+        pytest.skip("the R arrow and tidyverse packages are not installed")
+    monkeypatch.chdir(tmp_path)
+    r_code = (
+        'source(file.path("%s", "pbp_arrow.R"))\n'
+        "pbp_r <- load_pbp_arrow(c(2020, 2021), as_data_frame = FALSE)\n"
+        "passes <- pbp_r |>\n"
+        '    filter(play_type == "pass" & !is.na(air_yards)) |>\n'
+        "    select(season, passer_id, weather) |>\n"
+        "    collect()\n"
+        'cat(nrow(passes), class(passes$passer_id), "\\n")\n'
+    ) % REPO_DIR.replace("\\", "/")
+    env = dict(
+        os.environ,
+        FOOTBALL_PYTHON=sys.executable,
+        PYTHONPATH=REPO_DIR + os.pathsep + os.environ.get("PYTHONPATH", ""),
+    )
+    result = subprocess.run(
+        ["Rscript", "-e", r_code], capture_output=True, text=True, env=env
+    )
+    assert result.returncode == 0, result.stderr
+    ## R asked first, but the files were written by Python
+    assert os.path.isfile(arrow_file("pbp_2020"))
+    store = load_pbp([2020, 2021], pbp_dir=pbp_dir)
+    n_passes = int((store["play_type"] == "pass").sum())
+    assert result.stdout.split()[:2] == [str(n_passes), "integer"]
@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+import pbp_data
+from pbp_data import game_index, load_game, save_season, season_files
+
+TEAMS = [("KC", "BAL"), ("GB", "DET"), ("BUF", "NE")]
+
+
+def season_pbp(season, seed=0):
+    rng = np.random.default_rng(seed + season)
+    games = []
+    for week in [1, 2, 3]:
+        for home_team, away_team in TEAMS:
+            n_plays = int(rng.integers(5, 15))
+            games.append(
+                pd.DataFrame(
+                    {
+                        "game_id": "%d_%02d_%s_%s"
+                        % (season, week, away_team, home_team),
+                        "season": season,
+                        "week": week,
+                        "home_team": home_team,
+                        "away_team": away_team,
+                        "yards_gained": rng.normal(5, 4, n_plays),
+                    }
+                )
+            )
+    ## plays of a week's games arrive interleaved, as in the nflverse file
+    pbp = pd.concat(games).sample(frac=1, random_state=seed)
+    pbp["play_id"] = np.arange(len(pbp), dtype=float)
+    return pbp.reset_index(drop=True)
+
+
+@pytest.fixture
+def pbp_dir(tmp_path):
+    pbp_dir = str(tmp_path / "pbp")
+    save_season(season_pbp(2020), 2020, pbp_dir)
+    return pbp_dir
+
+
+def test_each_game_is_its_own_row_group(pbp_dir):
+    for file in season_files(2020, pbp_dir):
+        parquet_file = pq.ParquetFile(file)
+        assert parquet_file.metadata.num_row_groups == len(TEAMS)
+        for row_group in range(parquet_file.metadata.num_row_groups):
+            game_ids = parquet_file.read_row_group(row_group, columns=["game_id"])
+            assert len(set(game_ids.column("game_id").to_pylist())) == 1
+
+
+def test_game_index_points_at_each_game(pbp_dir):
+    pbp = season_pbp(2020)
+    index = game_index([2020], pbp_dir)
+    assert sorted(index["game_id"]) == sorted(pbp["game_id"].unique())
+    n_plays = pbp.groupby("game_id").size()
+    for game in index.itertuples():
+        assert game.n_plays == n_plays[game.game_id]
+        stored = pq.ParquetFile(game.file).read_row_group(game.row_group).to_pandas()
+        assert set(stored["game_id"].astype(str)) == {game.game_id}
+        assert stored["home_team"].astype(str).iloc[0] == game.home_team
+        assert stored["away_team"].astype(str).iloc[0] == game.away_team
+        assert stored["week"].iloc[0] == game.week
+
+
+def test_load_game_reads_only_the_matching_row_groups(pbp_dir, monkeypatch):
+    reads = []
+
+    class RecordingFile(pq.ParquetFile):
+        def __init__(self, source, **kwargs):
+            super().__init__(source, **kwargs)
+            self.source_file = source
+
+        def read_row_group(self, i, *args, **kwargs):
+            reads.append((self.source_file, i))
+            return super().read_row_group(i, *args, **kwargs)
+
+    monkeypatch.setattr(pbp_data.pq, "ParquetFile", RecordingFile)
+    pbp = season_pbp(2020)
+    game = load_game("2020_02_DET_GB", pbp_dir=pbp_dir)
+    expected = pbp.query("game_id == '2020_02_DET_GB'")
+    assert sorted(game["play_id"]) == sorted(expected["play_id"])
+    index = game_index([2020], pbp_dir).set_index("game_id")
+    assert reads == [tuple(index.loc["2020_02_DET_GB", ["file", "row_group"]])]
+
+    reads.clear()
+    games = load_game(season=2020, home_team="KC", pbp_dir=pbp_dir)
+    assert set(games["game_id"].astype(str)) == {
+        "2020_01_BAL_KC",
+        "2020_02_BAL_KC",
+        "2020_03_BAL_KC",
+    }
+    assert len(games) == (pbp["home_team"] == "KC").sum()
+    assert len(reads) == 3
+
+    with pytest.raises(ValueError):
+        load_game(season=2020, home_team="KC", away_team="GB", pbp_dir=pbp_dir)
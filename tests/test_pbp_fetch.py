@@ -0,0 +1,212 @@
+import os
+import sys
+import threading
+import time
+import types
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+import pandas as pd
+import pytest
+from pbp_data import (
+    cache_seasons,
+    load_pbp,
+    save_season,
+    season_dir,
+    season_files,
+    stored_games,
+    update_pbp,
+    week_file,
+)
+from pbp_fetch import fetch_seasons
+
+
+def season_pbp(season):
+    return pd.DataFrame(
+        {
+            "play_id": [1.0, 2.0, 3.0, 4.0],
+            "game_id": ["%d_01_A_B" % season] * 2 + ["%d_02_B_A" % season] * 2,
+            "season": [season] * 4,
+            "week": [1, 1, 2, 2],
+            "yards_gained": [3.0, -1.0, 12.0, 0.0],
+        }
+    )
+
+
+class FileServer:
+    """Serves the files of a folder, slowly enough that downloads overlap,
+    and records which files were asked for."""
+
+    def __init__(self, serve_dir):
+        self.requested = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def do_GET(self):
+                with server.lock:
+                    server.requested.append(self.path.lstrip("/"))
+                    server.active += 1
+                    server.max_active = max(server.max_active, server.active)
+                try:
+                    time.sleep(0.2)
+                    super().do_GET()
+                finally:
+                    with server.lock:
+                        server.active -= 1
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(
+            ("127.0.0.1", 0), partial(Handler, directory=str(serve_dir))
+        )
+        self.url = "http://127.0.0.1:%d/play_by_play_{season}.parquet" % (
+            self.httpd.server_address[1]
+        )
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def pbp_server(tmp_path):
+    serve_dir = tmp_path / "serve"
+    serve_dir.mkdir()
+    for season in [2020, 2021, 2022]:
+        season_pbp(season).to_parquet(serve_dir / ("play_by_play_%d.parquet" % season))
+    server = FileServer(serve_dir)
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def test_fetch_seasons_in_parallel(pbp_server):
+    saved = {}
+
+    def save(pbp_season, season):
+        saved[season] = pbp_season
+
+    fetch_seasons([2020, 2021, 2022], save, url=pbp_server.url, max_workers=3)
+    assert sorted(saved) == [2020, 2021, 2022]
+    for season, pbp_season in saved.items():
+        pd.testing.assert_frame_equal(pbp_season, season_pbp(season))
+    assert pbp_server.max_active > 1
+
+
+def test_fetch_seasons_reports_missing_season(pbp_server):
+    saved = {}
+
+    def save(pbp_season, season):
+        saved[season] = pbp_season
+
+    with pytest.raises(RuntimeError, match="1999.*404"):
+        fetch_seasons([2020, 1999], save, url=pbp_server.url)
+    ## the seasons that did download are still saved
+    assert list(saved) == [2020]
+
+
+def test_cache_seasons_only_fetches_unfinished_seasons(pbp_server, tmp_path):
+    pbp_dir = str(tmp_path / "pbp")
+    serve_file = tmp_path / "serve" / "play_by_play_2021.parquet"
+    os.replace(serve_file, tmp_path / "later.parquet")
+    with pytest.raises(RuntimeError, match="2021"):
+        cache_seasons([2020, 2021], pbp_dir, url=pbp_server.url)
+    assert len(season_files(2020, pbp_dir)) == 2
+    assert len(season_files(2021, pbp_dir)) == 0
+
+    ## a season interrupted while saving leaves only its temporary folder
+    os.makedirs(season_dir(2022, pbp_dir) + ".tmp")
+    os.replace(tmp_path / "later.parquet", serve_file)
+    pbp_server.requested.clear()
+    files = cache_seasons([2020, 2021, 2022], pbp_dir, url=pbp_server.url)
+    assert sorted(pbp_server.requested) == [
+        "play_by_play_2021.parquet",
+        "play_by_play_2022.parquet",
+    ]
+    assert len(files) == 6
+    assert not os.path.exists(season_dir(2022, pbp_dir) + ".tmp")
+
+
+def game_pbp(season, week, home_score, away_score, n_plays):
+    """Plays of one game, with the running score reaching the final score."""
+    game_id = "%d_%02d_A_B" % (season, week)
+    return pd.DataFrame(
+        {
+            "play_id": np.arange(1.0, n_plays + 1),
+            "game_id": game_id,
+            "season": season,
+            "week": week,
+            "total_home_score": np.linspace(0, home_score, n_plays).round(),
+            "total_away_score": np.linspace(0, away_score, n_plays).round(),
+        }
+    )
+
+
+@pytest.fixture
+def schedule_server(tmp_path, monkeypatch):
+    """Serves 2021 as it is now: week 2 has finished 24-17 and week 3 has
+    been played. The schedule also has an unplayed week 4 game."""
+    serve_dir = tmp_path / "serve"
+    serve_dir.mkdir()
+    pbp_now = pd.concat(
+        [
+            game_pbp(2021, 1, 21, 14, 6),
+            game_pbp(2021, 2, 24, 17, 8),
+            game_pbp(2021, 3, 3, 0, 5),
+        ]
+    )
+    pbp_now.to_parquet(serve_dir / "play_by_play_2021.parquet")
+    schedule = pd.DataFrame(
+        {
+            "season": 2021,
+            "game_id": ["2021_%02d_A_B" % week for week in [1, 2, 3, 4]],
+            "home_score": [21, 24, 3, np.nan],
+            "away_score": [14, 17, 0, np.nan],
+        }
+    )
+    nfl = types.ModuleType("nfl_data_py")
+    nfl.import_schedules = lambda seasons: schedule[schedule.season.isin(seasons)]
+    monkeypatch.setitem(sys.modules, "nfl_data_py", nfl)
+    server = FileServer(serve_dir)
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+def test_update_pbp_adds_new_and_changed_games(schedule_server, tmp_path):
+    pbp_dir = str(tmp_path / "pbp")
+    ## saved while week 2 was still being played
+    save_season(
+        pd.concat([game_pbp(2021, 1, 21, 14, 6), game_pbp(2021, 2, 10, 7, 4)]),
+        2021,
+        pbp_dir,
+    )
+    week_1_time = os.stat(week_file(2021, 1, pbp_dir)).st_mtime_ns
+
+    updated = update_pbp([2021], pbp_dir, url=schedule_server.url)
+    assert updated == ["2021_02_A_B", "2021_03_A_B"]
+    ## week 1 was final already, so its file is not rewritten
+    assert os.stat(week_file(2021, 1, pbp_dir)).st_mtime_ns == week_1_time
+    games = stored_games([2021], pbp_dir).set_index("game_id")
+    assert games.loc["2021_02_A_B", ["home_score", "away_score"]].tolist() == [24, 17]
+    assert games.loc["2021_03_A_B", ["home_score", "away_score"]].tolist() == [3, 0]
+    ## the new copy of week 2 replaces the old plays instead of adding to them
+    pbp = load_pbp([2021], columns=["game_id", "play_id"], pbp_dir=pbp_dir)
+    assert pbp.groupby("game_id", observed=True).size().to_dict() == {
+        "2021_01_A_B": 6,
+        "2021_02_A_B": 8,
+        "2021_03_A_B": 5,
+    }
+
+    ## up to date now, so nothing is downloaded
+    schedule_server.requested.clear()
+    assert update_pbp([2021], pbp_dir, url=schedule_server.url) == []
+    assert schedule_server.requested == []
+
+
+def test_update_pbp_downloads_seasons_not_stored(schedule_server, tmp_path):
+    pbp_dir = str(tmp_path / "pbp")
+    updated = update_pbp([2021], pbp_dir, url=schedule_server.url)
+    assert updated == ["2021_01_A_B", "2021_02_A_B", "2021_03_A_B"]
+    assert len(season_files(2021, pbp_dir)) == 3
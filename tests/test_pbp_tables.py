@@ -0,0 +1,44 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pbp_tables import build_tables, join_pbp
+
+
+def plays():
+    return pd.DataFrame(
+        {
+            "game_id": ["2022_01_A_B", "2022_01_A_B", "2022_02_B_A", "2022_02_B_A"],
+            "season": [2022] * 4,
+            "week": [1, 1, 2, 2],
+            "home_team": pd.Categorical(["B", "B", "A", "A"]),
+            "away_team": pd.Categorical(["A", "A", "B", "B"]),
+            "total_line": [44.5, 44.5, 41.0, 41.0],
+            "home_score": [20, 20, 17, 17],
+            "rusher_id": ["00-0000001", None, "00-0000002", "00-0000001"],
+            "rusher": ["A.Back", None, "B.Back", "A.Back"],
+            "yards_gained": [4.0, 9.0, -2.0, 1.0],
+        }
+    )
+
+
+def test_join_pbp_restores_the_plays():
+    pbp = plays()
+    joined = join_pbp(build_tables(pbp), columns=list(pbp.columns))
+    assert joined["total_line"].tolist() == pbp["total_line"].tolist()
+    assert joined["home_team"].tolist() == pbp["home_team"].tolist()
+    assert joined["rusher"].tolist()[::2] == ["A.Back", "B.Back"]
+
+
+@pytest.mark.parametrize("categorical", [False, True])
+def test_join_pbp_missing_game_gets_missing_values(categorical):
+    tables = build_tables(plays())
+    game_ids = ["2022_01_A_B", None, "2022_03_C_D", "2022_02_B_A"]
+    tables["plays"]["game_id"] = pd.Series(
+        game_ids, dtype="category" if categorical else "str"
+    )
+    joined = join_pbp(
+        tables, columns=["game_id", "total_line", "home_score", "home_team"]
+    )
+    np.testing.assert_array_equal(joined["total_line"], [44.5, np.nan, np.nan, 41.0])
+    np.testing.assert_array_equal(joined["home_score"], [20, np.nan, np.nan, 17])
+    assert joined["home_team"].isna().tolist() == [False, True, True, False]
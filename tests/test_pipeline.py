@@ -0,0 +1,92 @@
+import os
+import source_hash
+from pipeline import Pipeline
+from stability import stability
+
+
+def stage_helper(values):
+    return [value + 1 for value in values]
+
+
+def counting_pipeline(cache_dir, runs, start=0):
+    pipeline = Pipeline(str(cache_dir))
+
+    @pipeline.stage("numbers", params={"start": start})
+    def numbers(start):
+        runs.append("numbers")
+        return list(range(start, start + 3))
+
+    @pipeline.stage("plus_one", inputs=["numbers"])
+    def plus_one(numbers):
+        runs.append("plus_one")
+        return stage_helper(numbers)
+
+    @pipeline.stage("stable", inputs=["numbers"])
+    def stable(numbers):
+        runs.append("stable")
+        return stability
+
+    return pipeline
+
+
+def test_saved_stages_are_not_rerun(tmp_path):
+    runs = []
+    assert counting_pipeline(tmp_path, runs).run(["plus_one"]) == {
+        "plus_one": [1, 2, 3]
+    }
+    assert counting_pipeline(tmp_path, runs).run(["plus_one"]) == {
+        "plus_one": [1, 2, 3]
+    }
+    assert runs == ["numbers", "plus_one"]
+
+
+def test_input_change_reruns_stages_that_use_it(tmp_path):
+    keys = counting_pipeline(tmp_path, []).stage_keys()
+    changed = counting_pipeline(tmp_path, [], start=5).stage_keys()
+    assert all(changed[name] != keys[name] for name in keys)
+
+
+def test_helper_code_is_part_of_the_key(tmp_path, monkeypatch):
+    keys = counting_pipeline(tmp_path, []).stage_keys()
+    getsource = source_hash.inspect.getsource
+
+    def changed_source(obj):
+        source = getsource(obj)
+        changed = getattr(obj, "__name__", None) in ["stability", "stage_helper"]
+        return source + "\n# changed" if changed else source
+
+    monkeypatch.setattr(source_hash.inspect, "getsource", changed_source)
+    changed = counting_pipeline(tmp_path, []).stage_keys()
+    assert changed["numbers"] == keys["numbers"]
+    ## plus_one calls a helper next to it and stable uses stability.py
+    assert changed["plus_one"] != keys["plus_one"]
+    assert changed["stable"] != keys["stable"]
+
+
+def test_force_reruns_downstream_stages(tmp_path):
+    runs = []
+    counting_pipeline(tmp_path, runs).run()
+    runs.clear()
+    counting_pipeline(tmp_path, runs).run(force=["numbers"])
+    assert sorted(runs) == ["numbers", "plus_one", "stable"]
+    runs.clear()
+    counting_pipeline(tmp_path, runs).run(force=["plus_one"])
+    assert runs == ["plus_one"]
+
+
+def test_outputs_under_old_keys_are_removed(tmp_path):
+    counting_pipeline(tmp_path, []).run()
+    old_files = sorted(os.listdir(tmp_path))
+    assert len(old_files) == 3
+    ## another pipeline's file whose name starts with a stage name stays
+    (tmp_path / "numbers_extra_0123456789abcdef.pkl").write_bytes(b"")
+    pipeline = counting_pipeline(tmp_path, [], start=5)
+    pipeline.run(["plus_one"])
+    keys = pipeline.stage_keys()
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [
+            "numbers_" + keys["numbers"][:16] + ".pkl",
+            "plus_one_" + keys["plus_one"][:16] + ".pkl",
+            "numbers_extra_0123456789abcdef.pkl",
+        ]
+    )
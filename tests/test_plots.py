@@ -0,0 +1,150 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.api as sm
+import statsmodels.formula.api as smf
+from fitting import fit_formula
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## like the chapters: no if __name__ == "__main__": guard
+SCRIPT = """
+import multiprocessing
+multiprocessing.set_start_method("spawn")
+from plots import plt, render_plots, sns
+sns.set_theme(style="whitegrid")
+plt.plot([1, 2, 3], [2, 1, 3])
+plt.show()
+plt.plot([1, 2, 3], [3, 1, 2])
+plt.savefig("second.png")
+plt.close()
+print(len(render_plots(max_workers=%d)))
+"""
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_render_plots_from_unguarded_script(max_workers, tmp_path):
+    pytest.importorskip("matplotlib")
+    pytest.importorskip("seaborn")
+    if "spawn" not in multiprocessing.get_all_start_methods():
+        pytest.skip("no spawn start method")
+    script = tmp_path / "script.py"
+    script.write_text(SCRIPT % max_workers)
+    result = subprocess.run(
+        [sys.executable, str(script)],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": REPO_DIR, "FOOTBALL_PLOTS": "defer"},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "2"
+    assert (tmp_path / "figures" / "script_01.png").is_file()
+    assert (tmp_path / "second.png").is_file()
+
+
+## the first figure of SCRIPT, drawn straight away with matplotlib
+DIRECT_SCRIPT = """
+import matplotlib
+matplotlib.use("Agg")
+from plots import plt, sns
+sns.set_theme(style="whitegrid")
+plt.plot([1, 2, 3], [2, 1, 3])
+plt.savefig("direct.png")
+"""
+
+
+def test_render_plots_draws_the_same_figure(tmp_path):
+    pytest.importorskip("matplotlib")
+    pytest.importorskip("seaborn")
+    if "spawn" not in multiprocessing.get_all_start_methods():
+        pytest.skip("no spawn start method")
+    for name, script_text, plot_mode in [
+        ("script.py", SCRIPT % 2, "defer"),
+        ("direct.py", DIRECT_SCRIPT, "show"),
+    ]:
+        script = tmp_path / name
+        script.write_text(script_text)
+        result = subprocess.run(
+            [sys.executable, str(script)],
+            cwd=tmp_path,
+            env={**os.environ, "PYTHONPATH": REPO_DIR, "FOOTBALL_PLOTS": plot_mode},
+            capture_output=True,
+            text=True,
+            timeout=120,
+        )
+        assert result.returncode == 0, result.stderr
+    from matplotlib.image import imread
+
+    deferred = imread(tmp_path / "figures" / "script_01.png")
+    direct = imread(tmp_path / "direct.png")
+    assert deferred.shape == direct.shape
+    assert (deferred == direct).all()
+
+
+def logistic_plays(n=2000, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({"air_yards": rng.uniform(-5, 40, n)})
+    p_complete = 1 / (1 + np.exp(-(1.5 - 0.06 * data["air_yards"])))
+    data["complete_pass"] = rng.binomial(1, p_complete)
+    return data
+
+
+@pytest.fixture
+def plots_module():
+    matplotlib = pytest.importorskip("matplotlib")
+    pytest.importorskip("seaborn")
+    matplotlib.use("Agg")
+    import plots
+
+    if plots.PLOT_MODE != "show":
+        pytest.skip("FOOTBALL_PLOTS is set")
+    yield plots
+    plots.plt.close("all")
+
+
+def test_binned_plot_draws_the_logistic_fit(plots_module):
+    data = logistic_plays()
+    plots_module.binned_plot(
+        data, "air_yards", "complete_pass", fit=True, bins=(50, 2), logistic=True
+    )
+    x_line, y_line = plots_module.plt.gca().lines[-1].get_data()
+    fit = smf.glm(
+        "complete_pass ~ air_yards", data, family=sm.families.Binomial()
+    ).fit()
+    np.testing.assert_allclose(
+        y_line, fit.predict(pd.DataFrame({"air_yards": x_line})), rtol=1e-6
+    )
+
+
+def test_binned_plot_draws_the_fitted_model(plots_module):
+    data = logistic_plays()
+    fit = fit_formula("complete_pass ~ air_yards", data)
+    plots_module.binned_plot(data, "air_yards", "complete_pass", fit=fit)
+    x_line, y_line = plots_module.plt.gca().lines[-1].get_data()
+    np.testing.assert_allclose(
+        y_line, fit.params["Intercept"] + fit.params["air_yards"] * x_line
+    )
+
+
+def test_binned_scatterplot_rejects_other_arguments(plots_module, monkeypatch):
+    monkeypatch.setattr(plots_module, "BINNED_PLOTS", True)
+    data = logistic_plays()
+    ## scatter_kws only styles points, which the binned plot does not have
+    plots_module.play_scatterplot(
+        data,
+        "air_yards",
+        "complete_pass",
+        fit=True,
+        logistic=True,
+        scatter_kws={"alpha": 0.05},
+    )
+    with pytest.raises(TypeError, match="x_jitter"):
+        plots_module.play_scatterplot(
+            data, "air_yards", "complete_pass", fit=True, x_jitter=0.5
+        )
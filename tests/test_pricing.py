@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import poisson
+from pricing import (
+    american_odds,
+    count_probabilities,
+    decimal_from_american,
+    over_under,
+    price_props,
+)
+
+EXPECTED = np.array([0.0, 0.3, 1.2, 2.5, 4.0, 8.5])
+
+
+def test_count_probabilities_match_poisson():
+    expected = pd.Series(EXPECTED, index=pd.Index(list("abcdef"), name="passer"))
+    probs = count_probabilities(expected)
+    assert list(probs.columns) == ["p_%d" % k for k in range(6)] + ["p_6_plus"]
+    assert probs.index.equals(expected.index)
+    for k in range(6):
+        np.testing.assert_allclose(probs["p_%d" % k], poisson.pmf(k, EXPECTED))
+    ## everything from 6 up is in the tail
+    np.testing.assert_allclose(probs["p_6_plus"], poisson.sf(5, EXPECTED), atol=1e-12)
+    np.testing.assert_allclose(probs.sum(axis=1), 1)
+
+
+@pytest.mark.parametrize("line", [0.5, 1.5, 2.5, 4.5])
+def test_half_lines_never_push(line):
+    p_over, p_under, p_push = over_under(EXPECTED, line)
+    np.testing.assert_allclose(p_over, poisson.sf(np.floor(line), EXPECTED))
+    np.testing.assert_allclose(p_under, poisson.cdf(np.floor(line), EXPECTED))
+    np.testing.assert_array_equal(p_push, 0)
+
+
+@pytest.mark.parametrize("line", [0, 1, 2, 3])
+def test_whole_lines_push_on_the_line(line):
+    p_over, p_under, p_push = over_under(EXPECTED, line)
+    np.testing.assert_allclose(p_over, poisson.sf(line, EXPECTED), atol=1e-12)
+    np.testing.assert_allclose(p_under, poisson.cdf(line - 1, EXPECTED), atol=1e-12)
+    np.testing.assert_allclose(p_push, poisson.pmf(line, EXPECTED), atol=1e-12)
+
+
+def test_price_props_match_poisson():
+    expected = pd.Series(EXPECTED[1:], index=pd.Index(list("bcdef"), name="passer"))
+    lines = (0.5, 1, 2.5)
+    props = price_props(expected, lines)
+    assert props.index.names == ["passer", "line"]
+    assert len(props) == len(expected) * len(lines)
+    for line in lines:
+        prop = props.xs(line, level="line")
+        push = poisson.pmf(line, expected) if line == int(line) else 0.0
+        over = poisson.sf(np.floor(line), expected)
+        np.testing.assert_allclose(prop["p_over"], over)
+        np.testing.assert_allclose(prop["p_push"], push, atol=1e-12)
+        ## fair odds leave out the bets that push
+        np.testing.assert_allclose(prop["over_decimal"], (1 - push) / over)
+        np.testing.assert_allclose(
+            prop["under_decimal"], (1 - push) / (1 - push - over)
+        )
+        np.testing.assert_allclose(
+            decimal_from_american(prop["over_american"]), prop["over_decimal"]
+        )
+
+
+def test_american_odds():
+    np.testing.assert_allclose(american_odds([0.75, 0.5, 0.2]), [-300, -100, 400])
+    np.testing.assert_allclose(decimal_from_american([-110, 150]), [1 + 100 / 110, 2.5])
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+from rates import prior_rates
+
+
+def loop_rates(games, seasons, weeks=range(1, 22 + 1)):
+    ## the season x week loop that chapter 6 used before prior_rates()
+    x_py = pd.DataFrame()
+    for season_idx in seasons:
+        for week_idx in weeks:
+            week_calc_py = (
+                games.query(
+                    "(season == "
+                    + str(season_idx - 1)
+                    + ") |"
+                    + "(season == "
+                    + str(season_idx)
+                    + "&"
+                    + "week < "
+                    + str(week_idx)
+                    + ")"
+                )
+                .groupby(["passer_id", "passer"], observed=True)
+                .agg({"pass_td_y": ["count", "mean"]})
+            )
+            week_calc_py.columns = list(map("_".join, week_calc_py.columns))
+            week_calc_py.reset_index(inplace=True)
+            week_calc_py.rename(
+                columns={"pass_td_y_count": "n_games", "pass_td_y_mean": "rate"},
+                inplace=True,
+            )
+            week_calc_py["season"] = season_idx
+            week_calc_py["week"] = week_idx
+            x_py = pd.concat([x_py, week_calc_py])
+    return x_py.reset_index(drop=True)
+
+
+def passer_games(seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for passer_id, passer in [(101, "A.One"), (202, "B.Two"), (303, "C.Three")]:
+        for season in [2016, 2017, 2018]:
+            ## C.Three misses 2017, so the 2018 weeks have no previous season
+            if passer == "C.Three" and season == 2017:
+                continue
+            ## and every passer misses some weeks
+            for week in np.sort(rng.choice(np.arange(1, 23), 12, replace=False)):
+                rows.append((passer_id, passer, season, week, rng.poisson(1.5)))
+    return pd.DataFrame(
+        rows, columns=["passer_id", "passer", "season", "week", "pass_td_y"]
+    )
+
+
+def test_prior_rates_match_the_loop():
+    games = passer_games()
+    seasons = range(2017, 2019 + 1)
+    rates = prior_rates(games, ["passer_id", "passer"], "pass_td_y", seasons)
+    expected = loop_rates(games, seasons)
+    pd.testing.assert_frame_equal(rates, expected, check_column_type=False)
+    ## C.Three has no earlier games before his first 2018 game
+    first_2018 = games.query("passer == 'C.Three' & season == 2018")["week"].min()
+    assert rates.query(
+        "passer == 'C.Three' & season == 2018 & week <= @first_2018"
+    ).empty
@@ -0,0 +1,52 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import numpy as np
+import pytest
+from resampling import batch_mean, bootstrap
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+## like the chapters: no if __name__ == "__main__": guard
+SCRIPT = """
+import multiprocessing
+multiprocessing.set_start_method("%s")
+import numpy as np
+from resampling import batch_mean, bootstrap
+print(bootstrap(batch_mean, np.arange(50.0), n_resamples=200, max_workers=2).mean())
+"""
+
+
+def test_bootstrap_same_for_any_number_of_workers():
+    x = np.random.default_rng(0).normal(size=300)
+    serial = bootstrap(batch_mean, x, n_resamples=500, max_workers=1)
+    pooled = bootstrap(batch_mean, x, n_resamples=500, max_workers=3)
+    np.testing.assert_array_equal(serial, pooled)
+
+
+@pytest.mark.parametrize("method", ["spawn", "forkserver"])
+def test_bootstrap_from_unguarded_script(method, tmp_path):
+    if method not in multiprocessing.get_all_start_methods():
+        pytest.skip("no %s start method" % method)
+    script = tmp_path / "script.py"
+    script.write_text(SCRIPT % method)
+    result = subprocess.run(
+        [sys.executable, str(script)],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": REPO_DIR},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
+    assert float(result.stdout) > 0
+
+
+def test_bootstrap_spread_matches_the_standard_error():
+    x = np.random.default_rng(1).normal(3, 2, size=400)
+    replicates = bootstrap(batch_mean, x, n_resamples=4000, max_workers=3)
+    assert len(replicates) == 4000
+    assert abs(replicates.mean() - x.mean()) < 0.01
+    standard_error = x.std() / np.sqrt(len(x))
+    assert abs(replicates.std() / standard_error - 1) < 0.05
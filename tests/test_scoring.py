@@ -0,0 +1,137 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+import numpy as np
+import pandas as pd
+import pytest
+import statsmodels.formula.api as smf
+from fitting import fit_formula
+from scoring import ScoringModel, ScoringService, make_server, save_model
+
+FORMULA = "rushing_yards ~ down + ydstogo + run_location"
+
+
+def runs(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    runs = pd.DataFrame(
+        {
+            "down": rng.choice([1, 2, 3, 4], n),
+            "ydstogo": rng.integers(1, 20, n).astype(float),
+            "run_location": rng.choice(["left", "middle", "right"], n),
+        }
+    )
+    runs["rushing_yards"] = 3 + runs["down"] - 1 + rng.normal(0, 1, n)
+    ## as in Chapter 4, down is text
+    runs["down"] = runs["down"].astype(str)
+    return runs
+
+
+@pytest.fixture(scope="module")
+def models_dir(tmp_path_factory):
+    rng = np.random.default_rng(0)
+    n = 500
+    models_dir = str(tmp_path_factory.mktemp("models"))
+    save_model(fit_formula(FORMULA, runs()), "expected_yards", models_dir)
+    return models_dir
+
+
+def play(**values):
+    return {"down": "1", "ydstogo": 10, "run_location": "left", **values}
+
+
+def test_numeric_levels_are_normalized(tmp_path):
+    data = runs()
+    data["down"] = pd.Categorical(data["down"].astype(float))
+    save_model(fit_formula(FORMULA, data), "numeric_down", str(tmp_path))
+    model = ScoringService(str(tmp_path)).model("numeric_down")
+    assert model.spec["categories"]["down"] == ["1", "2", "3", "4"]
+    for down in [2.0, np.float32(2), np.int64(2), "2"]:
+        assert model.score_play(play(down=down)) == model.score_play(play(down=2))
+    assert model.score_play(play(down=2)) != model.score_play(play(down=1))
+    batch = model.score(
+        {"down": [2.0, 1], "ydstogo": [10, 10], "run_location": ["left"] * 2}
+    )
+    np.testing.assert_allclose(
+        batch, [model.score_play(play(down=2)), model.score_play(play(down=1))]
+    )
+    ## the same predictions as statsmodels
+    fit = smf.ols(FORMULA, data).fit()
+    np.testing.assert_allclose(model.score(data), fit.fittedvalues)
+
+
+def test_text_levels_are_kept():
+    data = runs()
+    ## "01" and "1" are different text levels
+    data.loc[data.index[:100], "down"] = "01"
+    fit = fit_formula(FORMULA, data)
+    assert fit.spec["categories"]["down"] == ["01", "1", "2", "3", "4"]
+    np.testing.assert_allclose(
+        fit.fittedvalues, smf.ols(FORMULA, data).fit().fittedvalues
+    )
+    model = ScoringModel(fit.spec)
+    assert model.score_play(play(down="01")) != model.score_play(play(down="1"))
+    assert model.score_play(play(down=1)) == model.score_play(play(down="1"))
+
+
+@pytest.mark.parametrize("location", ["LEFT", "bogus"])
+def test_unknown_levels_raise(models_dir, location):
+    model = ScoringService(models_dir).model("expected_yards")
+    with pytest.raises(ValueError):
+        model.score_play(play(run_location=location))
+    with pytest.raises(ValueError):
+        model.score(pd.DataFrame([play(run_location=location)]))
+
+
+@pytest.mark.parametrize("name", ["../expected_yards", "a/b", "..", ""])
+def test_invalid_model_names(models_dir, name):
+    with pytest.raises(ValueError):
+        ScoringService(models_dir).model(name)
+
+
+@pytest.fixture(scope="module")
+def server_url(models_dir):
+    server = make_server(0, models_dir)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield "http://localhost:%d/" % server.server_address[1]
+    server.shutdown()
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=body, method="POST")
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as error:
+        return error.code, json.loads(error.read())
+
+
+def test_serve_predicts(server_url):
+    status, prediction = post(
+        server_url + "expected_yards", json.dumps(play()).encode()
+    )
+    assert status == 200
+    assert isinstance(prediction, float)
+    status, predictions = post(
+        server_url + "expected_yards", json.dumps([play(), play(down=2)]).encode()
+    )
+    assert status == 200
+    assert len(predictions) == 2
+
+
+@pytest.mark.parametrize(
+    "path, body",
+    [
+        ("expected_yards", b"{not json"),
+        ("..%2Fexpected_yards", json.dumps(play()).encode()),
+        ("x/../expected_yards", json.dumps(play()).encode()),
+        ("missing_model", json.dumps(play()).encode()),
+        ("expected_yards", json.dumps(play(run_location="bogus")).encode()),
+    ],
+)
+def test_serve_bad_requests(server_url, path, body):
+    status, response = post(server_url + path, body)
+    assert status == 400
+    assert "error" in response
+    ## the server keeps answering after a bad request
+    assert post(server_url + "expected_yards", json.dumps(play()).encode())[0] == 200
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from scipy.stats import poisson
+from simulate import simulate_totals, summarize_totals
+
+
+def test_simulate_totals_same_for_any_number_of_workers():
+    expected = [1.5, 0.5, 2.0, 1.0]
+    groups = ["a", "a", "b", "b"]
+    parlays = [[("a", 1.5), ("b", 2.5)]]
+    serial = simulate_totals(
+        expected, groups, n_sims=4000, parlays=parlays, max_workers=1
+    )
+    pooled = simulate_totals(
+        expected, groups, n_sims=4000, parlays=parlays, max_workers=3
+    )
+    pd.testing.assert_frame_equal(serial[0], pooled[0])
+    pd.testing.assert_series_equal(serial[1], pooled[1])
+    assert (serial[0].sum(axis=1) == 4000).all()
+
+
+def test_simulated_means_match_summed_expectations():
+    expected = [1.5, 0.5, 2.0, 1.0]
+    groups = ["a", "a", "b", "b"]
+    parlays = [[("a", 1.5), ("b", 2.5)]]
+    histogram, parlay_chances = simulate_totals(
+        expected, groups, n_sims=40000, parlays=parlays, max_workers=3
+    )
+    summary = summarize_totals(histogram)
+    ## each group's total is Poisson with the summed expectation
+    np.testing.assert_allclose(summary["mean"], [2.0, 3.0], atol=0.03)
+    np.testing.assert_allclose(summary["sd"], np.sqrt([2.0, 3.0]), atol=0.03)
+    ## and the groups are independent without game_variance
+    p_win = poisson.sf(1, 2.0) * poisson.sf(2, 3.0)
+    assert abs(parlay_chances[0] - p_win) < 0.01
+    ## a shared game factor keeps the means but widens the totals
+    histogram, _ = simulate_totals(
+        expected,
+        groups,
+        n_sims=40000,
+        games=["g1", "g2", "g1", "g2"],
+        game_variance=0.5,
+        max_workers=3,
+    )
+    summary = summarize_totals(histogram)
+    np.testing.assert_allclose(summary["mean"], [2.0, 3.0], atol=0.05)
+    assert (summary["sd"] > np.sqrt([2.0, 3.0]) + 0.1).all()
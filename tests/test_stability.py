@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+from stability import lag_name, lag_table, stability
+
+
+def player_seasons(seed=0):
+    rng = np.random.default_rng(seed)
+    rows = []
+    for player in range(30):
+        ## most players skip some seasons, so lags cross gaps
+        seasons = np.sort(rng.choice(np.arange(2010, 2020), 6, replace=False))
+        for season in seasons:
+            for length in ["long", "short"]:
+                rows.append((player, "P" + str(player), length, season))
+    table = pd.DataFrame(rows, columns=["player_id", "player", "length", "season"])
+    table["ypa"] = rng.normal(7, 2, len(table))
+    table["epa"] = table["ypa"] * 0.1 + rng.normal(0, 0.2, len(table))
+    table.loc[rng.choice(len(table), 20, replace=False), "epa"] = np.nan
+    return table.sample(frac=1, random_state=seed).reset_index(drop=True)
+
+
+def merge_lag(table, id_cols, metrics, lag):
+    ## the copy / season += lag / inner merge pattern of the chapters
+    lagged = table[id_cols + ["season"] + metrics].copy()
+    lagged["season"] += lag
+    lagged = lagged.rename(columns={m: lag_name(m, lag) for m in metrics})
+    return table.merge(lagged, how="inner", on=id_cols + ["season"])
+
+
+@pytest.mark.parametrize("lag", [1, 2, 3])
+def test_lag_table_matches_the_merge(lag):
+    table = player_seasons()
+    id_cols = ["player_id", "player", "length"]
+    metrics = ["ypa", "epa"]
+    lagged = lag_table(table, id_cols, metrics, lag)
+    expected = merge_lag(table, id_cols, metrics, lag)
+    pd.testing.assert_frame_equal(lagged, expected)
+
+
+def test_stability_matches_merge_correlations():
+    table = player_seasons(1)
+    id_cols = ["player_id", "player"]
+    metrics = ["ypa", "epa"]
+    max_lag = 3
+    result = stability(table, id_cols, metrics, max_lag=max_lag, by=["length"])
+    for lag in range(1, max_lag + 1):
+        merged = merge_lag(table, id_cols + ["length"], metrics, lag)
+        for length, group in merged.groupby("length"):
+            for metric in metrics:
+                expected = group[metric].corr(group[lag_name(metric, lag)])
+                assert result.loc[(length, lag), metric] == pytest.approx(expected)
+    ## without by, one row per lag
+    overall = stability(table, id_cols + ["length"], metrics, max_lag=max_lag)
+    assert list(overall.index) == [1, 2, 3]
+    merged = merge_lag(table, id_cols + ["length"], ["ypa"], 2)
+    assert overall.loc[2, "ypa"] == pytest.approx(
+        merged["ypa"].corr(merged["ypa_last2"])
+    )